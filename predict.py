@@ -4,7 +4,6 @@ import os, sys, json
 import numpy as np
 from typing import Dict, List, Tuple
 
-from .feature_extraction import extract_image_features
 from .abnormality import infer_abnormality
 
 
@@ -109,14 +108,22 @@ def _top_feature_contributors(z_sel: np.ndarray,
 import os, json
 import numpy as np
 from typing import Dict, List
-from .feature_extraction import extract_image_features
-from .abnormality import infer_abnormality
+from .feature_cache import FEATURE_CACHE, cached_extract
+from .feature_extraction import ExtractionOptions
+from .abnormality import REQUIRED_FEATURES, infer_abnormality
 
 
-def predict(model_path: str, image_path: str, tau_override: float | None = None) -> Dict:
+def predict(model_path: str, image_path: str, tau_override: float | None = None,
+            feature_cache: str | None = FEATURE_CACHE, explain: bool = True) -> Dict:
     """
     Predict class and infer abnormality for a new mammogram image using
     the EWOA Mahalanobis-ratio classifier trained via train_and_eval.py.
+    Features go through the content-addressed cache (None = always extract).
+    Only the feature groups the model's selected features need are computed, plus
+    those of abnormality.REQUIRED_FEATURES when explaining; "zscores" covers the
+    features that were computed (all of them on a cache hit). explain=False also
+    leaves out the abnormality fields (abnormality_type, abnormality_scores,
+    background_tissue, explanation.abnormality_summary, lesion_subtype).
     """
     # === Load model ===
     with open(model_path, "r") as f:
@@ -162,6 +169,13 @@ def predict(model_path: str, image_path: str, tau_override: float | None = None)
         else:
             Sp = np.diag((sig_B**2 + sig_M**2) / 2.0)
         Sp_inv = np.linalg.pinv(Sp)
+
+    # Scoring precision recorded at training time (older models: float64)
+    dtype = np.float32 if cfg.get("precision", "float64") == "float32" else float
+    if train_mu is not None:
+        train_mu = train_mu.astype(dtype)
+    train_sigma = train_sigma.astype(dtype)
+    mu_B, mu_M, Sp_inv = mu_B.astype(dtype), mu_M.astype(dtype), Sp_inv.astype(dtype)
     # --- END robust model parsing ---
 
     if tau_override is not None:
@@ -172,9 +186,11 @@ def predict(model_path: str, image_path: str, tau_override: float | None = None)
     if not os.path.isfile(image_path):
         raise FileNotFoundError(f"❌ Image not found: {image_path}")
 
-    # === Extract and normalize features ===
-    feats_raw = extract_image_features(image_path)
-    x_full = np.array([feats_raw.get(f, 0.0) for f in feature_names], dtype=float)
+    # === Extract and normalize features (with the model's extraction settings) ===
+    required = selected_names + [n for n in REQUIRED_FEATURES if explain and n not in selected_names]
+    feats_raw = cached_extract(image_path, feature_cache, ExtractionOptions.from_dict(cfg.get("extraction")),
+                               required=required)
+    x_full = np.array([feats_raw.get(f, 0.0) for f in feature_names], dtype=dtype)
     x_norm = (x_full - train_mu) / (train_sigma + 1e-6)
     x = x_norm[selected_idx]
 
@@ -194,10 +210,11 @@ def predict(model_path: str, image_path: str, tau_override: float | None = None)
 
     # === z-scores (for abnormality inference) ===
     zvec = (x_full - train_mu) / (train_sigma + 1e-6)
-    z = {name: float(zvec[i]) for i, name in enumerate(feature_names)}
+    z = {name: float(zvec[i]) for i, name in enumerate(feature_names) if name in feats_raw}
 
     # === Infer abnormality and tissue type ===
-    abn_label, abn_scores, abn_expl, background = infer_abnormality(z)
+    if explain:
+        abn_label, abn_scores, abn_expl, background = infer_abnormality(z)
 
     # === Compute top contributors (abs z-distance from μ_M or μ_B) ===
     mu_ref = mu_M if pred_class == 1 else mu_B
@@ -214,16 +231,20 @@ def predict(model_path: str, image_path: str, tau_override: float | None = None)
         "distance_to_malignant": float(dM),
         "tau": tau,
         "ratio_decision": f"Malignant if dM <= {tau:.3f} * dB else Benign",
-        "abnormality_type": abn_label,
-        "abnormality_scores": abn_scores if isinstance(abn_scores, dict) else {},
-        "background_tissue": background,
+        **({
+            "abnormality_type": abn_label,
+            "abnormality_scores": abn_scores if isinstance(abn_scores, dict) else {},
+            "background_tissue": background,
+        } if explain else {}),
         "explanation": {
             "class": [f"Mahalanobis ratio: dM <= {tau:.3f} * dB → {pred_label}"],
-            "abnormality_summary": str(abn_expl)
+            **({"abnormality_summary": str(abn_expl)} if explain else {}),
         },
         "zscores": z,
         "top_feature_contributors": top_features
     }
+    if not explain:
+        return result
 
     # Optional: structured lesion subtype parsing
     if "Mass" in abn_label or "Calcifications" in abn_label:
@@ -18,6 +18,19 @@ from .adaptive import (
 )
 from .obl import opposite, select_better
 
+# callback(t, best_fit, history) runs after every iteration; a truthy return stops the run early
+IterCallback = Callable[[int, float, RunHistory], Any]
+
+
+def _initial_population(pop_size: int, dim: int, bounds, init_population: Optional[np.ndarray]) -> np.ndarray:
+    # random population; `init_population` rows (e.g. warm-start elites) replace the first whales.
+    # The random draw happens either way, so the RNG stream does not depend on seeding.
+    population = initialize_population(pop_size, dim, bounds)
+    if init_population is not None and len(init_population) > 0:
+        seeds = np.asarray(init_population, dtype=float).reshape(-1, dim)[:pop_size]
+        population[:seeds.shape[0]] = ensure_bounds(seeds, bounds[0], bounds[1])
+    return population
+
 
 def _compute_a(strategy: str, t: int, T: int, diversity: float, diversity_aware: bool, adaptive_a: bool) -> float:
     if not adaptive_a:
@@ -48,19 +61,21 @@ def run_woa(
     pop_size: int = 30,
     iters: int = 100,
     seed: Optional[int] = None,
+    callback: Optional[IterCallback] = None,
+    init_population: Optional[np.ndarray] = None,
 ) -> Tuple[np.ndarray, float, RunHistory]:
     if seed is not None:
         np.random.seed(seed)
 
-    population = initialize_population(pop_size, dim, bounds)
+    history = RunHistory()
+    population = _initial_population(pop_size, dim, bounds, init_population)
     fitness = evaluate_population(population, objective)
+    history.nfe += pop_size
 
     best_idx = int(np.argmin(fitness))
     best_pos = population[best_idx].copy()
     best_fit = float(fitness[best_idx])
 
-    history = RunHistory()
-
     for t in range(1, iters + 1):
         start = time.time()
         a = a_linear(t, iters)
@@ -104,6 +119,7 @@ def run_woa(
         population = new_population
 
         fitness = evaluate_population(population, objective)
+        history.nfe += pop_size
         current_best_idx = int(np.argmin(fitness))
         current_best_fit = float(fitness[current_best_idx])
         if current_best_fit < best_fit:
@@ -114,6 +130,8 @@ def run_woa(
         history.times_ms_per_iter.append((time.time() - start) * 1000.0)
         # Track population diversity for summaries
         history.diversity_per_iter.append(float(population_diversity(population)))
+        if callback is not None and callback(t, best_fit, history):
+            break
 
     return best_pos, best_fit, history
 
@@ -131,25 +149,28 @@ def run_ewoa(
     obl_freq: int = 1,
     obl_rate: float = 1.0,
     seed: Optional[int] = None,
+    callback: Optional[IterCallback] = None,
+    init_population: Optional[np.ndarray] = None,
 ) -> Tuple[np.ndarray, float, RunHistory]:
     if seed is not None:
         np.random.seed(seed)
 
-    population = initialize_population(pop_size, dim, bounds)
+    history = RunHistory()
+    population = _initial_population(pop_size, dim, bounds, init_population)
     fitness = evaluate_population(population, objective)
+    history.nfe += pop_size
 
     if use_obl:
         population_opp = opposite(population, bounds)
         population_opp = ensure_bounds(population_opp, bounds[0], bounds[1])
         fitness_opp = evaluate_population(population_opp, objective)
+        history.nfe += pop_size
         population, fitness = select_better(population, population_opp, fitness, fitness_opp)
 
     best_idx = int(np.argmin(fitness))
     best_pos = population[best_idx].copy()
     best_fit = float(fitness[best_idx])
 
-    history = RunHistory()
-
     for t in range(1, iters + 1):
         start = time.time()
         div = population_diversity(population)
@@ -200,11 +221,13 @@ def run_ewoa(
             opp = ensure_bounds(opp, bounds[0], bounds[1])
             fit_new_sel = evaluate_population(new_population[idx], objective)
             fit_opp_sel = evaluate_population(opp, objective)
+            history.nfe += 2 * count
             # selective replacement
             mask = fit_opp_sel < fit_new_sel
             new_population[idx[mask]] = opp[mask]
 
         fit_new = evaluate_population(new_population, objective)
+        history.nfe += pop_size
         population = new_population
         fitness = fit_new
 
@@ -217,6 +240,8 @@ def run_ewoa(
         history.best_fitness_per_iter.append(best_fit)
         history.times_ms_per_iter.append((time.time() - start) * 1000.0)
         history.diversity_per_iter.append(float(population_diversity(population)))
+        if callback is not None and callback(t, best_fit, history):
+            break
 
     return best_pos, best_fit, history
 
@@ -0,0 +1,147 @@
+"""
+Persistent archive of evaluated feature subsets (SQLite).
+
+Full CV evaluations (binarized mask, fitness, class errors, fold τ) are stored
+under a context fingerprint: a hash of the processed data, the fold plan and
+the objective configuration, i.e. everything a subset's fitness depends on.
+Within one context a stored result is exact, so later runs reuse it instead
+of re-evaluating the subset.
+
+Each context also records a `family` hash (the same objective without the
+data) and its feature names. Elites of family contexts whose features are a
+prefix of the current ones (new features were appended) can still seed a
+population: their masks are zero-padded to the new width.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contexts (
+    context       TEXT PRIMARY KEY,
+    family        TEXT NOT NULL,
+    feature_names TEXT NOT NULL,
+    created       REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS evaluations (
+    context   TEXT NOT NULL,
+    mask      TEXT NOT NULL,
+    fitness   REAL NOT NULL,
+    err_b     REAL,
+    err_m     REAL,
+    fold_taus TEXT NOT NULL,
+    PRIMARY KEY (context, mask)
+);
+CREATE INDEX IF NOT EXISTS evaluations_by_fitness ON evaluations (context, fitness);
+"""
+
+# (fitness, fold_taus, errB, errM) of one subset
+Evaluation = Tuple[float, List[float], Optional[float], Optional[float]]
+
+
+def fingerprint(*parts) -> str:
+    """Stable hash of arrays and JSON-serializable values."""
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            a = np.ascontiguousarray(part)
+            h.update(f"{a.dtype.str}{a.shape}".encode())
+            h.update(a.tobytes())
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=float).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _bits(subset: Sequence[int], dim: int) -> str:
+    mask = ["0"] * dim
+    for i in subset:
+        mask[int(i)] = "1"
+    return "".join(mask)
+
+
+def _subset(bits: str) -> Tuple[int, ...]:
+    return tuple(i for i, b in enumerate(bits) if b == "1")
+
+
+class SubsetArchive:
+    """
+    Evaluations of one context. Subsets are tuples of feature columns; they are
+    stored as binarized masks over the context's features. add() only buffers,
+    flush() (or close()) writes the buffer in one transaction.
+    """
+
+    def __init__(self, path: str, context: str, family: str, feature_names: Sequence[str]):
+        self.path = path
+        self.context = context
+        self.family = family
+        self.feature_names = list(feature_names)
+        self.dim = len(self.feature_names)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        with self._db:
+            self._db.execute("INSERT OR IGNORE INTO contexts VALUES (?, ?, ?, ?)",
+                             (context, family, json.dumps(self.feature_names), time.time()))
+        self._pending: List[tuple] = []
+
+    def known(self) -> Dict[Tuple[int, ...], Evaluation]:
+        """Every stored evaluation of this context, by subset."""
+        rows = self._db.execute(
+            "SELECT mask, fitness, fold_taus, err_b, err_m FROM evaluations WHERE context = ?", (self.context,)
+        )
+        return {_subset(mask): (fitness, json.loads(taus), err_b, err_m) for mask, fitness, taus, err_b, err_m in rows}
+
+    def add(self, subset: Sequence[int], fitness: float, fold_taus: Sequence[float],
+            errB: Optional[float], errM: Optional[float]) -> None:
+        self._pending.append((self.context, _bits(subset, self.dim), float(fitness),
+                              errB, errM, json.dumps([float(t) for t in fold_taus])))
+
+    def flush(self) -> int:
+        """Write buffered evaluations; returns how many were written."""
+        pending, self._pending = self._pending, []
+        if pending:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?, ?, ?)", pending)
+        return len(pending)
+
+    def _seed_contexts(self) -> List[str]:
+        # this context first, then the newest family contexts with a feature-name prefix of ours
+        out = [self.context]
+        rows = self._db.execute(
+            "SELECT context, feature_names FROM contexts WHERE family = ? AND context != ? ORDER BY created DESC",
+            (self.family, self.context),
+        )
+        for context, names in rows:
+            names = json.loads(names)
+            if len(names) <= self.dim and names == self.feature_names[:len(names)]:
+                out.append(context)
+        return out
+
+    def elites(self, n: int) -> np.ndarray:
+        """(<= n, dim) 0/1 masks of the best distinct stored subsets, older contexts zero-padded."""
+        masks: List[str] = []
+        for context in self._seed_contexts():
+            rows = self._db.execute(
+                "SELECT mask FROM evaluations WHERE context = ? ORDER BY fitness LIMIT ?", (context, int(n))
+            )
+            for (mask,) in rows:
+                mask = mask.ljust(self.dim, "0")
+                if mask not in masks:
+                    masks.append(mask)
+                if len(masks) >= n:
+                    break
+            if len(masks) >= n:
+                break
+        return np.array([[b == "1" for b in m] for m in masks], dtype=float).reshape(-1, self.dim)
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
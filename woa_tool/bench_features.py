@@ -0,0 +1,407 @@
+"""
+Feature-extraction benchmarks.
+
+    python -m woa_tool.bench_features decode IMAGE [IMAGE ...] [--max-side 1024] [--repeat 3]
+                                             [--features] [--json out.json]
+    python -m woa_tool.bench_features roi IMAGE [IMAGE ...] [--margin 32] [--decode exact]
+                                          [--repeat 1] [--json out.json]
+    python -m woa_tool.bench_features groups [IMAGE ...] [--synthetic N] [--sizes 512 1024]
+                                             [--repeat 3] [--isolated] [--json out.json]
+                                             [--baseline base.json] [--tolerance 0.2]
+
+decode: per image, the wall time (median of `repeat` loads) and peak traced
+memory (tracemalloc: numpy and Python allocations) of the exact load path (full
+decode + anti-aliased resize) and the fast one (reduced decode + block mean +
+final resize), and whether both give the same shape (exit status 1 if not).
+With --features, also how far the extracted features of the two modes are apart.
+
+roi: per image, the pixels the feature filters process over the whole frame and
+over the ROI crop, the extraction time of both (median of `repeat`), and how
+far the features of the two are apart (float rounding only, when it works).
+
+groups: where extract_image_features spends its time. For every working
+resolution (the load's downscale_max) the stages load, clahe, roi (Otsu mask +
+optional crop) and every FEATURE_GROUPS entry are timed over the corpus (real
+images and/or synthetic mammogram-like ones), as median / p95 latency and
+peak traced memory per stage. Groups run in output order on one context, so a
+shared intermediate (Sobel, structure tensors, Otsu region, Haralick) is
+charged to the first group that uses it; --isolated gives every group a fresh
+context instead (what a lazy extraction of that group alone costs). With
+--baseline, medians are compared with an earlier --json run and stages that got
+slower than --tolerance are reported (exit status 1).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+from scipy import ndimage as ndi
+
+from .feature_cache import extractor_version
+from .feature_extraction import (
+    DECODE_MODES, FEATURE_GROUPS, TEXTURE_MODES, ExtractionOptions, ImageContext, equalize, extract_image_features,
+    load_grayscale,
+)
+
+MODES = {"exact": ExtractionOptions(decode="exact"), "fast": ExtractionOptions(decode="fast")}
+
+
+def _measure(fn: Callable[[], np.ndarray], repeat: int) -> Dict:
+    times = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+        del out
+    tracemalloc.start()
+    try:
+        out = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": float(np.median(times)), "peak_mb": peak / 2**20, "shape": list(out.shape)}
+
+
+def _drift(a: Dict[str, float], b: Dict[str, float]) -> Dict:
+    rel = {k: abs(b[k] - a[k]) / (abs(a[k]) + 1e-9) for k in a}
+    worst = max(rel, key=rel.get)
+    return {"median_rel_diff": float(np.median(list(rel.values()))), "max_rel_diff": float(rel[worst]),
+            "max_rel_diff_feature": worst}
+
+
+def bench_decode(paths: Sequence[str], max_side: int = 1024, repeat: int = 3, features: bool = False) -> Dict:
+    """Exact vs fast load of every image; returns {"images": [...], "summary": {...}}."""
+    images: List[Dict] = []
+    for path in paths:
+        row = {"path": str(path)}
+        for mode, options in MODES.items():
+            row[mode] = _measure(lambda: load_grayscale(path, options, max_side), repeat)
+        row["speedup"] = row["exact"]["seconds"] / max(row["fast"]["seconds"], 1e-9)
+        row["shape_match"] = row["exact"]["shape"] == row["fast"]["shape"]
+        row["peak_mb_saved"] = row["exact"]["peak_mb"] - row["fast"]["peak_mb"]
+        if features:
+            row["features"] = _drift(extract_image_features(path, MODES["exact"]),
+                                     extract_image_features(path, MODES["fast"]))
+        images.append(row)
+
+    summary = {
+        "images": len(images),
+        "max_side": int(max_side),
+        "exact_median_s": float(np.median([r["exact"]["seconds"] for r in images])),
+        "fast_median_s": float(np.median([r["fast"]["seconds"] for r in images])),
+        "exact_median_peak_mb": float(np.median([r["exact"]["peak_mb"] for r in images])),
+        "fast_median_peak_mb": float(np.median([r["fast"]["peak_mb"] for r in images])),
+        "shape_mismatches": [r["path"] for r in images if not r["shape_match"]],
+    }
+    summary["speedup"] = summary["exact_median_s"] / max(summary["fast_median_s"], 1e-9)
+    return {"images": images, "summary": summary}
+
+
+def _print_decode(result: Dict) -> None:
+    for r in result["images"]:
+        line = (f"{r['path']}: exact {r['exact']['seconds'] * 1e3:.1f} ms / {r['exact']['peak_mb']:.1f} MB "
+                f"{tuple(r['exact']['shape'])} | fast {r['fast']['seconds'] * 1e3:.1f} ms / "
+                f"{r['fast']['peak_mb']:.1f} MB {tuple(r['fast']['shape'])} | x{r['speedup']:.1f}")
+        if not r["shape_match"]:
+            line += " | ⚠️ shapes differ"
+        if "features" in r:
+            f = r["features"]
+            line += f" | features: median rel diff {f['median_rel_diff']:.3g}, max {f['max_rel_diff']:.3g} ({f['max_rel_diff_feature']})"
+        print(line)
+    s = result["summary"]
+    print(f"median over {s['images']} image(s): exact {s['exact_median_s'] * 1e3:.1f} ms / {s['exact_median_peak_mb']:.1f} MB, "
+          f"fast {s['fast_median_s'] * 1e3:.1f} ms / {s['fast_median_peak_mb']:.1f} MB (x{s['speedup']:.1f})")
+    if s["shape_mismatches"]:
+        print(f"❌ fast and exact loads differ in shape for {len(s['shape_mismatches'])} image(s)")
+
+
+def _time_extract(path: str, options: ExtractionOptions, repeat: int) -> Tuple[float, Dict[str, float]]:
+    times, feats = [], None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        feats = extract_image_features(path, options)
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times)), feats
+
+
+def bench_roi(paths: Sequence[str], margin: int = 32, decode: str = "exact", repeat: int = 1) -> Dict:
+    """Whole frame vs ROI crop per image; returns {"images": [...], "summary": {...}}."""
+    frame = ExtractionOptions(decode=decode)
+    crop = ExtractionOptions(decode=decode, roi_crop=True, roi_margin=margin)
+    images: List[Dict] = []
+    for path in paths:
+        ctx = ImageContext.from_path(path, crop)
+        frame_s, frame_feats = _time_extract(path, frame, repeat)
+        crop_s, crop_feats = _time_extract(path, crop, repeat)
+        images.append({
+            "path": str(path),
+            "frame_shape": list(ctx.full.shape),
+            "crop_shape": list(ctx.img.shape),
+            "frame_pixels": ctx.n_pixels,
+            "crop_pixels": int(ctx.img.size),
+            "pixel_fraction": ctx.img.size / ctx.n_pixels,
+            "frame_s": frame_s,
+            "crop_s": crop_s,
+            "speedup": frame_s / max(crop_s, 1e-9),
+            "features": _drift(frame_feats, crop_feats),
+        })
+
+    summary = {
+        "images": len(images),
+        "margin": int(margin),
+        "decode": decode,
+        "frame_pixels": int(sum(r["frame_pixels"] for r in images)),
+        "crop_pixels": int(sum(r["crop_pixels"] for r in images)),
+        "frame_median_s": float(np.median([r["frame_s"] for r in images])),
+        "crop_median_s": float(np.median([r["crop_s"] for r in images])),
+        "max_rel_diff": float(max(r["features"]["max_rel_diff"] for r in images)),
+    }
+    summary["pixel_fraction"] = summary["crop_pixels"] / max(summary["frame_pixels"], 1)
+    summary["speedup"] = summary["frame_median_s"] / max(summary["crop_median_s"], 1e-9)
+    return {"images": images, "summary": summary}
+
+
+def _print_roi(result: Dict) -> None:
+    for r in result["images"]:
+        f = r["features"]
+        print(f"{r['path']}: {tuple(r['frame_shape'])} -> {tuple(r['crop_shape'])}, "
+              f"{r['pixel_fraction'] * 100:.0f}% of the pixels | frame {r['frame_s'] * 1e3:.0f} ms, "
+              f"crop {r['crop_s'] * 1e3:.0f} ms (x{r['speedup']:.2f}) | "
+              f"max rel diff {f['max_rel_diff']:.3g} ({f['max_rel_diff_feature']})")
+    s = result["summary"]
+    print(f"{s['images']} image(s): filters see {s['pixel_fraction'] * 100:.0f}% of the pixels "
+          f"({s['crop_pixels']:,} of {s['frame_pixels']:,}); median {s['frame_median_s'] * 1e3:.0f} ms -> "
+          f"{s['crop_median_s'] * 1e3:.0f} ms (x{s['speedup']:.2f}); max rel feature diff {s['max_rel_diff']:.3g}")
+
+
+STAGES = ("load", "clahe", "roi")   # before the feature groups
+
+
+def synthetic_mammogram(shape: Tuple[int, int], rng: np.random.Generator) -> np.ndarray:
+    """
+    uint8 mammogram-like image: a textured half-ellipse (the breast) against the
+    left edge of a dark, noisy background, with a few bright calcification-like
+    spots. Enough structure for every feature group to do real work.
+    """
+    h, w = shape
+    yy, xx = np.ogrid[:h, :w]
+    reach = rng.uniform(0.45, 0.8) * w
+    breast = (xx / reach) ** 2 + ((yy - h / 2) / (0.42 * h)) ** 2 < 1
+    tex = ndi.gaussian_filter(rng.normal(size=(h // 4 + 1, w // 4 + 1)), 3)
+    tex = np.repeat(np.repeat(tex / tex.std(), 4, axis=0), 4, axis=1)[:h, :w]
+    img = np.where(breast, 0.55 + 0.08 * tex + 0.2 * (1 - xx / reach), 0.02) + rng.normal(0, 0.01, (h, w))
+    s = max(2, min(h, w) // 500)
+    for _ in range(40):
+        y, x = int(rng.uniform(0.3, 0.7) * h), int(rng.uniform(0.05, 0.75) * reach)
+        img[y - s:y + s, x - s:x + s] += 0.3
+    return (np.clip(img, 0, 1) * 255).astype(np.uint8)
+
+
+def _stage_run(path: str, options: ExtractionOptions, size: int, isolated: bool,
+               trace: bool) -> Dict[str, Tuple[float, Optional[float]]]:
+    """{stage: (seconds, peak traced MB or None)} of one extraction of `path`, in pipeline order."""
+    out: Dict[str, Tuple[float, Optional[float]]] = {}
+
+    def stage(name, fn):
+        if trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        value = fn()
+        seconds = time.perf_counter() - t0
+        out[name] = (seconds, (tracemalloc.get_traced_memory()[1] - base) / 2**20 if trace else None)
+        return value
+
+    img = stage("load", lambda: load_grayscale(path, options, size))
+    img = stage("clahe", lambda: equalize(img))
+    ctx = stage("roi", lambda: ImageContext.from_equalized(img, options))
+    for name in FEATURE_GROUPS:
+        if isolated:
+            ctx = ImageContext.from_equalized(img, options)
+        stage(name, lambda: ctx.group(name))
+    return out
+
+
+def _summary(seconds: List[float], peaks: List[float]) -> Dict:
+    ms = np.asarray(seconds) * 1e3
+    return {"median_ms": float(np.median(ms)), "p95_ms": float(np.percentile(ms, 95)),
+            "peak_mb": float(max(peaks)) if peaks else None, "samples": int(ms.size)}
+
+
+def bench_groups(paths: Sequence[str], sizes: Sequence[int] = (512, 1024), repeat: int = 3,
+                 options: Optional[ExtractionOptions] = None, isolated: bool = False,
+                 corpus: Optional[Dict] = None) -> Dict:
+    """
+    Per working resolution, median / p95 latency (over images x repeats) and peak
+    traced memory (max over images, one traced run each) of every stage.
+    Returns {"config": {...}, "sizes": {size: {stage: {...}}}}.
+    """
+    options = options or ExtractionOptions()
+    stages = STAGES + tuple(FEATURE_GROUPS)
+    results = {}
+    for size in sizes:
+        seconds = {s: [] for s in stages + ("total",)}
+        peaks = {s: [] for s in stages}
+        for path in paths:
+            for _ in range(max(1, repeat)):
+                run = _stage_run(path, options, size, isolated, trace=False)
+                for s, (sec, _) in run.items():
+                    seconds[s].append(sec)
+                seconds["total"].append(sum(sec for sec, _ in run.values()))
+            tracemalloc.start()
+            try:
+                for s, (_, peak) in _stage_run(path, options, size, isolated, trace=True).items():
+                    peaks[s].append(peak)
+            finally:
+                tracemalloc.stop()
+        table = {s: _summary(seconds[s], peaks.get(s, [])) for s in stages + ("total",)}
+        total = table["total"]["median_ms"]
+        for s in stages:
+            table[s]["share"] = table[s]["median_ms"] / total if total else 0.0
+        results[str(size)] = table
+
+    config = {
+        "sizes": [int(s) for s in sizes],
+        "repeat": int(repeat),
+        "isolated": bool(isolated),
+        "options": options.to_dict(),
+        "extractor": extractor_version(options),
+        "corpus": corpus or {"images": [str(p) for p in paths]},
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return {"config": config, "sizes": results}
+
+
+def compare_groups(result: Dict, baseline: Dict, tolerance: float = 0.2, min_ms: float = 1.0) -> List[Dict]:
+    """
+    Median latency of every (size, stage) in both runs. A stage regressed if it
+    is more than `tolerance` (relative) and `min_ms` (absolute) slower.
+    """
+    rows = []
+    for size, table in result["sizes"].items():
+        base_table = baseline.get("sizes", {}).get(size, {})
+        for stage, row in table.items():
+            if stage not in base_table:
+                continue
+            base_ms, new_ms = base_table[stage]["median_ms"], row["median_ms"]
+            ratio = new_ms / base_ms if base_ms else float("inf")
+            rows.append({"size": size, "stage": stage, "baseline_ms": base_ms, "median_ms": new_ms,
+                         "ratio": ratio, "regression": ratio > 1 + tolerance and new_ms - base_ms > min_ms})
+    return rows
+
+
+def _print_groups(result: Dict) -> None:
+    for size, table in result["sizes"].items():
+        print(f"max side {size}:")
+        print(f"  {'stage':<18}{'median ms':>10}{'p95 ms':>10}{'peak MB':>10}{'share':>8}")
+        for stage, row in table.items():
+            share = f"{row['share'] * 100:.0f}%" if "share" in row else ""
+            peak = f"{row['peak_mb']:.1f}" if row["peak_mb"] is not None else ""
+            print(f"  {stage:<18}{row['median_ms']:>10.1f}{row['p95_ms']:>10.1f}{peak:>10}{share:>8}")
+
+
+def _print_compare(rows: List[Dict], same_setup: bool) -> None:
+    if not same_setup:
+        print("ℹ️ Baseline was taken with a different extractor version, options or --isolated setting.")
+    for r in rows:
+        flag = "  ⚠️ slower" if r["regression"] else ""
+        print(f"  {r['size']:>5} {r['stage']:<18}{r['baseline_ms']:>10.1f} ->{r['median_ms']:>9.1f} ms "
+              f"(x{r['ratio']:.2f}){flag}")
+    n = sum(r["regression"] for r in rows)
+    print(f"❌ {n} stage(s) slower than the baseline" if n else "✅ No stage slower than the baseline")
+
+
+def _synthetic_corpus(directory: str, n: int, side: int, seed: int) -> List[str]:
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(n):
+        path = os.path.join(directory, f"synthetic_{i}.png")
+        Image.fromarray(synthetic_mammogram((side, side * 3 // 4), rng)).save(path)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="woa_tool.bench_features", description="Feature-extraction benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    dec = sub.add_parser("decode", help="Exact vs fast image load: time and peak memory per image")
+    dec.add_argument("images", nargs="+", help="Image files")
+    dec.add_argument("--max-side", type=int, default=1024, help="downscale_max of the load")
+    dec.add_argument("--repeat", type=int, default=3, help="Timed loads per image and mode (median reported)")
+    dec.add_argument("--features", action="store_true", help="Also compare the extracted features of both modes")
+    dec.add_argument("--json", default=None, help="Write the results as JSON")
+    roi = sub.add_parser("roi", help="Whole frame vs ROI crop: pixels processed, time and feature drift per image")
+    roi.add_argument("images", nargs="+", help="Image files")
+    roi.add_argument("--margin", type=int, default=ExtractionOptions.roi_margin, help="roi_margin of the crop")
+    roi.add_argument("--decode", choices=DECODE_MODES, default="exact", help="Decode mode of both runs")
+    roi.add_argument("--repeat", type=int, default=1, help="Timed extractions per image and mode (median reported)")
+    roi.add_argument("--json", default=None, help="Write the results as JSON")
+    grp = sub.add_parser("groups", help="Latency and peak memory of load, CLAHE, ROI and every feature group")
+    grp.add_argument("images", nargs="*", help="Image files (real corpus)")
+    grp.add_argument("--synthetic", type=int, default=0, help="Also generate this many synthetic mammograms")
+    grp.add_argument("--synthetic-side", type=int, default=3000, help="Long side of the synthetic images")
+    grp.add_argument("--seed", type=int, default=0, help="Seed of the synthetic images")
+    grp.add_argument("--sizes", type=int, nargs="+", default=[512, 1024],
+                     help="Working resolutions (downscale_max of the load)")
+    grp.add_argument("--repeat", type=int, default=3, help="Timed runs per image and size")
+    grp.add_argument("--isolated", action="store_true", help="Fresh context per group (intermediates not shared)")
+    grp.add_argument("--decode", choices=DECODE_MODES, default="exact")
+    grp.add_argument("--roi-crop", action="store_true")
+    grp.add_argument("--texture", choices=TEXTURE_MODES, default="exact")
+    grp.add_argument("--glcm-levels", type=int, default=ExtractionOptions.glcm_levels)
+    grp.add_argument("--json", default=None, help="Write the results as JSON (usable as a later --baseline)")
+    grp.add_argument("--baseline", default=None, help="Earlier --json result to compare the medians with")
+    grp.add_argument("--tolerance", type=float, default=0.2, help="Relative slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    status = 0
+    if args.command == "decode":
+        result = bench_decode(args.images, args.max_side, args.repeat, args.features)
+        _print_decode(result)
+        status = 1 if result["summary"]["shape_mismatches"] else 0
+    elif args.command == "roi":
+        result = bench_roi(args.images, args.margin, args.decode, args.repeat)
+        _print_roi(result)
+    elif args.command == "groups":
+        if not args.images and not args.synthetic:
+            parser.error("groups: pass image files and/or --synthetic N")
+        options = ExtractionOptions(decode=args.decode, roi_crop=args.roi_crop, texture=args.texture,
+                                    glcm_levels=args.glcm_levels)
+        with tempfile.TemporaryDirectory() as tmp:
+            synthetic = _synthetic_corpus(tmp, args.synthetic, args.synthetic_side, args.seed)
+            corpus = {"images": list(args.images),
+                      "synthetic": {"n": args.synthetic, "side": args.synthetic_side, "seed": args.seed}}
+            result = bench_groups(list(args.images) + synthetic, args.sizes, args.repeat, options,
+                                  args.isolated, corpus)
+        _print_groups(result)
+        if args.baseline:
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+            rows = compare_groups(result, baseline, args.tolerance)
+            base_config = baseline.get("config", {})
+            _print_compare(rows, all(base_config.get(k) == result["config"][k] for k in ("extractor", "isolated")))
+            result["compare"] = {"baseline": args.baseline, "tolerance": args.tolerance, "rows": rows}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"✅ Saved {args.json}")
+    if args.command == "groups" and args.baseline and any(r["regression"] for r in result["compare"]["rows"]):
+        return 1
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,141 @@
+"""
+Bootstrap confidence intervals for test-set operating points.
+
+Replicates are a (B, n) matrix of resampled test positions (stratified by
+class by default, so every replicate keeps the observed class counts). They
+are reduced to per-row multiplicities W (B, n), and with the (n, T) decision
+matrix of every τ at once (dM <= τ·dB, distances computed once) the replicate
+confusion counts are matrix products:
+
+    TP = W[:, pos] @ pred[pos]        TN = W[:, neg] @ ~pred[neg]
+
+so spec / sens / balanced accuracy for all B replicates and T τ come out of a
+few BLAS calls, with no Python loop over replicates.
+
+The test-picked (constrained) τ is itself chosen on the test set, so its
+interval re-runs the pick inside every replicate (`constrained_pick`, the
+vectorized form of the test evaluation's rule) instead of fixing τ.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple
+
+
+def resample_indices(y: np.ndarray, n_boot: int, seed: Optional[int] = None, stratified: bool = True) -> np.ndarray:
+    """(n_boot, n) positions into y drawn with replacement (within each class if stratified)."""
+    y = np.asarray(y)
+    rng = np.random.default_rng(seed)
+    n = y.shape[0]
+    if not stratified:
+        return rng.integers(0, n, size=(int(n_boot), n))
+    idx = np.empty((int(n_boot), n), dtype=np.int64)
+    start = 0
+    for c in np.unique(y):
+        rows = np.flatnonzero(y == c)
+        idx[:, start:start + rows.size] = rows[rng.integers(0, rows.size, size=(int(n_boot), rows.size))]
+        start += rows.size
+    return idx
+
+
+def multiplicities(idx: np.ndarray, n: int) -> np.ndarray:
+    """(B, n) count of each position in each replicate row of idx."""
+    B = idx.shape[0]
+    flat = (idx + n * np.arange(B)[:, None]).ravel()
+    return np.bincount(flat, minlength=B * n).reshape(B, n).astype(np.float64)
+
+
+def replicate_counts(pred: np.ndarray, y: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    Confusion counts (tn, fp, fn, tp), each (B, T), for decisions pred (n, T)
+    (True = Malignant) under replicate weights (B, n).
+    """
+    pos = np.asarray(y) == 1
+    P = pred.astype(np.float64)
+    tp = weights[:, pos] @ P[pos]
+    fp = weights[:, ~pos] @ P[~pos]
+    n_pos = weights[:, pos].sum(axis=1, keepdims=True)
+    n_neg = weights[:, ~pos].sum(axis=1, keepdims=True)
+    return n_neg - fp, fp, n_pos - tp, tp
+
+
+def rates(tn, fp, fn, tp) -> Dict[str, np.ndarray]:
+    """Spec / sens / balanced accuracy / accuracy from counts (same 1e-9 guards as the test evaluation)."""
+    spec = tn / (tn + fp + 1e-9)
+    sens = tp / (tp + fn + 1e-9)
+    return {
+        "specificity": spec,
+        "sensitivity": sens,
+        "balanced_accuracy": 0.5 * (spec + sens),
+        "accuracy": (tp + tn) / (tn + fp + fn + tp + 1e-9),
+    }
+
+
+def constrained_pick(spec: np.ndarray, sens: np.ndarray, spec_floor: float) -> np.ndarray:
+    """
+    Row-wise index of the constraint-picked τ: among columns with spec >= floor
+    the highest sens (then spec, ties to the later τ); with none feasible the
+    spec closest to the floor (ties to the earlier τ). spec, sens: (B, T).
+    """
+    T = spec.shape[1]
+    # lexicographic (sens, spec): the pair's rank in the sorted unique pairs
+    pairs = np.stack([sens.ravel(), spec.ravel()], axis=1)
+    _, rank = np.unique(pairs, axis=0, return_inverse=True)
+    key = np.where(spec >= spec_floor, rank.reshape(spec.shape), -1)
+    best = T - 1 - np.argmax(key[:, ::-1], axis=1)
+    none = ~np.any(spec >= spec_floor, axis=1)
+    if np.any(none):
+        best[none] = np.argmin(np.abs(spec[none] - spec_floor), axis=1)
+    return best
+
+
+def percentile_ci(samples: np.ndarray, level: float = 0.95) -> Tuple[np.ndarray, np.ndarray]:
+    """Percentile interval over replicates (axis 0)."""
+    alpha = 0.5 * (1.0 - level)
+    low, high = np.quantile(samples, [alpha, 1.0 - alpha], axis=0)
+    return low, high
+
+
+def operating_point_cis(dB: np.ndarray, dM: np.ndarray, y: np.ndarray, taus: Sequence[float],
+                        n_boot: int = 2000, level: float = 0.95, seed: Optional[int] = None,
+                        stratified: bool = True, pick_grid: Optional[Sequence[float]] = None,
+                        spec_floor: Optional[float] = None) -> Dict:
+    """
+    Bootstrap intervals for fixed operating points `taus` (and, with pick_grid /
+    spec_floor, for the constraint-picked τ re-picked per replicate).
+
+    Returns {"taus", "n_boot", "level",
+             "<metric>": {"low": (T,), "high": (T,)} for each rate,
+             "pairs": {(i, j): {"balanced_accuracy_diff": (low, high), "p_better": float}}  # τ_i vs τ_j, same replicates
+             "picked": {"tau": (low, high), "<metric>": (low, high)}}                       # if pick_grid given
+    """
+    y = np.asarray(y)
+    taus = np.asarray(taus, dtype=float)
+    weights = multiplicities(resample_indices(y, n_boot, seed, stratified), y.shape[0])
+
+    boot = rates(*replicate_counts(dM[:, None] <= taus[None, :] * dB[:, None], y, weights))
+    out = {"taus": taus.tolist(), "n_boot": int(n_boot), "level": float(level)}
+    for name, samples in boot.items():
+        low, high = percentile_ci(samples, level)
+        out[name] = {"low": low, "high": high}
+
+    # paired: every τ pair is compared on the same replicates
+    out["pairs"] = {}
+    for i in range(taus.size):
+        for j in range(i + 1, taus.size):
+            diff = boot["balanced_accuracy"][:, i] - boot["balanced_accuracy"][:, j]
+            low, high = percentile_ci(diff, level)
+            out["pairs"][(i, j)] = {"balanced_accuracy_diff": (float(low), float(high)),
+                                    "p_better": float(np.mean(diff > 0))}
+
+    if pick_grid is not None and spec_floor is not None:
+        grid = np.asarray(pick_grid, dtype=float)
+        grid_rates = rates(*replicate_counts(dM[:, None] <= grid[None, :] * dB[:, None], y, weights))
+        best = constrained_pick(grid_rates["specificity"], grid_rates["sensitivity"], spec_floor)
+        rows = np.arange(best.size)
+        picked = {"tau": tuple(float(v) for v in percentile_ci(grid[best], level))}
+        for name, samples in grid_rates.items():
+            picked[name] = tuple(float(v) for v in percentile_ci(samples[rows, best], level))
+        out["picked"] = picked
+    return out
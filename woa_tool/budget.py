@@ -0,0 +1,189 @@
+"""
+Time-budgeted training: pick POP / ITERS / fine-tuning limits from a wall-clock budget.
+
+A short calibration times the objective on this machine and data. A pilot
+optimizer run of PILOT_ITERS iterations (the whole `a` schedule compressed, so
+its population converges and repeats subsets like a full run, which the
+batched objective scores once) gives the cost per population candidate; single
+evaluations on in-range subsets give the fine-tuning cost. The pilot is side
+effect free: it scores through evaluate_batch and restores the global RNG.
+
+The plan keeps BUDGET_MARGIN of the budget for the final fit, the test
+evaluation and estimation error, gives fine-tuning at most FINETUNE_SHARE of
+the rest (cutting pairs before single flips), and spends what is left on the
+optimizer with the FAST tier's ITERS:POP shape. While training, the plan's
+deadlines stop the optimizer early and trim fine-tuning moves if the
+calibration was optimistic, so a run does not overrun its budget.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+import time
+import numpy as np
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Tuple
+
+from .algorithms import run_ewoa, run_woa
+
+PILOT_ITERS = 10
+BUDGET_MARGIN = 0.10
+FINETUNE_SHARE = 0.25
+MIN_POP = 10
+MAX_POP_FACTOR = 2        # pop <= tier pop * MAX_POP_FACTOR; a larger budget buys iterations
+
+_UNITS = {"": 1.0, "s": 1.0, "m": 60.0, "h": 3600.0, "d": 86400.0}
+
+
+def parse_duration(value) -> Optional[float]:
+    """Seconds from 5400, "5400", "90m", "1.5h" or "1h30m" (None / "" -> None)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    parts = re.findall(r"([0-9]*\.?[0-9]+)\s*([smhd]?)", str(value).strip().lower())
+    if not parts or re.sub(r"[0-9.\s]+[smhd]?", "", str(value).strip().lower()):
+        raise ValueError(f"Cannot parse time budget {value!r} (e.g. 5400, 90m, 1h30m)")
+    return float(sum(float(n) * _UNITS[u] for n, u in parts))
+
+
+@dataclass
+class Calibration:
+    batch_s: float        # seconds per candidate in a population evaluation
+    single_s: float       # seconds per single evaluation (fine-tuning)
+    pop: int              # population size batch_s was measured at
+    elapsed_s: float      # time spent calibrating
+
+
+def _subset_masks(rng, n, dim, size_range):
+    lo, hi = min(size_range[0], dim), min(size_range[1], dim)
+    masks = -np.ones((n, dim))
+    for row, k in zip(masks, rng.integers(max(1, lo), max(1, hi) + 1, size=n)):
+        row[rng.choice(dim, size=k, replace=False)] = 1.0
+    return masks
+
+
+class _Probe:
+    # optimizer-facing objective without side effects (no nfe / τ stats / archive writes)
+    def __init__(self, objective):
+        self.objective = objective
+        self.evals = 0
+
+    def __call__(self, mask):
+        self.evals += 1
+        return self.objective.evaluate(mask)[0]
+
+    def batch(self, masks):
+        self.evals += len(masks)
+        return [score for score, _ in self.objective.evaluate_batch(masks)]
+
+
+def calibrate(objective, dim: int, pop: int, size_range: Tuple[int, int], algo: str = "ewoa",
+              a_strategy: str = "cos", obl_freq: int = 0, obl_rate: float = 0.0,
+              pilot_iters: int = PILOT_ITERS, singles: int = 8, seed: int = 0) -> Calibration:
+    """Time a pilot optimizer run and single evaluations of `objective` (a CVObjective)."""
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    pop = max(1, int(pop))
+    objective.evaluate(_subset_masks(rng, 1, dim, size_range)[0])  # warm-up (lazy caches, BLAS threads)
+
+    probe = _Probe(objective)
+    state = np.random.get_state()  # the optimizers draw from the global stream
+    try:
+        np.random.seed(seed)
+        t = time.perf_counter()
+        if algo == "ewoa":
+            run_ewoa(probe, dim, (-1, 1), pop_size=pop, iters=pilot_iters,
+                     a_strategy=a_strategy, obl_freq=obl_freq, obl_rate=obl_rate)
+        else:
+            run_woa(probe, dim, (-1, 1), pop, pilot_iters)
+        batch_s = (time.perf_counter() - t) / max(1, probe.evals)
+    finally:
+        np.random.set_state(state)
+
+    t = time.perf_counter()
+    for mask in _subset_masks(rng, singles, dim, size_range):
+        objective.evaluate(mask)
+    single_s = (time.perf_counter() - t) / singles
+    return Calibration(batch_s, single_s, pop, time.perf_counter() - t0)
+
+
+def optimizer_evals(pop: int, iters: int, algo: str = "ewoa", obl_freq: int = 0, obl_rate: float = 0.0) -> float:
+    """Objective evaluations of run_ewoa / run_woa (init + OBL init + per-iteration + periodic OBL)."""
+    if algo != "ewoa":
+        return pop * (iters + 1)
+    obl = 2 * max(1, int(pop * obl_rate)) / obl_freq if obl_freq > 0 else 0.0
+    return 2 * pop + iters * (pop + obl)
+
+
+@dataclass
+class BudgetPlan:
+    budget_s: float
+    pop: int
+    iters: int
+    fine_top_k: int
+    pair_limit: int
+    optimizer_s: float     # projected optimizer time
+    finetune_s: float      # projected fine-tuning time (all planned moves)
+    projected_s: float     # projected time from the start to the end of fine-tuning
+    fits: bool             # False: even the smallest plan is projected to exceed the budget
+    calibration: Calibration
+    start: float = 0.0     # time.perf_counter() at the start of the run
+    margin: float = BUDGET_MARGIN
+
+    @property
+    def finetune_deadline(self) -> float:
+        return self.start + self.budget_s * (1.0 - self.margin)
+
+    @property
+    def search_deadline(self) -> float:
+        return self.finetune_deadline - self.finetune_s
+
+    def affordable(self, n: int) -> int:
+        """How many of n fine-tuning moves still fit before the fine-tuning deadline."""
+        remaining = self.finetune_deadline - time.perf_counter()
+        return int(max(0, min(n, remaining // max(self.calibration.single_s, 1e-9))))
+
+    def overrides(self) -> Dict[str, int]:
+        return {"pop": self.pop, "iters": self.iters, "fine_top_k": self.fine_top_k, "pair_limit": self.pair_limit}
+
+    def to_dict(self) -> Dict:
+        out = asdict(self)
+        out.pop("start")
+        return out
+
+
+def plan_budget(budget_s: float, cal: Calibration, tier: Dict, dim: int, algo: str = "ewoa",
+                obl_freq: int = 0, obl_rate: float = 0.0, spent_s: float = 0.0, start: float = 0.0,
+                margin: float = BUDGET_MARGIN, finetune_share: float = FINETUNE_SHARE) -> BudgetPlan:
+    """
+    Largest plan of the tier's shape that fits `budget_s` (seconds, counted from
+    `start`; `spent_s` already used, calibration included).
+    """
+    available = budget_s * (1.0 - margin) - spent_s
+
+    # fine-tuning: the tier's limits, pairs cut first
+    top_k = max(1, min(int(tier["fine_top_k"]), dim))
+    pairs = min(int(tier["pair_limit"]), top_k * (top_k - 1) // 2)
+    cap = int(max(0.0, finetune_share * available) // max(cal.single_s, 1e-9))
+    if top_k + pairs > cap:
+        pairs = max(0, cap - top_k)
+        top_k = max(1, min(top_k, cap))
+    finetune_s = (top_k + pairs) * cal.single_s
+
+    # optimizer: remaining evaluations, split as sqrt so ITERS / POP stays the tier's ratio
+    evals = max(0.0, available - finetune_s) / max(cal.batch_s, 1e-9)
+    ratio = tier["iters"] / max(1, tier["pop"])
+    pop = int(np.clip(math.sqrt(evals / ratio), MIN_POP, MAX_POP_FACTOR * tier["pop"]))
+    per_iter = optimizer_evals(pop, 1, algo, obl_freq, obl_rate) - optimizer_evals(pop, 0, algo, obl_freq, obl_rate)
+    iters = int((evals - optimizer_evals(pop, 0, algo, obl_freq, obl_rate)) // per_iter)
+    fits = iters >= 1
+    iters = max(1, iters)
+    optimizer_s = optimizer_evals(pop, iters, algo, obl_freq, obl_rate) * cal.batch_s
+
+    return BudgetPlan(
+        budget_s=float(budget_s), pop=pop, iters=iters, fine_top_k=top_k, pair_limit=pairs,
+        optimizer_s=optimizer_s, finetune_s=finetune_s, projected_s=spent_s + optimizer_s + finetune_s,
+        fits=fits, calibration=cal, start=start, margin=margin,
+    )
@@ -7,6 +7,21 @@ import os
 import woa_tool.preprocess as preprocess
 import woa_tool.train as train
 import woa_tool.predict as predict
+import woa_tool.sweep as sweep
+import woa_tool.update as update
+from woa_tool.train_and_eval import TrainConfig, fast_level_from_env
+from woa_tool.extract_pool import PER_IMAGE_TIMEOUT
+from woa_tool.feature_cache import FEATURE_CACHE
+from woa_tool.feature_extraction import DECODE_MODES, TEXTURE_MODES, ExtractionOptions
+
+
+def _add_cache_args(p):
+    p.add_argument("--feature-cache", default=FEATURE_CACHE, help="Content-addressed feature cache (SQLite)")
+    p.add_argument("--no-cache", action="store_true", help="Always extract features; neither read nor write the cache")
+
+
+def _feature_cache(args):
+    return None if args.no_cache else args.feature_cache
 
 
 def main():
@@ -19,10 +34,29 @@ def main():
     # --------------------------
     # preprocess
     # --------------------------
-    subparsers.add_parser(
+    pre_parser = subparsers.add_parser(
         "preprocess",
         help="Extract image features and save processed numpy arrays"
     )
+    pre_parser.add_argument("--workers", type=int, default=1, help="Parallel extraction processes")
+    pre_parser.add_argument("--timeout", type=float, default=PER_IMAGE_TIMEOUT,
+                            help="Per-image time limit in seconds (0 = none); slower images are skipped and logged")
+    pre_parser.add_argument("--decode", choices=DECODE_MODES, default="exact",
+                            help="Image load path: exact (full decode + anti-aliased resize) or fast "
+                                 "(reduced JPEG/TIFF decode + block mean); recorded in the dataset and models")
+    pre_parser.add_argument("--roi-crop", action="store_true",
+                            help="Run the feature filters on the breast ROI's bounding box instead of the whole "
+                                 "frame (same features up to float rounding); recorded in the dataset and models")
+    pre_parser.add_argument("--roi-margin", type=int, default=ExtractionOptions.roi_margin,
+                            help="Pixels kept around the ROI with --roi-crop")
+    pre_parser.add_argument("--texture", choices=TEXTURE_MODES, default="exact",
+                            help="GLCM path: exact (mahotas, 256 gray levels) or fast (--glcm-levels levels, "
+                                 "one bincount pass); changes the glcm_* features, recorded in the dataset and models")
+    pre_parser.add_argument("--glcm-levels", type=int, default=ExtractionOptions.glcm_levels,
+                            help="Gray levels of the fast GLCM (e.g. 32 or 64)")
+    pre_parser.add_argument("--incremental", action="store_true",
+                            help="Only extract rows that are new or whose image changed since the last run")
+    _add_cache_args(pre_parser)
 
     # --------------------------
     # train
@@ -37,6 +71,29 @@ def main():
     train_parser.add_argument("--a-strategy", choices=["linear", "sin", "cos", "log", "tan", "square"], default="linear")
     train_parser.add_argument("--obl-freq", type=int, default=0, help="OBL frequency (0 = disabled)")
     train_parser.add_argument("--obl-rate", type=float, default=0.0, help="OBL rate (0.0 = disabled)")
+    train_parser.add_argument("--finetune-workers", type=int, default=1, help="Parallel workers for greedy/pairwise fine-tuning")
+    train_parser.add_argument("--archive", default=None, help="SQLite warm-start archive of evaluated subsets (reused across runs)")
+    train_parser.add_argument("--warm-start", type=float, default=0.25, help="Fraction of the population seeded from archive elites")
+
+    # --------------------------
+    # sweep (hyperparameter search over train_and_eval configurations)
+    # --------------------------
+    sweep_parser = subparsers.add_parser("sweep", help="Hyperparameter sweep over train_and_eval configurations")
+    sweep_parser.add_argument("--processed", default="data/processed", help="Path to processed directory")
+    sweep_parser.add_argument("--space", default=None, help="JSON search space {field: [values] | {uniform|loguniform|int: [lo, hi]}}")
+    sweep_parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUES",
+                              help="Search dimension, e.g. obl_rate=0.1,0.2 or obl_rate=uniform:0.05:0.4 (repeatable)")
+    sweep_parser.add_argument("--mode", choices=["grid", "random"], default="grid")
+    sweep_parser.add_argument("--trials", type=int, default=10, help="Number of trials (random mode)")
+    sweep_parser.add_argument("--seed", type=int, default=0, help="Sampling seed (random mode)")
+    sweep_parser.add_argument("--fast", type=int, default=None, help="Base FAST tier (default: FAST env)")
+    sweep_parser.add_argument("--workers", type=int, default=1, help="Parallel trial processes")
+    sweep_parser.add_argument("--no-early-stop", action="store_true", help="Disable median-rule pruning")
+    sweep_parser.add_argument("--checkpoints", type=int, default=10, help="Pruning checkpoints per trial")
+    sweep_parser.add_argument("--warmup", type=int, default=2, help="Checkpoints before pruning may start")
+    sweep_parser.add_argument("--min-trials", type=int, default=3, help="Reports needed at a checkpoint to prune")
+    sweep_parser.add_argument("--out", default="results_sweep.csv", help="Results table (CSV)")
+    sweep_parser.add_argument("--models-dir", default=None, help="Optionally save each finished trial's model here")
 
     # --------------------------
     # predict
@@ -56,6 +113,24 @@ def main():
         "--no-pretty", action="store_true",
         help="If set, do not pretty-print JSON to stdout."
     )
+    pred_parser.add_argument(
+        "--no-explain", action="store_true",
+        help="Only extract the model's selected features (not the abnormality ones): faster, but no abnormality fields."
+    )
+    _add_cache_args(pred_parser)
+
+    # --------------------------
+    # update (fold newly labelled cases into a saved model)
+    # --------------------------
+    update_parser = subparsers.add_parser("update", help="Fold newly labelled cases into a saved model (no retraining)")
+    update_parser.add_argument("--model", required=True, help="Path to trained model JSON")
+    update_parser.add_argument("--csv", default=None, help="New cases CSV (image_path, Class), same format as data/test.csv")
+    update_parser.add_argument("--features", default=None, help="Raw feature rows .npy (n x all model features)")
+    update_parser.add_argument("--labels", default=None, help="Labels .npy (0 = Benign, 1 = Malignant)")
+    update_parser.add_argument("--retau", action="store_true", help="Re-pick τ on the new cases with the model's stored policy")
+    update_parser.add_argument("--workers", type=int, default=1, help="Parallel extraction processes for --csv images")
+    update_parser.add_argument("--out", default=None, help="Output model path (default: <model>.v<N>.json)")
+    _add_cache_args(update_parser)
 
     # --------------------------
     # set-tau (persist τ into model)
@@ -70,7 +145,10 @@ def main():
     args = parser.parse_args()
 
     if args.command == "preprocess":
-        preprocess.run()
+        preprocess.run(workers=args.workers, timeout=args.timeout or None, feature_cache=_feature_cache(args),
+                       incremental=args.incremental,
+                       options=ExtractionOptions(decode=args.decode, roi_crop=args.roi_crop, roi_margin=args.roi_margin,
+                                                 texture=args.texture, glcm_levels=args.glcm_levels))
         return 0
 
     if args.command == "train":
@@ -84,6 +162,28 @@ def main():
             a_strategy=args.a_strategy,
             obl_freq=args.obl_freq,
             obl_rate=args.obl_rate,
+            finetune_workers=args.finetune_workers,
+            archive=args.archive,
+            warm_start=args.warm_start,
+        )
+        return 0
+
+    if args.command == "sweep":
+        space = sweep.load_space(args.space, args.param)
+        level = args.fast if args.fast is not None else fast_level_from_env()
+        sweep.run_sweep(
+            space,
+            base=TrainConfig.for_fast_level(level, processed_dir=args.processed, out_path=None),
+            mode=args.mode,
+            n_trials=args.trials,
+            seed=args.seed,
+            workers=args.workers,
+            early_stop=not args.no_early_stop,
+            checkpoints=args.checkpoints,
+            warmup=args.warmup,
+            min_trials=args.min_trials,
+            out_csv=args.out,
+            models_dir=args.models_dir,
         )
         return 0
 
@@ -96,7 +196,8 @@ def main():
             print(f"❌ Image file not found: {args.image}", file=sys.stderr)
             return 2
 
-        res = predict.predict(args.model, args.image, tau_override=args.tau_override)
+        res = predict.predict(args.model, args.image, tau_override=args.tau_override,
+                              feature_cache=_feature_cache(args), explain=not args.no_explain)
 
         if args.out_json:
             with open(args.out_json, "w") as f:
@@ -110,6 +211,19 @@ def main():
             print(json.dumps(res, indent=2))
         return 0
 
+    if args.command == "update":
+        if not os.path.isfile(args.model):
+            print(f"❌ Model file not found: {args.model}", file=sys.stderr)
+            return 2
+        try:
+            update.run(args.model, out=args.out, csv=args.csv, features=args.features,
+                       labels=args.labels, retau=args.retau, feature_cache=_feature_cache(args),
+                       workers=args.workers)
+        except ValueError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 2
+        return 0
+
     if args.command == "set-tau":
         if not os.path.isfile(args.model):
             print(f"❌ Model file not found: {args.model}", file=sys.stderr)
@@ -1,6 +1,6 @@
 import os, time, json, numpy as np
 from typing import Any, Dict, Tuple, List, Optional
-from woa_tool.feature_extraction import extract_image_features
+from woa_tool.feature_extraction import ExtractionOptions, extract_image_features
 
 # ---------- basic helpers ----------
 def zscore_normalize(x: np.ndarray, mu: np.ndarray, sigma: np.ndarray) -> np.ndarray:
@@ -85,6 +85,7 @@ def load_model(model_path: str) -> Dict[str, Any]:
         "mu_M": mu_M,
         "Sp_inv": Sp_inv,
         "tau": tau,
+        "extraction": ExtractionOptions.from_dict(cfg.get("extraction")),
     }
 
 # ---------- label utils ----------
@@ -136,7 +137,7 @@ def predict_single(image_path: str, model: Dict[str, Any],
                    truth_label: Optional[int] = None) -> Dict[str, Any]:
     t0 = time.time()
 
-    feats = extract_image_features(image_path)
+    feats = extract_image_features(image_path, model["extraction"])
     fnames = model["feature_names"]
     sel = model["selected_idx"]
     x_full = np.array([feats.get(n, 0.0) for n in fnames], dtype=np.float32)
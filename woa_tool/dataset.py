@@ -0,0 +1,318 @@
+"""
+Processed-dataset container: a directory with a versioned manifest.
+
+    data/processed/
+      dataset.json          manifest: format version, generation, feature names, dtype, splits
+      X_train.g3.npy  y_train.g3.npy  ids_train.g3.npy   arrays of generation 3 (named in the manifest)
+      X_test.g3.npy   y_test.g3.npy   ids_test.g3.npy
+      sources_train.g3.json  sources_test.g3.json        (optional) image path + content hash per row
+      derived_standardized_train.g3.npy                  (optional) arrays derived from a split, see Split.derived
+      X_train.npy  y_train.npy  ...                      legacy-name copies of the current generation
+
+Every write is a new generation: its files get new names and the manifest is
+replaced last, which is the commit point, so a reader sees the old manifest
+with the old arrays or the new one with the new arrays, never a mix. The
+previous generation's files are kept for readers that opened it before the
+commit; older ones are deleted. The legacy names are refreshed after the
+commit for readers that predate the manifest (hard links to the current
+generation's files, copies where links are not supported), and a directory without a
+manifest (written before it existed) opens as version 0 from those loose
+files. Arrays are opened with np.load(mmap_mode="r"):
+opening is instant whatever the size, processes reading the same dataset share
+the OS page cache instead of private copies, and Split.columns() / rows() only
+materialize the requested block. Arrays computed from a split (TrainingData's
+standardized block) are stored next to it with Split.derived and mapped the
+same way; they belong to the generation and go with it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import time
+import numpy as np
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+FORMAT = "woa-dataset"
+FORMAT_VERSION = 1
+MANIFEST = "dataset.json"
+SPLITS = ("train", "test")
+
+Columns = Optional[Sequence[Union[int, str]]]
+
+
+def _legacy_entry(root: str, split: str) -> Optional[Dict[str, str]]:
+    entry = {key: f"{key}_{split}.npy" for key in ("X", "y", "ids")}
+    if not all(os.path.exists(os.path.join(root, entry[key])) for key in ("X", "y")):
+        return None
+    if not os.path.exists(os.path.join(root, entry["ids"])):
+        del entry["ids"]
+    return entry
+
+
+class Split:
+    """One split (train / test) of a Dataset; arrays are memory-mapped on first access."""
+
+    def __init__(self, root: str, name: str, entry: Dict, feature_names: List[str], mmap: bool = True,
+                 generation: int = 0):
+        self.root = root
+        self.name = name
+        self.entry = entry
+        self.feature_names = feature_names
+        self.generation = generation
+        self._mmap = "r" if mmap else None
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._sources: Optional[List[Dict]] = None
+
+    def _array(self, key: str) -> Optional[np.ndarray]:
+        if key not in self._arrays:
+            if key not in self.entry:
+                return None
+            arr = np.load(os.path.join(self.root, self.entry[key]), mmap_mode=self._mmap)
+            if "rows" in self.entry and arr.shape[0] != self.entry["rows"]:
+                raise ValueError(f"Split {self.name!r}: {self.entry[key]} has {arr.shape[0]} rows, the manifest "
+                                 f"says {self.entry['rows']} (dataset rewritten while reading? reopen it)")
+            self._arrays[key] = arr
+        return self._arrays[key]
+
+    @property
+    def X(self) -> np.ndarray:
+        return self._array("X")
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._array("y")
+
+    @property
+    def ids(self) -> Optional[np.ndarray]:
+        return self._array("ids")
+
+    @property
+    def sources(self) -> Optional[List[Dict]]:
+        """Per-row {"path", "content"} of the images the rows came from (None if not recorded)."""
+        if "sources" not in self.entry:
+            return None
+        if self._sources is None:
+            with open(os.path.join(self.root, self.entry["sources"]), "r") as f:
+                sources = json.load(f)
+            if "rows" in self.entry and len(sources) != self.entry["rows"]:
+                raise ValueError(f"Split {self.name!r}: {self.entry['sources']} has {len(sources)} rows, "
+                                 f"the manifest says {self.entry['rows']}")
+            self._sources = sources
+        return self._sources
+
+    @property
+    def n_rows(self) -> int:
+        return int(self.X.shape[0])
+
+    def column_index(self, cols: Columns) -> np.ndarray:
+        """Column positions for feature names and/or positions."""
+        if cols is None:
+            return np.arange(len(self.feature_names))
+        lookup = {n: i for i, n in enumerate(self.feature_names)}
+        try:
+            return np.array([lookup[c] if isinstance(c, str) else int(c) for c in cols], dtype=int)
+        except KeyError as e:
+            raise KeyError(f"Unknown feature {e.args[0]!r} in split {self.name!r}") from None
+
+    def columns(self, cols: Columns = None) -> np.ndarray:
+        """In-memory (rows, len(cols)) copy of the selected columns."""
+        return np.asarray(self.X[:, self.column_index(cols)])
+
+    def rows(self, start: int, stop: int, cols: Columns = None) -> np.ndarray:
+        """In-memory copy of rows [start, stop) (optionally of selected columns) for chunked scoring."""
+        block = self.X[start:stop]
+        return np.array(block if cols is None else block[:, self.column_index(cols)])
+
+    def derived(self, key: str, shape: Tuple[int, ...], dtype, fill: Callable[[np.ndarray], None]) -> np.ndarray:
+        """
+        Array computed from this split, stored as derived_<key>_<split>.g<N>.npy and
+        opened like the split's own arrays. The first caller writes it with fill(out)
+        into a file-backed array (so it need not fit in memory); later ones, in any
+        process, map the same file. `key` must name everything the content depends
+        on besides the split itself. The array is filled in memory instead where the
+        directory is not writable, and for a legacy directory (generation 0), whose
+        loose files can be rewritten under the same names.
+        """
+        if self.generation == 0:
+            out = np.empty(shape, dtype=dtype)
+            fill(out)
+            return out
+        path = os.path.join(self.root, f"derived_{key}_{self.name}.g{self.generation}.npy")
+        if os.path.exists(path):
+            arr = np.load(path, mmap_mode=self._mmap)
+            if arr.shape == tuple(shape) and arr.dtype == np.dtype(dtype):
+                return arr
+        tmp = f"{path}.tmp{os.getpid()}"
+        try:
+            out = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=tuple(shape))
+            fill(out)
+            out.flush()
+            del out
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ Could not store {os.path.basename(path)} ({e}); keeping it in memory.")
+            if os.path.exists(tmp):
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+            out = np.empty(shape, dtype=dtype)
+            fill(out)
+            return out
+        return np.load(path, mmap_mode=self._mmap)
+
+
+class Dataset:
+    """A processed-dataset directory (see module docstring)."""
+
+    def __init__(self, root: str, manifest: Dict, mmap: bool = True):
+        self.root = root
+        self.manifest = manifest
+        self.version = int(manifest.get("version", 0))
+        self.generation = int(manifest.get("generation", 0))
+        self.feature_names: List[str] = list(manifest["feature_names"])
+        self.dtype = np.dtype(manifest.get("dtype", "float32"))
+        self._splits = {name: Split(root, name, entry, self.feature_names, mmap, self.generation)
+                        for name, entry in manifest["splits"].items()}
+
+    @classmethod
+    def open(cls, root: str, mmap: bool = True) -> "Dataset":
+        path = os.path.join(root, MANIFEST)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("format") != FORMAT:
+                raise ValueError(f"{path} is not a {FORMAT} manifest")
+            if int(manifest.get("version", 0)) > FORMAT_VERSION:
+                raise ValueError(f"{path} has dataset format v{manifest['version']}; "
+                                 f"this version reads up to v{FORMAT_VERSION}")
+            return cls(root, manifest, mmap)
+
+        # legacy layout: loose arrays + feature_names.json
+        names_path = os.path.join(root, "feature_names.json")
+        splits = {s: e for s, e in ((s, _legacy_entry(root, s)) for s in SPLITS) if e is not None}
+        if "train" not in splits or not os.path.exists(names_path):
+            raise FileNotFoundError(
+                f"❌ Missing processed data in {root}. "
+                f"Run 'python3 -m woa_tool.cli preprocess' first."
+            )
+        with open(names_path, "r") as f:
+            feature_names = json.load(f)
+        dtype = np.load(os.path.join(root, splits["train"]["X"]), mmap_mode="r").dtype
+        return cls(root, {"format": FORMAT, "version": 0, "feature_names": feature_names,
+                          "dtype": dtype.str, "splits": splits}, mmap)
+
+    @classmethod
+    def write(cls, root: str, feature_names: Sequence[str], splits: Dict[str, Tuple],
+              dtype=np.float32, sources: Optional[Dict[str, List[Dict]]] = None,
+              meta: Optional[Dict] = None) -> "Dataset":
+        """
+        Write splits {name: (X, y, ids)} as a new generation (see module docstring):
+        the arrays go to files named after the generation, then the manifest that
+        names them replaces the old one, so readers see either the previous dataset
+        or the complete new one.
+        sources: optional per-split row provenance (one dict per row)
+        meta   : extra manifest keys (e.g. the feature extractor version)
+        """
+        os.makedirs(root, exist_ok=True)
+        feature_names = list(feature_names)
+        generation = _current_generation(root) + 1
+        entries = {}
+        for name, (X, y, ids) in splits.items():
+            X = np.asarray(X, dtype=dtype)
+            if X.ndim != 2 or X.shape[1] != len(feature_names):
+                raise ValueError(f"Split {name!r}: expected (n, {len(feature_names)}) features, got {X.shape}")
+            if sources and name in sources and len(sources[name]) != X.shape[0]:
+                raise ValueError(f"Split {name!r}: {len(sources[name])} sources for {X.shape[0]} rows")
+            arrays = {"X": X, "y": np.asarray(y, dtype=np.int32), "ids": np.asarray(ids)}
+            entries[name] = {key: f"{key}_{name}.g{generation}.npy" for key in arrays}
+            entries[name]["rows"] = int(X.shape[0])
+            for key, arr in arrays.items():
+                _atomic_save(os.path.join(root, entries[name][key]), arr)
+            if sources and name in sources:
+                entries[name]["sources"] = f"sources_{name}.g{generation}.json"
+                _atomic_json(os.path.join(root, entries[name]["sources"]), sources[name])
+
+        manifest = {"format": FORMAT, "version": FORMAT_VERSION, "generation": generation,
+                    "feature_names": feature_names, "dtype": np.dtype(dtype).str,
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S"), **(meta or {}), "splits": entries}
+        _atomic_json(os.path.join(root, MANIFEST), manifest)   # commit point
+
+        _refresh_legacy(root, feature_names, entries)
+        _drop_generations(root, keep={generation, generation - 1})
+        return cls(root, manifest)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._splits
+
+    @property
+    def splits(self) -> List[str]:
+        return list(self._splits)
+
+    def split(self, name: str) -> Split:
+        if name not in self._splits:
+            raise KeyError(f"Dataset {self.root} has no {name!r} split (has {self.splits})")
+        return self._splits[name]
+
+
+_GENERATION_FILE = re.compile(r"^(?:X|y|ids|sources|derived)_\w+\.g([0-9]+)\.(?:npy|json)$")
+
+
+def _current_generation(root: str) -> int:
+    # highest generation in the manifest or on disk (a write that died before its commit
+    # may have left files of a generation the manifest never named)
+    try:
+        with open(os.path.join(root, MANIFEST), "r") as f:
+            current = int(json.load(f).get("generation", 0))
+    except (OSError, ValueError):
+        current = 0
+    on_disk = [int(m.group(1)) for m in map(_GENERATION_FILE.match, os.listdir(root)) if m]
+    return max([current] + on_disk)
+
+
+def _refresh_legacy(root: str, feature_names: List[str], entries: Dict[str, Dict]) -> None:
+    # X_train.npy & co. for readers without manifest support; best effort, the manifest is authoritative.
+    # Hard links, so the legacy names cost no disk (files are never modified in place, only
+    # replaced); a copy only where the filesystem has no links.
+    try:
+        _atomic_json(os.path.join(root, "feature_names.json"), feature_names)
+        for name, entry in entries.items():
+            for key in ("X", "y", "ids"):
+                src = os.path.join(root, entry[key])
+                tmp = os.path.join(root, f"{key}_{name}.npy.tmp{os.getpid()}")
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                try:
+                    os.link(src, tmp)
+                except OSError:
+                    shutil.copyfile(src, tmp)
+                os.replace(tmp, os.path.join(root, f"{key}_{name}.npy"))
+    except OSError as e:
+        print(f"⚠️ Could not refresh the legacy array names in {root} ({e}); dataset.json is up to date.")
+
+
+def _drop_generations(root: str, keep: set) -> None:
+    for fname in os.listdir(root):
+        m = _GENERATION_FILE.match(fname)
+        if m and int(m.group(1)) not in keep:
+            try:
+                os.remove(os.path.join(root, fname))
+            except OSError:
+                pass   # still open somewhere (Windows); removed by a later write
+
+
+def _atomic_save(path: str, arr: np.ndarray) -> None:
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def _atomic_json(path: str, obj) -> None:
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp, path)
@@ -0,0 +1,243 @@
+"""
+Parallel feature extraction over many images.
+
+Images are sent to a process pool in chunks, and results come back in input
+order whatever the completion order. Per image:
+
+  - errors are captured (ExtractResult.error) instead of ending the job;
+  - a time limit (`timeout` seconds, SIGALRM in the worker) turns a stuck
+    decode or extraction into an error. The alarm fires between Python steps,
+    so a single long C call finishes first.
+
+If a worker process dies (e.g. a decoder segfault), the chunks that may have
+been running are replayed one image at a time in a single-worker pool until
+the image that kills it is found and reported as an error; the rest go back to
+the parallel pool.
+
+Where SIGALRM is not available (Windows), the parent enforces the time limit
+instead: a chunk running longer than its images' limits (plus start-up grace)
+gets the pool recycled, and its images are replayed one at a time in a
+single-worker pool, where an image past its limit is reported as timed out and
+the worker is replaced. The same serial path runs workers=1 jobs there.
+
+Each worker pins BLAS / OpenMP to `threads` threads (threadpoolctl plus the
+usual env vars), so N workers do not oversubscribe the cores. With workers=1
+everything runs in the calling process, with the same error and timeout
+handling (SIGALRM permitting, see above).
+"""
+
+from __future__ import annotations
+
+import math
+import multiprocessing as mp
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from threadpoolctl import threadpool_limits
+
+from .feature_extraction import extract_image_features
+
+PER_IMAGE_TIMEOUT = 300.0     # seconds; None = no limit
+CHUNK_SIZE = 8
+PARENT_GRACE = 10.0           # seconds added to parent-enforced limits (worker start-up, imports)
+_HAS_ALARM = hasattr(signal, "setitimer")
+_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+Extractor = Callable[[str], Dict[str, float]]
+
+
+@dataclass
+class ExtractResult:
+    index: int                            # position in the input sequence
+    path: str
+    feats: Optional[Dict[str, float]]     # None on error
+    error: Optional[str]
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ImageTimeout(BaseException):
+    # BaseException, like KeyboardInterrupt: the feature groups' `except Exception`
+    # fallbacks must not swallow it and return partial features
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise ImageTimeout()
+
+
+def _extract_one(index: int, path: str, extract: Extractor, timeout: Optional[float]) -> ExtractResult:
+    t0 = time.perf_counter()
+    use_alarm = bool(timeout) and _alarm_usable()
+    previous = signal.signal(signal.SIGALRM, _on_alarm) if use_alarm else None
+    try:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, float(timeout))
+        feats = extract(path)
+        return ExtractResult(index, path, feats, None, time.perf_counter() - t0)
+    except ImageTimeout:
+        return ExtractResult(index, path, None, f"timed out after {timeout:g}s", time.perf_counter() - t0)
+    except Exception as e:
+        detail = traceback.format_exception_only(type(e), e)[-1].strip().splitlines()[0]
+        return ExtractResult(index, path, None, detail, time.perf_counter() - t0)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def _alarm_usable() -> bool:
+    # SIGALRM only works in a process's main thread (pool workers, or the caller with workers=1)
+    return _HAS_ALARM and threading.current_thread() is threading.main_thread()
+
+
+def _timed_out(index: int, path: str, timeout: float) -> ExtractResult:
+    return ExtractResult(index, path, None, f"timed out after {timeout:g}s", float(timeout))
+
+
+def _kill(ex: ProcessPoolExecutor) -> None:
+    # a worker stuck past its limit would block shutdown(): terminate the pool's processes
+    for proc in list((getattr(ex, "_processes", None) or {}).values()):
+        proc.terminate()
+    ex.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_chunk(chunk: Sequence[Tuple[int, str]], extract: Extractor, timeout: Optional[float]) -> List[ExtractResult]:
+    return [_extract_one(i, p, extract, timeout) for i, p in chunk]
+
+
+_LIMITS = None
+
+
+def _init_worker(threads: int):
+    global _LIMITS
+    for key in _THREAD_ENV:
+        os.environ[key] = str(threads)
+    _LIMITS = threadpool_limits(limits=threads)  # kept alive for the worker's lifetime
+
+
+def extract_many(paths: Sequence[str], workers: int = 1, extract: Optional[Extractor] = None,
+                 timeout: Optional[float] = PER_IMAGE_TIMEOUT, chunk_size: int = CHUNK_SIZE,
+                 threads: int = 1, progress: Optional[Callable[[int, int], None]] = None) -> List[ExtractResult]:
+    """
+    Extract features for every path; returns one ExtractResult per path, in input order.
+    extract : path -> feature dict (default extract_image_features); must be picklable
+              (a module-level function or a functools.partial of one) when workers > 1
+    progress: called as progress(done, total) after each finished chunk
+    """
+    extract = extract or extract_image_features
+    items = [(i, str(p)) for i, p in enumerate(paths)]
+    total = len(items)
+    results: List[ExtractResult] = []
+
+    def report():
+        if progress is not None:
+            progress(len(results), total)
+
+    # without a usable SIGALRM the parent has to watch the clock, from outside the worker
+    watch = float(timeout) if timeout and not _HAS_ALARM else None
+    in_process = workers <= 1 or total <= 1
+    if in_process and not (timeout and not _alarm_usable()):
+        for start in range(0, total, max(1, chunk_size)):
+            results.extend(_extract_chunk(items[start:start + chunk_size], extract, timeout))
+            report()
+        return results
+
+    # a few chunks per worker keeps the pool busy while results stream back
+    chunk_size = max(1, min(int(chunk_size), math.ceil(total / (4 * max(1, workers)))))
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+
+    def pool(n):
+        return ProcessPoolExecutor(max_workers=n, mp_context=ctx, initializer=_init_worker,
+                                   initargs=(max(1, int(threads)),))
+
+    def chunked(items):
+        return [items[s:s + chunk_size] for s in range(0, len(items), chunk_size)]
+
+    if in_process:
+        # no alarm in this thread/platform: run in one worker process the parent can kill
+        pending, suspects = [], items
+    else:
+        pending, suspects = chunked(items), []
+    while pending or suspects:
+        if suspects:
+            # one worker, one image at a time, in order: the first task that breaks the
+            # pool is the image that killed it (the ones before it finished). With the
+            # parent watching, an image past its limit gets the worker replaced instead.
+            ex = pool(1)
+            try:
+                for k, item in enumerate(suspects):
+                    fut = ex.submit(_extract_chunk, [item], extract, timeout)
+                    try:
+                        results.extend(fut.result(timeout=None if watch is None else watch + PARENT_GRACE))
+                    except FutureTimeout:
+                        _kill(ex)
+                        results.append(_timed_out(*item, watch))
+                        ex = pool(1)
+                    except BrokenProcessPool:
+                        results.append(ExtractResult(*item, None, "worker process died while extracting", 0.0))
+                        pending = chunked(suspects[k + 1:]) + pending
+                        break
+                    report()
+            finally:
+                ex.shutdown(cancel_futures=True)
+            suspects = []
+            continue
+
+        unfinished: List[Tuple[int, str]] = []
+        overran: List[Tuple[int, str]] = []
+        ex = pool(workers)
+        try:
+            futures = {ex.submit(_extract_chunk, chunk, extract, timeout): chunk for chunk in pending}
+            started: Dict[object, float] = {}
+            todo = set(futures)
+            while todo:
+                done, todo = wait(todo, timeout=None if watch is None else 1.0, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    try:
+                        results.extend(fut.result())
+                    except BrokenProcessPool:
+                        unfinished.extend(futures[fut])
+                        continue
+                    report()
+                if watch is None or not todo:
+                    continue
+                # "running" starts when a chunk is handed to the workers' queue, so a queued
+                # chunk may look late behind a slow one; the serial replay sorts that out
+                now = time.monotonic()
+                for fut in todo:
+                    if fut.running():
+                        started.setdefault(fut, now)
+                late = [f for f in todo if f in started
+                        and now - started[f] > watch * len(futures[f]) + PARENT_GRACE]
+                if late:
+                    overran = sorted(item for f in late for item in futures[f])
+                    unfinished.extend(item for f in todo if f not in late for item in futures[f])
+                    _kill(ex)
+                    break
+        finally:
+            ex.shutdown(wait=not overran, cancel_futures=True)
+        unfinished.sort()
+        if overran:
+            # the overrunning chunks hold the slow image(s); anything else that was cut
+            # short goes back to the parallel pool
+            suspects, pending = overran, chunked(unfinished)
+            continue
+        # the culprit was running, i.e. among the first unfinished chunks (one per worker,
+        # plus one queued); everything after them goes back to the parallel pool
+        n_suspect = (workers + 1) * chunk_size
+        suspects, pending = unfinished[:n_suspect], chunked(unfinished[n_suspect:])
+
+    results.sort(key=lambda r: r.index)
+    return results
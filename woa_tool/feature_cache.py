@@ -0,0 +1,227 @@
+"""
+Content-addressed feature cache: one SQLite file for preprocess, training and predict.
+
+Rows are keyed by (content hash of the image bytes, extractor version):
+
+  - a moved or renamed image still hits, a replaced one misses;
+  - the version fingerprints the feature-extraction code and the decoding /
+    image libraries it runs on, so changing a feature makes old rows miss
+    instead of going stale (they stay in the file until prune());
+  - vectors are stored as float32 blobs next to a shared feature-name list.
+
+The database runs in WAL mode with a busy timeout, so pool workers and
+concurrent runs read while another process writes; every process opens its
+own connection (see cached_extract). A (path, size, mtime) table memoizes
+content hashes, so an unchanged file is not re-read just to be hashed.
+
+Values come back float32-rounded on hits and misses alike (the processed
+arrays are float32), so a cold and a warm run produce the same numbers.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Optional
+
+from . import feature_extraction
+from .feature_extraction import ExtractionOptions, extract_image_features
+
+FEATURE_CACHE = "data/cache/features.sqlite"
+BUSY_TIMEOUT = 60.0   # seconds a writer waits for the lock
+_LIBRARIES = ("numpy", "scipy", "skimage", "mahotas", "imageio", "tifffile", "PIL")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS name_sets (
+    id    INTEGER PRIMARY KEY,
+    names TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS features (
+    content TEXT NOT NULL,
+    version TEXT NOT NULL,
+    names   INTEGER NOT NULL REFERENCES name_sets (id),
+    vec     BLOB NOT NULL,
+    seconds REAL,
+    created REAL NOT NULL,
+    PRIMARY KEY (content, version)
+);
+CREATE TABLE IF NOT EXISTS files (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content  TEXT NOT NULL
+);
+"""
+
+
+def content_hash(path: str, block: int = 1 << 20) -> str:
+    """Hash of the file's bytes (BLAKE2b, 160 bits)."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _library_version(name: str) -> str:
+    try:
+        return getattr(__import__(name), "__version__", "?")
+    except ImportError:
+        return "-"
+
+
+def extractor_version(options: Optional[ExtractionOptions] = None) -> str:
+    """
+    Fingerprint of the feature extractor: feature_extraction.py's source, the
+    versions of the libraries that decode and process images, and the
+    ExtractionOptions (default: the exact decode path).
+    """
+    return _extractor_version(options or ExtractionOptions())
+
+
+@lru_cache(maxsize=None)
+def _extractor_version(options: ExtractionOptions) -> str:
+    with open(feature_extraction.__file__, "rb") as f:
+        source = f.read().replace(b"\r\n", b"\n")
+    h = hashlib.sha1(source)
+    h.update(json.dumps({name: _library_version(name) for name in _LIBRARIES}, sort_keys=True).encode())
+    h.update(json.dumps(options.to_dict(), sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def _rounded(feats: Dict[str, float]) -> Dict[str, float]:
+    vec = np.asarray(list(feats.values()), dtype=np.float32)
+    return dict(zip(feats.keys(), vec.tolist()))
+
+
+class FeatureCache:
+    """Feature vectors by (content hash, extractor version) in one SQLite file."""
+
+    def __init__(self, path: str = FEATURE_CACHE, options: Optional[ExtractionOptions] = None):
+        self.path = path
+        self.options = options or ExtractionOptions()
+        self.version = extractor_version(self.options)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.executescript(_SCHEMA)
+        self._names: Dict[int, list] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def hash_of(self, path: str) -> str:
+        """Content hash of `path`, memoized on (absolute path, size, mtime)."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        row = self._db.execute("SELECT size, mtime_ns, content FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        digest = content_hash(path)
+        try:
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                 (path, st.st_size, st.st_mtime_ns, digest))
+        except sqlite3.OperationalError:
+            pass  # read-only or locked past the timeout: the memo is an optimization, keep the digest
+        return digest
+
+    def _name_set(self, names_id: int) -> list:
+        if names_id not in self._names:
+            (names,) = self._db.execute("SELECT names FROM name_sets WHERE id = ?", (names_id,)).fetchone()
+            self._names[names_id] = json.loads(names)
+        return self._names[names_id]
+
+    def get(self, content: str) -> Optional[Dict[str, float]]:
+        row = self._db.execute("SELECT names, vec FROM features WHERE content = ? AND version = ?",
+                               (content, self.version)).fetchone()
+        if row is None:
+            return None
+        vec = np.frombuffer(row[1], dtype=np.float32)
+        return dict(zip(self._name_set(row[0]), vec.tolist()))
+
+    def put(self, content: str, feats: Dict[str, float], seconds: Optional[float] = None) -> None:
+        names = json.dumps(list(feats.keys()))
+        vec = np.asarray(list(feats.values()), dtype=np.float32)
+        with self._db:
+            self._db.execute("INSERT OR IGNORE INTO name_sets (names) VALUES (?)", (names,))
+            (names_id,) = self._db.execute("SELECT id FROM name_sets WHERE names = ?", (names,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)",
+                             (content, self.version, names_id, vec.tobytes(), seconds, time.time()))
+
+    def extract(self, path: str, extract: Optional[Callable[[str], Dict[str, float]]] = None,
+                required: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """
+        Features of the image at `path`: from the cache, or extracted and stored.
+        With `required` (feature names), a miss extracts only the groups they need
+        and is not stored, since the cache holds complete vectors; a hit returns
+        the complete vector.
+        """
+        content = self.hash_of(path)
+        feats = self.get(content)
+        if feats is not None:
+            self.hits += 1
+            return feats
+        self.misses += 1
+        if required is not None:
+            return _rounded(extract_image_features(path, self.options, required))
+        t0 = time.perf_counter()
+        feats = _rounded(extract(path) if extract else extract_image_features(path, self.options))
+        try:
+            self.put(content, feats, time.perf_counter() - t0)
+        except sqlite3.OperationalError:
+            pass  # read-only or locked past the timeout: still return the features
+        return feats
+
+    def stats(self) -> Dict[str, int]:
+        """Stored vectors per extractor version."""
+        rows = self._db.execute("SELECT version, COUNT(*) FROM features GROUP BY version")
+        return {version: int(n) for version, n in rows}
+
+    def prune(self) -> int:
+        """Delete vectors of other extractor versions (and hashes of files that are gone); returns rows deleted."""
+        with self._db:
+            n = self._db.execute("DELETE FROM features WHERE version != ?", (self.version,)).rowcount
+            gone = [(p,) for (p,) in self._db.execute("SELECT path FROM files") if not os.path.exists(p)]
+            self._db.executemany("DELETE FROM files WHERE path = ?", gone)
+        self._db.execute("VACUUM")
+        return int(n)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_OPEN: Dict[tuple, FeatureCache] = {}
+
+
+def open_cache(path: str = FEATURE_CACHE, options: Optional[ExtractionOptions] = None) -> FeatureCache:
+    """This process's connection to the cache at `path` (pool workers each open their own)."""
+    key = (os.getpid(), os.path.abspath(path), options or ExtractionOptions())
+    if key not in _OPEN:
+        _OPEN[key] = FeatureCache(path, options)
+    return _OPEN[key]
+
+
+def cached_extract(image_path: str, cache_path: Optional[str] = FEATURE_CACHE,
+                   options: Optional[ExtractionOptions] = None,
+                   required: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    extract_image_features(image_path, options, required) through the cache at
+    `cache_path` (None = no cache). Picklable with functools.partial, for
+    extract_pool.extract_many. If the cache cannot be opened the image is
+    extracted directly (same rounding). See FeatureCache.extract for `required`.
+    """
+    if cache_path:
+        try:
+            cache = open_cache(cache_path, options)
+        except (OSError, sqlite3.Error):
+            cache = None
+        if cache is not None:
+            return cache.extract(image_path, required=required)
+    return _rounded(extract_image_features(image_path, options, required))
@@ -15,14 +15,20 @@ No metadata is read here; this is purely image-derived.
 """
 
 from __future__ import annotations
-from typing import Dict, Tuple
+import os
+from dataclasses import asdict, dataclass, fields
+from functools import cached_property
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 import numpy as np
 import mahotas
+import tifffile
+from PIL import Image
 from skimage import io, color, exposure, morphology, measure, util
-from skimage.filters import sobel, laplace, threshold_otsu
-from skimage.feature import canny, blob_log, structure_tensor
+from skimage.filters import gaussian, sobel, laplace, threshold_otsu
+from skimage.feature import canny, blob_log
 from skimage.transform import resize
+from scipy import ndimage as ndi
 from scipy.stats import skew, kurtosis
 
 
@@ -58,6 +64,275 @@ def _safe_load_grayscale(path: str, downscale_max: int = 1024) -> np.ndarray:
     return img
 
 
+# -------------------------------------------------------------------------
+# Extraction options
+# -------------------------------------------------------------------------
+
+DECODE_MODES = ("exact", "fast")
+TEXTURE_MODES = ("exact", "fast")
+
+
+@dataclass(frozen=True)
+class ExtractionOptions:
+    """
+    Settings that change feature values. They are part of the feature-cache key
+    and are recorded in the processed dataset and the model, so a model is
+    served with the settings its training features were extracted with.
+    """
+    decode: str = "exact"   # "exact": full decode + anti-aliased resize; "fast": reduced decode + block mean
+    roi_crop: bool = False  # run the filters on the ROI's bounding box (+ roi_margin) instead of the whole frame
+    roi_margin: int = 32    # pixels kept around the ROI; wider than any filter's support (LoG: 14, canny: 2 x 8)
+    texture: str = "exact"  # "exact": mahotas Haralick on 256 gray levels; "fast": glcm_levels levels, one bincount pass
+    glcm_levels: int = 64   # gray levels of the fast GLCM (background 0 + glcm_levels - 1 for the ROI)
+
+    def __post_init__(self):
+        if self.decode not in DECODE_MODES:
+            raise ValueError(f"Unknown decode mode {self.decode!r} (expected one of {DECODE_MODES})")
+        if self.texture not in TEXTURE_MODES:
+            raise ValueError(f"Unknown texture mode {self.texture!r} (expected one of {TEXTURE_MODES})")
+        if int(self.glcm_levels) != self.glcm_levels or not 2 < self.glcm_levels <= 256:
+            raise ValueError(f"glcm_levels must be an integer in 3..256, got {self.glcm_levels!r}")
+        if int(self.roi_margin) != self.roi_margin or self.roi_margin < 0:
+            raise ValueError(f"roi_margin must be a non-negative integer, got {self.roi_margin!r}")
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Optional[Dict]) -> "ExtractionOptions":
+        """Options recorded by to_dict (None / {} -> defaults, as for data and models that predate them)."""
+        d = dict(d or {})
+        unknown = set(d) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown feature extraction option(s) {sorted(unknown)}; "
+                             f"the model or dataset was made by a newer version")
+        return cls(**d)
+
+
+# -------------------------------------------------------------------------
+# Fast (reduced-resolution) decode
+# -------------------------------------------------------------------------
+
+def _block_mean(img: np.ndarray, k: int, band: int = 64) -> np.ndarray:
+    """
+    Mean over k x k blocks (trailing rows / columns that do not fill a block are
+    dropped), as float32. Works through bands of `band` output rows, so a
+    memory-mapped input is never copied whole.
+    """
+    h, w = img.shape[0] // k, img.shape[1] // k
+    out = np.empty((h, w), dtype=np.float32)
+    for r in range(0, h, band):
+        rows = min(band, h - r)
+        block = np.asarray(img[r * k:(r + rows) * k, :w * k], dtype=np.float32)
+        out[r:r + rows] = block.reshape(rows, k, w, k).mean(axis=(1, 3))
+    return out
+
+
+def _to_float_gray(img: np.ndarray, full_shape: Tuple[int, int], downscale_max: Optional[int]) -> np.ndarray:
+    """
+    (Reduced) decoded array of a `full_shape` source -> grayscale float32 in [0, 1]
+    of exactly the shape _safe_load_grayscale gives that source: an integer block
+    mean down to no less than the target, then one small anti-aliased resize.
+    """
+    if img.ndim == 3:
+        if img.shape[-1] == 4:
+            img = img[..., :3]
+        img = color.rgb2gray(img)
+    h, w = full_shape
+    if downscale_max is None or max(h, w) <= downscale_max:
+        return util.img_as_float32(img)
+    scale = downscale_max / float(max(h, w))
+    target = (int(h * scale), int(w * scale))
+    k = max(1, min(img.shape[0] // target[0], img.shape[1] // target[1]))
+    if img.dtype.kind == "u":
+        # block-mean the integers, then the same scaling img_as_float32 applies
+        img = _block_mean(img, k) / np.float32(np.iinfo(img.dtype).max) if k > 1 else util.img_as_float32(img)
+    else:
+        img = util.img_as_float32(img)
+        img = _block_mean(img, k) if k > 1 else img
+    if img.shape != target:
+        img = resize(img, target, order=1, anti_aliasing=True, preserve_range=True).astype(np.float32)
+    return img
+
+
+def _read_pil_reduced(path: str, downscale_max: Optional[int]) -> Tuple[np.ndarray, Tuple[int, int]]:
+    # -> (decoded array, (height, width) of the full-resolution image)
+    with Image.open(path) as im:
+        full_shape = (im.size[1], im.size[0])
+        if downscale_max is not None and max(im.size) > downscale_max:
+            scale = downscale_max / float(max(im.size))
+            # JPEG: DCT-domain reduction (1/2, 1/4, 1/8) to at least the target size, luma only
+            im.draft("L", (max(1, int(im.size[0] * scale)), max(1, int(im.size[1] * scale))))
+        if im.mode not in ("L", "I;16", "I;16B", "I;16L"):
+            im = im.convert("L")
+        return np.asarray(im), full_shape
+
+
+def _read_tiff_reduced(path: str, downscale_max: Optional[int]) -> Tuple[np.ndarray, Tuple[int, int]]:
+    # -> (decoded array, (height, width) of the full-resolution image)
+    with tifffile.TiffFile(path) as tif:
+        series = tif.series[0]
+        levels = list(series.levels)
+        full_shape = (levels[0].shape[levels[0].axes.index("Y")], levels[0].shape[levels[0].axes.index("X")])
+        # smallest pyramid level / reduced page that still covers downscale_max
+        level = 0
+        if downscale_max is not None:
+            for i, lvl in enumerate(levels):
+                if max(lvl.shape[lvl.axes.index("Y")], lvl.shape[lvl.axes.index("X")]) >= downscale_max:
+                    level = i
+        if levels[level].axes not in ("YX", "YXS"):
+            return tifffile.imread(path), full_shape
+        try:
+            return tifffile.memmap(path, series=0, level=level, mode="r"), full_shape  # uncompressed: read on demand
+        except ValueError:
+            return levels[level].asarray(), full_shape
+
+
+def _fast_load_grayscale(path: str, downscale_max: int = 1024) -> np.ndarray:
+    """
+    Reduced-resolution load: JPEGs decode at 1/2 - 1/8 scale in the DCT domain
+    straight to grayscale (Pillow draft), TIFFs read the smallest pyramid level
+    that covers `downscale_max` (memory-mapped when uncompressed), and what is
+    left is an integer block mean plus a final resize by a factor under 2. The
+    result has the same shape as _safe_load_grayscale's for any source size or
+    format, so scale-dependent features (areas, perimeters, edge density) stay
+    comparable across a mixed-resolution dataset.
+    """
+    if os.path.splitext(path)[1].lower() in (".tif", ".tiff"):
+        img, full_shape = _read_tiff_reduced(path, downscale_max)
+    else:
+        img, full_shape = _read_pil_reduced(path, downscale_max)
+    return _to_float_gray(img, full_shape, downscale_max)
+
+
+def load_grayscale(path: str, options: Optional[ExtractionOptions] = None, downscale_max: int = 1024) -> np.ndarray:
+    """Grayscale float32 image in [0, 1] through the options' decode path."""
+    if options is not None and options.decode == "fast":
+        return _fast_load_grayscale(path, downscale_max)
+    return _safe_load_grayscale(path, downscale_max)
+
+
+# -------------------------------------------------------------------------
+# Fast (quantized) GLCM
+# -------------------------------------------------------------------------
+
+_GLCM_OFFSETS = ((0, 1), (1, 1), (1, 0), (1, -1))   # mahotas' 2-D directions: 0°, 45° (nw-se), 90°, 135°
+
+
+def _quantization_lut(levels: int) -> np.ndarray:
+    # uint8 value -> level: 0 (background) stays 0, the 255 non-zero values map onto 1..levels-1
+    lut = np.zeros(256, dtype=np.int32)
+    lut[1:] = 1 + (np.arange(255) * (levels - 1)) // 255
+    return lut
+
+
+def _cooccurrence(im8: np.ndarray, levels: int) -> np.ndarray:
+    """
+    (4, levels, levels) symmetric co-occurrence counts of `im8` quantized to
+    `levels`, at distance 1 in the four _GLCM_OFFSETS directions, from a single
+    np.bincount over the pair codes (direction, level a, level b) of all four.
+    Pairs are only formed inside the bounding box of the non-zero pixels; the
+    ones outside involve background and would be dropped by ignore_zeros anyway.
+    """
+    rows, cols = np.flatnonzero(im8.any(axis=1)), np.flatnonzero(im8.any(axis=0))
+    if rows.size:
+        im8 = im8[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    lut = _quantization_lut(levels)
+    q = np.take(lut.astype(np.uint8), im8)
+    qa = np.take(lut * levels, im8)               # first pixel of the pair, pre-scaled
+    h, w = im8.shape
+    sizes = [max(h - dy, 0) * max(w - abs(dx), 0) for dy, dx in _GLCM_OFFSETS]
+    codes = np.empty(sum(sizes), dtype=np.int32)
+    start = 0
+    for d, (dy, dx) in enumerate(_GLCM_OFFSETS):
+        out = codes[start:start + sizes[d]].reshape(max(h - dy, 0), max(w - abs(dx), 0))
+        np.add(qa[:h - dy, max(0, -dx):w - max(0, dx)], q[dy:, max(0, dx):w - max(0, -dx)],
+               out=out, casting="unsafe")
+        out += d * levels * levels
+        start += sizes[d]
+    counts = np.bincount(codes, minlength=4 * levels * levels).reshape(4, levels, levels)
+    return counts + counts.transpose(0, 2, 1)
+
+
+def _entropies(p: np.ndarray) -> np.ndarray:
+    # -sum p log2 p over all but the first axis (0 log 0 = 0)
+    p = p.reshape(len(p), -1)
+    return -np.einsum("dk,dk->d", p, np.log2(np.where(p > 0, p, 1.0)))
+
+
+def _haralick_from_counts(counts: np.ndarray, ignore_zeros: bool = True, size: Optional[int] = None) -> np.ndarray:
+    """
+    (directions, 13) Haralick features of (directions, L, L) co-occurrence counts,
+    vectorized over the directions. Same definitions as mahotas.features.haralick
+    (defaults), so the exact texture path and this one differ only in the levels.
+    size: the matrix size mahotas would use, i.e. the image's maximum level + 1
+    (default L). Only the difference variance depends on it: it is the variance
+    of p_{|x-y|} over that many entries, zeros included.
+    """
+    counts = counts.astype(np.float64)
+    if ignore_zeros:
+        counts[:, 0, :] = 0
+        counts[:, :, 0] = 0
+    n_dir, L = counts.shape[0], counts.shape[1]
+    T = counts.sum(axis=(1, 2))
+    if not T.all():
+        raise ValueError("GLCM is empty (no non-zero neighbouring pixels)")
+    p = counts / T[:, None, None]
+
+    k = np.arange(L, dtype=np.float64)
+    i, j = np.mgrid[:L, :L]
+    px = p.sum(axis=1)                 # symmetric matrices: px == py
+    py = p.sum(axis=2)
+    ux, uy = px @ k, py @ k
+    vx, vy = px @ k ** 2 - ux ** 2, py @ k ** 2 - uy ** 2
+    sx, sy = np.sqrt(vx), np.sqrt(vy)
+
+    # p_{x+y} (length 2L) and p_{|x-y|} (length L), all directions in one bincount each
+    offsets = np.arange(n_dir)[:, None]
+    p_flat = p.reshape(n_dir, -1)
+    plus = np.bincount((offsets * 2 * L + (i + j).ravel()).ravel(), p_flat.ravel(),
+                       minlength=n_dir * 2 * L).reshape(n_dir, 2 * L)
+    minus = np.bincount((offsets * L + np.abs(i - j).ravel()).ravel(), p_flat.ravel(),
+                        minlength=n_dir * L).reshape(n_dir, L)
+    tk = np.arange(2 * L, dtype=np.float64)
+
+    feats = np.zeros((n_dir, 13))
+    feats[:, 0] = np.einsum("dk,dk->d", p_flat, p_flat)
+    feats[:, 1] = minus @ k ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = (p_flat @ (i * j).ravel().astype(np.float64) - ux * uy) / sx / sy
+    feats[:, 2] = np.where((sx == 0) | (sy == 0), 1.0, corr)
+    feats[:, 3] = vx
+    feats[:, 4] = p_flat @ (1.0 / (1.0 + (i - j) ** 2)).ravel()
+    feats[:, 5] = plus @ tk
+    feats[:, 7] = _entropies(plus)
+    feats[:, 6] = plus @ tk ** 2 - feats[:, 5] ** 2
+    feats[:, 8] = _entropies(p)
+    feats[:, 9] = minus[:, :size or L].var(axis=1)
+    feats[:, 10] = _entropies(minus)
+
+    hx, hy = _entropies(px), _entropies(py)
+    cross = px[:, :, None] * py[:, None, :]
+    log_cross = np.log2(np.where(cross > 0, cross, 1.0))
+    hxy1 = -np.einsum("dij,dij->d", p, log_cross)
+    hxy2 = -np.einsum("dij,dij->d", cross, log_cross)
+    hmax = np.maximum(hx, hy)
+    feats[:, 11] = (feats[:, 8] - hxy1) / np.where(hmax == 0, 1.0, hmax)
+    feats[:, 12] = np.sqrt(np.maximum(0.0, 1.0 - np.exp(-2.0 * (hxy2 - feats[:, 8]))))
+    return feats
+
+
+def fast_haralick(im8: np.ndarray, levels: int = 64) -> np.ndarray:
+    """(4, 13) Haralick features (ignore_zeros) of `im8` quantized to `levels` gray levels."""
+    size = int(_quantization_lut(levels)[im8.max()]) + 1 if im8.size else None
+    return _haralick_from_counts(_cooccurrence(im8, levels), size=size)
+
+
+def equalize(img: np.ndarray) -> np.ndarray:
+    """Adaptive contrast normalization (CLAHE) every image goes through first."""
+    return exposure.equalize_adapthist(img, clip_limit=0.02)
+
+
 def _nan_safe(val: float, default: float = 0.0) -> float:
     return float(val) if np.isfinite(val) else float(default)
 
@@ -69,19 +344,166 @@ def _quantiles(a: np.ndarray, qs=(25, 50, 75)) -> Tuple[float, ...]:
         return tuple(0.0 for _ in qs)
 
 
+# -------------------------------------------------------------------------
+# Per-image context (shared intermediates)
+# -------------------------------------------------------------------------
+
+class ImageContext:
+    """
+    Intermediates shared by the feature groups of one image, each computed on
+    first use and at most once. `img` is the image the groups see (CLAHE +
+    ROI-masked). A step that raises is not cached, so every consumer sees the
+    same exception it would have hit computing the step itself.
+
+    With ExtractionOptions.roi_crop, `img` is the window `crop` (the ROI's
+    bounding box plus a margin) of the masked frame `full`. Everything outside
+    the window is masked to 0, and so is every filter response there, so the
+    groups compute whole-frame values from the window: statistics over the
+    frame go through frame_stats, areas use `n_pixels`, and the cheap
+    whole-frame steps (histogram, asymmetry, Otsu) read `full`.
+    """
+
+    def __init__(self, img: np.ndarray, full: Optional[np.ndarray] = None,
+                 crop: Optional[Tuple[slice, slice]] = None, options: Optional[ExtractionOptions] = None):
+        self.img = img
+        self.options = options or ExtractionOptions()
+        self.full = img if full is None else full
+        self.crop = crop
+        self.n_pixels = int(self.full.shape[0] * self.full.shape[1])
+        self._tensors: Dict[float, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._coherence: Dict[float, np.ndarray] = {}
+        self._groups: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def from_path(cls, image_path: str, options: Optional[ExtractionOptions] = None,
+                  downscale_max: int = 1024) -> "ImageContext":
+        img = load_grayscale(image_path, options, downscale_max)
+
+        # 1) Adaptive contrast normalization (CLAHE)
+        img = equalize(img)
+        return cls.from_equalized(img, options)
+
+    @classmethod
+    def from_equalized(cls, img: np.ndarray, options: Optional[ExtractionOptions] = None) -> "ImageContext":
+        """Context of a CLAHE-equalized image: Otsu ROI mask, then the optional ROI crop."""
+        # 2) ROI masking using Otsu threshold (ignore dark background)
+        roi_mask = None
+        try:
+            thr = threshold_otsu(img)
+            roi_mask = img > thr
+            if np.sum(roi_mask) > 1000:
+                img = img * roi_mask
+            else:
+                roi_mask = None
+        except Exception:
+            pass
+
+        # 3) Optional crop to the ROI's bounding box (+ margin)
+        if options is not None and options.roi_crop and roi_mask is not None:
+            rows, cols = np.flatnonzero(roi_mask.any(axis=1)), np.flatnonzero(roi_mask.any(axis=0))
+            m = int(options.roi_margin)
+            crop = (slice(max(rows[0] - m, 0), rows[-1] + 1 + m), slice(max(cols[0] - m, 0), cols[-1] + 1 + m))
+            if img[crop].size < img.size:
+                return cls(img[crop], full=img, crop=crop, options=options)
+        return cls(img, options=options)
+
+    def frame_stats(self, a: np.ndarray, nan: bool = False) -> Tuple[float, float]:
+        """
+        Mean and std over the whole frame of `a`, a response computed on `img`
+        (0 outside the crop); nan=True ignores NaNs (np.nanmean / np.nanstd).
+        """
+        if self.crop is None:
+            return (np.nanmean(a), np.nanstd(a)) if nan else (a.mean(), a.std())
+        if nan:
+            a = a[~np.isnan(a)]
+        n = self.n_pixels - (self.img.size - a.size)
+        if n <= 0:
+            return np.nan, np.nan
+        mean = a.sum(dtype=np.float64) / n
+        var = (np.square(a - mean, dtype=np.float64).sum() + (n - a.size) * mean ** 2) / n
+        return float(mean), float(np.sqrt(var))
+
+    @cached_property
+    def im8(self) -> np.ndarray:
+        return (self.img * 255).astype(np.uint8)
+
+    @cached_property
+    def haralick(self) -> np.ndarray:
+        """(4 directions, 13) Haralick features; ignore_zeros so ROI-masked background does not dominate."""
+        if self.options.texture == "fast":
+            return fast_haralick(self.im8, self.options.glcm_levels)
+        return mahotas.features.haralick(self.im8, distance=1, ignore_zeros=True)
+
+    @cached_property
+    def sobel(self) -> np.ndarray:
+        return sobel(self.img)
+
+    @cached_property
+    def otsu(self) -> float:
+        return threshold_otsu(self.full)
+
+    @cached_property
+    def mask(self) -> np.ndarray:
+        return morphology.remove_small_objects(self.img > self.otsu, min_size=500)
+
+    @cached_property
+    def region(self):
+        """Largest connected region of the Otsu mask (None if there is none)."""
+        regions = measure.regionprops(measure.label(self.mask))
+        return max(regions, key=lambda x: x.area) if regions else None
+
+    @cached_property
+    def ring(self) -> np.ndarray:
+        """Boundary ring of `region` in full-image coordinates, dilated by disk(3)."""
+        r = self.region
+        boundary = morphology.binary_dilation(r.image) ^ morphology.binary_erosion(r.image)
+        ring = np.zeros_like(self.mask, dtype=bool)
+        minr, minc, maxr, maxc = r.bbox
+        ring[minr:maxr, minc:maxc] = boundary
+        return morphology.binary_dilation(ring, morphology.disk(3))
+
+    @cached_property
+    def _derivatives(self) -> Tuple[np.ndarray, np.ndarray]:
+        # structure_tensor's axis derivatives (Sobel, zero padding); shared by every sigma
+        image = util.img_as_float(np.squeeze(self.img))
+        return tuple(ndi.sobel(image, axis=i, mode="constant", cval=0) for i in range(2))
+
+    def structure_tensor(self, sigma: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Same as skimage structure_tensor(img, sigma) (Arr, Arc, Acc)."""
+        if sigma not in self._tensors:
+            dr, dc = self._derivatives
+            self._tensors[sigma] = tuple(gaussian(a * b, sigma=sigma, mode="constant", cval=0)
+                                         for a, b in ((dr, dr), (dr, dc), (dc, dc)))
+        return self._tensors[sigma]
+
+    def coherence(self, sigma: float) -> np.ndarray:
+        """(l1 - l2) / (l1 + l2) of the structure tensor's eigenvalues."""
+        if sigma not in self._coherence:
+            # Manual eigenvalue computation (replacement for removed structure_tensor_eigvals)
+            Axx, Axy, Ayy = self.structure_tensor(sigma)
+            tmp = np.sqrt((Axx - Ayy) ** 2 + 4 * Axy ** 2)
+            l1 = 0.5 * (Axx + Ayy + tmp)
+            l2 = 0.5 * (Axx + Ayy - tmp)
+            self._coherence[sigma] = (l1 - l2) / (l1 + l2 + 1e-8)
+        return self._coherence[sigma]
+
+    def group(self, name: str) -> Dict[str, float]:
+        """Features of one FEATURE_GROUPS entry (computed once)."""
+        if name not in self._groups:
+            self._groups[name] = FEATURE_GROUPS[name].fn(self)
+        return self._groups[name]
+
+
 # -------------------------------------------------------------------------
 # Feature groups
 # -------------------------------------------------------------------------
 
-def _glcm_features(img: np.ndarray) -> dict[str, float]:
+def _glcm_features(ctx: ImageContext) -> dict[str, float]:
     """
     IMPORTANT: ignore_zeros=True to avoid background zeros (from ROI masking)
     dominating co-occurrence counts.
     """
-    im8 = (img * 255).astype(np.uint8)
-    feats = mahotas.features.haralick(
-        im8, distance=1, ignore_zeros=True  # ← key change
-    ).mean(axis=0)
+    feats = ctx.haralick.mean(axis=0)
     names = [
         "ASM", "contrast", "correlation", "variance",
         "IDM", "sum_avg", "sum_var", "sum_entropy",
@@ -91,8 +513,8 @@ def _glcm_features(img: np.ndarray) -> dict[str, float]:
     return {f"glcm_{n}": float(v) for n, v in zip(names, feats)}
 
 
-def _histogram_features(img: np.ndarray) -> Dict[str, float]:
-    vals = img.ravel().astype(np.float32)
+def _histogram_features(ctx: ImageContext) -> Dict[str, float]:
+    vals = ctx.full.ravel().astype(np.float32)
     vals = vals[np.isfinite(vals)]
     mean = _nan_safe(vals.mean())
     std  = _nan_safe(vals.std())
@@ -112,24 +534,15 @@ def _histogram_features(img: np.ndarray) -> Dict[str, float]:
     }
 
 
-def _edge_gradient_features(img: np.ndarray) -> Dict[str, float]:
-    sob = sobel(img)
-    sob_mean = _nan_safe(sob.mean())
-    sob_std  = _nan_safe(sob.std())
+def _edge_gradient_features(ctx: ImageContext) -> Dict[str, float]:
+    img = ctx.img
+    sob_mean, sob_std = map(_nan_safe, ctx.frame_stats(ctx.sobel))
 
-    sigma = max(0.8, 0.002 * max(img.shape))
+    sigma = max(0.8, 0.002 * max(ctx.full.shape))
     can = canny(img, sigma=sigma)
-    edge_ratio = float(can.mean())
-
-    # Manual eigenvalue computation (replacement for removed structure_tensor_eigvals)
-    Axx, Axy, Ayy = structure_tensor(img, sigma=1.0)
-    tmp = np.sqrt((Axx - Ayy) ** 2 + 4 * Axy ** 2)
-    l1 = 0.5 * (Axx + Ayy + tmp)
-    l2 = 0.5 * (Axx + Ayy - tmp)
+    edge_ratio = float(can.mean()) if ctx.crop is None else float(can.sum() / ctx.n_pixels)
 
-    coherence = (l1 - l2) / (l1 + l2 + 1e-8)
-    coh_mean = _nan_safe(np.nanmean(coherence))
-    coh_std  = _nan_safe(np.nanstd(coherence))
+    coh_mean, coh_std = map(_nan_safe, ctx.frame_stats(ctx.coherence(1.0), nan=True))
 
     return {
         "edge_sobel_mean": sob_mean,
@@ -140,19 +553,22 @@ def _edge_gradient_features(img: np.ndarray) -> Dict[str, float]:
     }
 
 
-def _sharpness_features(img: np.ndarray) -> Dict[str, float]:
-    lap = laplace(img, ksize=3)
-    return {"sharp_lap_var": _nan_safe(lap.var())}
+def _sharpness_features(ctx: ImageContext) -> Dict[str, float]:
+    lap = laplace(ctx.img, ksize=3)
+    return {"sharp_lap_var": _nan_safe(ctx.frame_stats(lap)[1] ** 2 if ctx.crop is not None else lap.var())}
 
 
-def _blob_calcification_features(img: np.ndarray) -> Dict[str, float]:
-    img_eq = exposure.equalize_adapthist(img, clip_limit=0.01)
+def _blob_calcification_features(ctx: ImageContext) -> Dict[str, float]:
+    # second CLAHE pass (on the already equalized image) is part of the feature definition;
+    # its tiles follow the frame, so it runs on the whole frame and only blob_log is cropped
+    img_eq = exposure.equalize_adapthist(ctx.full, clip_limit=0.01)
+    if ctx.crop is not None:
+        img_eq = img_eq[ctx.crop]
     blobs = blob_log(img_eq, min_sigma=1.2, max_sigma=3.5,
                      num_sigma=6, threshold=0.02)
     radii = (np.sqrt(2) * blobs[:, 2]).astype(np.float32) if blobs.size else np.array([], dtype=np.float32)
 
-    h, w = img.shape[:2]
-    area = float(h * w)
+    area = float(ctx.n_pixels)
     count = int(len(radii))
     density = float(count / (area + 1e-8))
 
@@ -164,7 +580,8 @@ def _blob_calcification_features(img: np.ndarray) -> Dict[str, float]:
     }
 
 
-def _asymmetry_features(img: np.ndarray) -> Dict[str, float]:
+def _asymmetry_features(ctx: ImageContext) -> Dict[str, float]:
+    img = ctx.full
     h, w = img.shape
     mid = w // 2
     left  = img[:, :mid]
@@ -179,7 +596,7 @@ def _asymmetry_features(img: np.ndarray) -> Dict[str, float]:
     }
 
 
-def _shape_and_spiculation_features(img: np.ndarray) -> Dict[str, float]:
+def _shape_and_spiculation_features(ctx: ImageContext) -> Dict[str, float]:
     feats = {
         "shape_area": 0.0, "shape_perimeter": 0.0,
         "shape_circularity": 0.0, "shape_eccentricity": 0.0,
@@ -188,16 +605,10 @@ def _shape_and_spiculation_features(img: np.ndarray) -> Dict[str, float]:
     }
 
     try:
-        thr = threshold_otsu(img)
-        mask = img > thr
-        mask = morphology.remove_small_objects(mask, min_size=500)
-        labeled = measure.label(mask)
-        regions = measure.regionprops(labeled)
-
-        if not regions:
+        r = ctx.region
+        if r is None:
             return feats
 
-        r = max(regions, key=lambda x: x.area)
         feats["shape_area"] = float(r.area)
         feats["shape_perimeter"] = float(r.perimeter)
         if r.perimeter > 0 and r.area > 0:
@@ -206,25 +617,17 @@ def _shape_and_spiculation_features(img: np.ndarray) -> Dict[str, float]:
         feats["shape_solidity"] = float(getattr(r, "solidity", 0.0))
         feats["shape_extent"] = float(getattr(r, "extent", 0.0))
 
-        # Build a ring mask in full-image coordinates
-        boundary = morphology.binary_dilation(r.image) ^ morphology.binary_erosion(r.image)
-        ring = np.zeros_like(mask, dtype=bool)
-        minr, minc, maxr, maxc = r.bbox
-        ring[minr:maxr, minc:maxc] = boundary
-        ring = morphology.binary_dilation(ring, morphology.disk(3))
+        ring = ctx.ring
 
         # Edge density inside ring
-        sob = sobel(img)
-        edge_bin = sob > (sob.mean() + sob.std())
+        sob = ctx.sobel
+        sob_mean, sob_std = ctx.frame_stats(sob)
+        edge_bin = sob > (sob_mean + sob_std)
         if ring.sum() > 50:
             feats["spic_edge_ring_ratio"] = float(edge_bin[ring].mean())
 
         # Orientation dispersion in ring (structure tensor)
-        Axx, Axy, Ayy = structure_tensor(img, sigma=1.2)
-        tmp = np.sqrt((Axx - Ayy) ** 2 + 4 * Axy ** 2)
-        l1 = 0.5 * (Axx + Ayy + tmp)
-        l2 = 0.5 * (Axx + Ayy - tmp)
-        coherence = (l1 - l2) / (l1 + l2 + 1e-8)
+        coherence = ctx.coherence(1.2)
         ring_coh = coherence[ring] if ring.any() else coherence
         feats["spic_orient_dispersion"] = _nan_safe(np.nanstd(ring_coh))
     except Exception:
@@ -233,78 +636,117 @@ def _shape_and_spiculation_features(img: np.ndarray) -> Dict[str, float]:
     return feats
 
 
-# -------------------------------------------------------------------------
-# Main API
-# -------------------------------------------------------------------------
-
-def extract_image_features(image_path: str) -> Dict[str, float]:
-    """
-    Enhanced image feature extraction for mammograms.
-    Includes adaptive contrast normalization, ROI masking, and normalized features.
-    """
-    img = _safe_load_grayscale(image_path)
-
-    # 1) Adaptive contrast normalization (CLAHE)
-    img = exposure.equalize_adapthist(img, clip_limit=0.02)
-
-    # 2) ROI masking using Otsu threshold (ignore dark background)
+def _spiculation_edge_density(ctx: ImageContext) -> float:
+    """Mean Sobel magnitude in the boundary ring of the largest Otsu region."""
     try:
-        thr = threshold_otsu(img)
-        roi_mask = img > thr
-        if np.sum(roi_mask) > 1000:
-            img = img * roi_mask
+        sob = ctx.sobel
+        if ctx.region is None:
+            return 0.0
+        ring = ctx.ring
+        return float(np.mean(sob[ring])) if ring.sum() > 50 else 0.0
     except Exception:
-        pass
+        return 0.0
 
-    feats: Dict[str, float] = {}
 
-    # 3) Core radiomic features
-    feats.update(_glcm_features(img))
-    feats.update(_histogram_features(img))
-    feats.update(_edge_gradient_features(img))
-    feats.update(_sharpness_features(img))
-    feats.update(_blob_calcification_features(img))
-    feats.update(_asymmetry_features(img))
-    feats.update(_shape_and_spiculation_features(img))
+def _spic_edge_density_features(ctx: ImageContext) -> Dict[str, float]:
+    # Extra spiculation metric (edge density near boundary)
+    return {"spic_edge_density": _spiculation_edge_density(ctx)}
 
-    # 4) Extra spiculation metric (edge density near boundary)
-    try:
-        sob = sobel(img)
-        thr = threshold_otsu(img)
-        mask = img > thr
-        mask = morphology.remove_small_objects(mask, min_size=500)
-        labeled = measure.label(mask)
-        regions = measure.regionprops(labeled)
-        if regions:
-            r = max(regions, key=lambda x: x.area)
-            boundary = morphology.binary_dilation(r.image) ^ morphology.binary_erosion(r.image)
-            ring = np.zeros_like(mask, dtype=bool)
-            minr, minc, maxr, maxc = r.bbox
-            ring[minr:maxr, minc:maxc] = boundary
-            ring = morphology.binary_dilation(ring, morphology.disk(3))
-            feats["spic_edge_density"] = float(np.mean(sob[ring])) if ring.sum() > 50 else 0.0
-        else:
-            feats["spic_edge_density"] = 0.0
-    except Exception:
-        feats["spic_edge_density"] = 0.0
 
-    # 5) Directional GLCM variance (texture consistency across directions)
+def _glcm_direction_features(ctx: ImageContext) -> Dict[str, float]:
+    # Directional GLCM variance (texture consistency across directions)
     try:
-        im8 = (img * 255).astype(np.uint8)
-        glcm_all = mahotas.features.haralick(im8, distance=1, ignore_zeros=True)
-        feats["glcm_direction_var"] = float(np.var(glcm_all, axis=0).mean())
+        return {"glcm_direction_var": float(np.var(ctx.haralick, axis=0).mean())}
     except Exception:
-        feats["glcm_direction_var"] = 0.0
+        return {"glcm_direction_var": 0.0}
+
 
-    # 6) Shape normalization (relative to total image area)
+def _shape_norm_features(ctx: ImageContext) -> Dict[str, float]:
+    # Shape normalization (relative to total image area)
     try:
-        h, w = img.shape[:2]
-        area = float(h * w)
-        feats["shape_norm_area"] = feats.get("shape_area", 0.0) / (area + 1e-6)
+        area = float(ctx.n_pixels)
+        return {"shape_norm_area": ctx.group("shape").get("shape_area", 0.0) / (area + 1e-6)}
     except Exception:
-        feats["shape_norm_area"] = 0.0
+        return {"shape_norm_area": 0.0}
+
+
+# -------------------------------------------------------------------------
+# Feature -> group dependency map
+# -------------------------------------------------------------------------
+
+class FeatureGroup(NamedTuple):
+    fn: Callable[[ImageContext], Dict[str, float]]
+    names: Tuple[str, ...]          # features the group returns
+    needs: Tuple[str, ...] = ()     # groups whose results fn reads (ctx.group)
+
+
+# In output order. Shared intermediates (Haralick matrices, Sobel, Otsu region / ring,
+# structure tensors) live on ImageContext and are computed only if a group uses them.
+FEATURE_GROUPS: Dict[str, FeatureGroup] = {
+    "glcm": FeatureGroup(_glcm_features, tuple(f"glcm_{n}" for n in (
+        "ASM", "contrast", "correlation", "variance", "IDM", "sum_avg", "sum_var", "sum_entropy",
+        "entropy", "diff_var", "diff_entropy", "IMC1", "IMC2"))),
+    "histogram": FeatureGroup(_histogram_features, (
+        "hist_mean", "hist_std", "hist_skew", "hist_kurtosis", "hist_q25", "hist_q50", "hist_q75",
+        "density_index")),
+    "edge": FeatureGroup(_edge_gradient_features, (
+        "edge_sobel_mean", "edge_sobel_std", "edge_ratio", "grad_coherence_mean", "grad_coherence_std")),
+    "sharpness": FeatureGroup(_sharpness_features, ("sharp_lap_var",)),
+    "blob": FeatureGroup(_blob_calcification_features, (
+        "blob_count", "blob_density", "blob_radius_mean", "blob_radius_std")),
+    "asymmetry": FeatureGroup(_asymmetry_features, ("asym_absdiff_mean", "asym_absdiff_std", "asym_mean_diff")),
+    "shape": FeatureGroup(_shape_and_spiculation_features, (
+        "shape_area", "shape_perimeter", "shape_circularity", "shape_eccentricity", "shape_solidity",
+        "shape_extent", "spic_edge_ring_ratio", "spic_orient_dispersion")),
+    "spic_edge_density": FeatureGroup(_spic_edge_density_features, ("spic_edge_density",)),
+    "glcm_direction": FeatureGroup(_glcm_direction_features, ("glcm_direction_var",)),
+    "shape_norm": FeatureGroup(_shape_norm_features, ("shape_norm_area",), needs=("shape",)),
+}
+
+FEATURE_NAMES: Tuple[str, ...] = tuple(n for g in FEATURE_GROUPS.values() for n in g.names)
+_GROUP_OF = {n: name for name, g in FEATURE_GROUPS.items() for n in g.names}
+
+
+def groups_for(required: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Groups (dependencies included, in output order) that compute the `required`
+    feature names; None = every group. Names no group produces are ignored.
+    """
+    if required is None:
+        return list(FEATURE_GROUPS)
+    todo = [_GROUP_OF[n] for n in required if n in _GROUP_OF]
+    needed = set()
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(FEATURE_GROUPS[name].needs)
+    return [name for name in FEATURE_GROUPS if name in needed]
+
+
+# -------------------------------------------------------------------------
+# Main API
+# -------------------------------------------------------------------------
+
+def extract_image_features(image_path: str, options: Optional[ExtractionOptions] = None,
+                           required: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    Enhanced image feature extraction for mammograms.
+    Includes adaptive contrast normalization, ROI masking, and normalized features.
+    All groups share one ImageContext (one Otsu mask / region / ring, Sobel, Haralick
+    and structure-tensor derivative pass per image).
+    options : ExtractionOptions (default: exact decode, the original behaviour)
+    required: feature names the caller needs (None = all). Only the groups they
+              depend on run; the result holds those groups' features, a superset
+              of `required`, with the same values as a full extraction.
+    """
+    ctx = ImageContext.from_path(image_path, options)
+
+    feats: Dict[str, float] = {}
+    for name in groups_for(required):
+        feats.update(ctx.group(name))
 
-    # 7) NaN/Inf guard
+    # NaN/Inf guard
     for k, v in list(feats.items()):
         feats[k] = _nan_safe(v, 0.0)
 
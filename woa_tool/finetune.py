@@ -0,0 +1,97 @@
+"""
+Greedy / pairwise flip fine-tuning shared by the training entry points.
+
+Candidates are evaluated in waves against the current incumbent. With
+accept="first" the first improving candidate in deterministic order wins, and
+the rest of its wave is re-issued against the new incumbent. This gives exactly
+the result of trying the moves one at a time, but a wave can be evaluated in
+parallel. With accept="best" the best improvement in the wave wins.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+# evaluate(mask) -> (score, payload); payload is handed to `commit`
+Evaluation = Tuple[float, Any]
+
+
+def flip(mask: np.ndarray, move: Sequence[int]) -> np.ndarray:
+    cand = mask.copy()
+    for i in move:
+        cand[i] = 1 - cand[i]
+    return cand
+
+
+def flip_search(
+    evaluate: Callable[[np.ndarray], Evaluation],
+    mask: np.ndarray,
+    score: float,
+    moves: Sequence[Sequence[int]],
+    tol: float = 0.0,
+    workers: int = 1,
+    wave_size: Optional[int] = None,
+    accept: str = "first",
+    commit: Optional[Callable[[Any], None]] = None,
+    on_accept: Optional[Callable[[Sequence[int], float], None]] = None,
+    executor: Optional[Executor] = None,
+) -> Tuple[np.ndarray, float]:
+    """
+    Try each move (a tuple of feature indices to flip) against the incumbent;
+    a candidate is accepted when its score < incumbent - tol.
+
+    commit    : called with the payload of every evaluation the serial loop would
+                have made, in that order (speculative results that get discarded
+                are never committed)
+    on_accept : called with (move, score) for every accepted move
+    executor  : optional pool to map over; otherwise a thread pool of `workers`
+    Returns (best_mask, best_score).
+    """
+    if accept not in ("first", "best"):
+        raise ValueError(f"Unknown accept mode: {accept}")
+    best_mask = np.asarray(mask).copy()
+    best_score = float(score)
+    pending = [tuple(m) for m in moves]
+    wave_size = max(1, int(wave_size or workers or 1))
+
+    own_pool = None
+    if executor is None and workers > 1:
+        executor = own_pool = ThreadPoolExecutor(max_workers=workers)
+    run = executor.map if executor is not None else map
+
+    try:
+        while pending:
+            wave = pending[:wave_size]
+            cands = [flip(best_mask, mv) for mv in wave]
+            results = list(run(evaluate, cands))
+            improving = [i for i, (s, _) in enumerate(results) if s < best_score - tol]
+
+            if accept == "first":
+                hit = improving[0] if improving else None
+                used = len(wave) if hit is None else hit + 1
+                if commit is not None:
+                    for _, payload in results[:used]:
+                        commit(payload)
+                pending = pending[used:]
+            else:
+                hit = min(improving, key=lambda i: (results[i][0], i)) if improving else None
+                if commit is not None:
+                    for _, payload in results:
+                        commit(payload)
+                if hit is None:
+                    pending = pending[len(wave):]
+                else:
+                    # everything else in the wave is retried against the new incumbent
+                    pending = wave[:hit] + wave[hit + 1:] + pending[len(wave):]
+
+            if hit is not None:
+                best_mask, best_score = cands[hit], float(results[hit][0])
+                if on_accept is not None:
+                    on_accept(wave[hit], best_score)
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+
+    return best_mask, best_score
@@ -5,5 +5,9 @@ from typing import Callable
 
 
 def evaluate_population(pop: np.ndarray, objective: Callable[[np.ndarray], float]) -> np.ndarray:
+    # objectives that can score a whole population in one pass expose batch(pop) -> fitness
+    batch = getattr(objective, "batch", None)
+    if callable(batch):
+        return np.asarray(batch(pop), dtype=float)
     return np.array([objective(ind) for ind in pop], dtype=float)
 
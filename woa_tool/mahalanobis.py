@@ -0,0 +1,255 @@
+"""
+Cholesky-based Mahalanobis scoring for the ratio classifier.
+
+Distances are computed with a triangular solve against the Cholesky factor of
+the pooled covariance; a pseudo-inverse is only used when the matrix is not
+positive definite. Factors support adding/removing one feature at a time
+(bordered extension / rank-one update), so subsets that differ from a cached
+neighbour by a few flips are refactored in O(k^2) instead of from scratch.
+
+Factorization always runs in float64. A factor's `dtype` is only the precision
+of the scoring kernel: float32 factors solve against a float32 copy of L.
+"""
+
+from __future__ import annotations
+
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence
+from scipy.linalg import cho_solve, solve_triangular
+
+
+def _chol_update(L: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Return the factor of L L^T + x x^T (rank-one update, O(k^2))."""
+    L = L.copy()
+    x = x.copy()
+    n = x.shape[0]
+    for k in range(n):
+        r = np.hypot(L[k, k], x[k])
+        c = r / L[k, k]
+        s = x[k] / L[k, k]
+        L[k, k] = r
+        if k + 1 < n:
+            L[k + 1:, k] = (L[k + 1:, k] + s * x[k + 1:]) / c
+            x[k + 1:] = c * x[k + 1:] - s * L[k + 1:, k]
+    return L
+
+
+class CholeskyFactor:
+    """Factor of an SPD matrix over an ordered feature subset.
+
+    `order` lists the feature indices of the matrix rows/columns; callers must
+    slice their data in that order. If Cholesky fails, the pseudo-inverse is
+    kept instead and incremental updates are unavailable. `dtype` is the
+    precision distances are computed in.
+    """
+
+    def __init__(self, S: np.ndarray, order: Sequence[int], dtype=np.float64):
+        self.order = np.asarray(order, dtype=int)
+        self.dtype = np.dtype(dtype)
+        self._kernel: Optional[np.ndarray] = None
+        S = np.asarray(S, dtype=np.float64)
+        try:
+            self.L: Optional[np.ndarray] = np.linalg.cholesky(S)
+            self.pinv: Optional[np.ndarray] = None
+        except np.linalg.LinAlgError:
+            self.L = None
+            self.pinv = np.linalg.pinv(S)
+
+    @classmethod
+    def _from_lower(cls, L: np.ndarray, order: Sequence[int], dtype=np.float64) -> "CholeskyFactor":
+        f = cls.__new__(cls)
+        f.order = np.asarray(order, dtype=int)
+        f.dtype = np.dtype(dtype)
+        f._kernel = None
+        f.L = L
+        f.pinv = None
+        return f
+
+    @property
+    def is_cholesky(self) -> bool:
+        return self.L is not None
+
+    def sq_mahalanobis(self, Z: np.ndarray) -> np.ndarray:
+        """Squared distances z^T S^-1 z for rows of Z (n, k) or a single z (k,)."""
+        Z = np.asarray(Z, dtype=self.dtype)
+        single = Z.ndim == 1
+        Z2 = Z[None, :] if single else Z
+        if self._kernel is None:
+            M = self.L if self.L is not None else self.pinv
+            self._kernel = M.astype(self.dtype, copy=False)
+        if self.L is not None:
+            W = solve_triangular(self._kernel, Z2.T, lower=True, check_finite=False)
+            d2 = np.einsum("ij,ij->j", W, W)
+        else:
+            d2 = np.maximum(np.einsum("bi,ij,bj->b", Z2, self._kernel, Z2), 0.0)
+        return d2[0] if single else d2
+
+    def inverse(self) -> np.ndarray:
+        """Dense S^-1 (for persisting as Sp_inv)."""
+        if self.L is None:
+            return self.pinv
+        return cho_solve((self.L, True), np.eye(self.L.shape[0]), check_finite=False)
+
+    def add(self, feature: int, col: np.ndarray, diag: float) -> Optional["CholeskyFactor"]:
+        """Append `feature` (bordered extension).
+
+        col  : covariances between `feature` and the current subset (in `order`)
+        diag : variance of `feature`
+        Returns None if the extended matrix is not positive definite.
+        """
+        if self.L is None:
+            return None
+        k = self.L.shape[0]
+        l = solve_triangular(self.L, np.asarray(col, dtype=np.float64), lower=True, check_finite=False) if k else np.zeros(0)
+        d2 = float(diag) - float(l @ l)
+        if not np.isfinite(d2) or d2 <= 0.0:
+            return None
+        L = np.zeros((k + 1, k + 1))
+        L[:k, :k] = self.L
+        L[k, :k] = l
+        L[k, k] = np.sqrt(d2)
+        return CholeskyFactor._from_lower(L, np.append(self.order, int(feature)), self.dtype)
+
+    def remove(self, feature: int) -> Optional["CholeskyFactor"]:
+        """Drop `feature`; the trailing block absorbs its column via a rank-one update."""
+        if self.L is None:
+            return None
+        pos = np.where(self.order == int(feature))[0]
+        if pos.size == 0:
+            return None
+        p = int(pos[0])
+        keep = np.delete(np.arange(self.L.shape[0]), p)
+        L = self.L[np.ix_(keep, keep)].copy()
+        if p < L.shape[0]:
+            L[p:, p:] = _chol_update(L[p:, p:], self.L[p + 1:, p])
+        return CholeskyFactor._from_lower(L, self.order[keep], self.dtype)
+
+
+def batch_ratio_distances(L: np.ndarray,
+                          X: np.ndarray,
+                          mu_b: np.ndarray,
+                          mu_m: np.ndarray,
+                          idx: np.ndarray,
+                          dtype=np.float64):
+    """Distances of the rows of X to both class means for a stack of subset factors.
+
+    L          : (m, k, k) lower Cholesky factors, one per candidate subset
+    X          : (n, d) samples over all features
+    mu_b, mu_m : (d,) class means over all features
+    idx        : (m, k) feature columns of each candidate, in factor order
+    Returns (dB, dM), each (m, n). One batched product with L^-1 covers the
+    samples and both means: L^-1 (x - mu) = L^-1 x - L^-1 mu. (Inverting the
+    small k x k factors and using one stacked matmul is much faster than a
+    stacked np.linalg.solve with n right-hand sides.)
+    """
+    A = np.linalg.inv(np.asarray(L, dtype=np.float64))
+    return whitened_ratio_distances(A, X, mu_b, mu_m, idx, dtype)
+
+
+def whitening_batch(S: np.ndarray) -> np.ndarray:
+    """(m, k, k) matrices A with ||A z||^2 = z^T S^-1 z for a stack of SPD matrices.
+
+    A = L^-1 from the Cholesky factor; a candidate that is not positive definite
+    gets Lambda^+1/2 V^T from its eigendecomposition instead (the pseudo-inverse
+    metric over the non-negative spectrum, cf. CholeskyFactor's pinv fallback).
+    """
+    S = np.asarray(S, dtype=np.float64)
+    try:
+        return np.linalg.inv(np.linalg.cholesky(S))
+    except np.linalg.LinAlgError:
+        pass
+    out = np.empty_like(S)
+    for c, Sc in enumerate(S):
+        try:
+            out[c] = np.linalg.inv(np.linalg.cholesky(Sc))
+        except np.linalg.LinAlgError:
+            w, V = np.linalg.eigh(Sc)
+            tol = 1e-15 * np.max(np.abs(w), initial=0.0)  # np.linalg.pinv's default rcond
+            inv_sqrt = np.divide(1.0, np.sqrt(np.abs(w)), out=np.zeros_like(w), where=w > tol)
+            out[c] = inv_sqrt[:, None] * V.T
+    return out
+
+
+def whitened_ratio_distances(A: np.ndarray,
+                             X: np.ndarray,
+                             mu_b: np.ndarray,
+                             mu_m: np.ndarray,
+                             idx: np.ndarray,
+                             dtype=np.float64):
+    """batch_ratio_distances for precomputed whitening matrices A (m, k, k), e.g. L^-1."""
+    dtype = np.dtype(dtype)
+    idx = np.asarray(idx, dtype=int)
+    Xt = np.asarray(X, dtype=dtype).T[idx]                        # (m, k, n)
+    rhs = np.concatenate([Xt,
+                          np.asarray(mu_b, dtype=dtype)[idx][:, :, None],
+                          np.asarray(mu_m, dtype=dtype)[idx][:, :, None]], axis=2)
+    W = np.asarray(A).astype(dtype, copy=False) @ rhs
+    Wx, wb, wm = W[:, :, :-2], W[:, :, -2:-1], W[:, :, -1:]
+    dB = np.sqrt(np.einsum("mkn,mkn->mn", Wx - wb, Wx - wb))
+    dM = np.sqrt(np.einsum("mkn,mkn->mn", Wx - wm, Wx - wm))
+    return dB, dM
+
+
+class FactorCache:
+    """Small LRU of subset factors for one fold.
+
+    build  : idx -> (k, k) matrix for a subset (always available)
+    pooled : optional full (d, d) matrix whose principal submatrices are the
+             subset matrices. Only when such a matrix exists (the covariance
+             does not depend on which other features are selected) can a
+             factor be derived from a cached neighbour by add/remove updates.
+    dtype  : scoring precision of the factors handed out
+    """
+
+    def __init__(self,
+                 build: Callable[[np.ndarray], np.ndarray],
+                 pooled: Optional[np.ndarray] = None,
+                 size: int = 8,
+                 max_flips: int = 2,
+                 dtype=np.float64):
+        self.build = build
+        self.dtype = np.dtype(dtype)
+        self.pooled = pooled
+        self.size = int(size)
+        self.max_flips = int(max_flips)
+        self._cache: "OrderedDict[frozenset, CholeskyFactor]" = OrderedDict()
+        # fine-tuning may evaluate candidates from several threads
+        self._lock = threading.Lock()
+
+    def _derive(self, target: frozenset) -> Optional[CholeskyFactor]:
+        with self._lock:
+            entries = list(self._cache.items())
+        for key, base in reversed(entries):
+            removed = key - target
+            added = target - key
+            if len(removed) + len(added) > self.max_flips:
+                continue
+            f: Optional[CholeskyFactor] = base
+            for feat in sorted(removed):
+                f = f.remove(feat) if f is not None else None
+            for feat in sorted(added):
+                if f is None:
+                    break
+                f = f.add(feat, self.pooled[f.order, feat], self.pooled[feat, feat])
+            if f is not None:
+                return f
+        return None
+
+    def get(self, idx: Sequence[int]) -> CholeskyFactor:
+        idx = np.asarray(idx, dtype=int)
+        key = frozenset(idx.tolist())
+        with self._lock:
+            f = self._cache.get(key)
+            if f is not None:
+                self._cache.move_to_end(key)
+                return f
+        f = self._derive(key) if self.pooled is not None else None
+        if f is None:
+            f = CholeskyFactor(self.build(idx), idx, self.dtype)
+        with self._lock:
+            self._cache[key] = f
+            if len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+        return f
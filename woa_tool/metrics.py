@@ -15,6 +15,8 @@ class RunHistory:
     exploitation_count_per_iter: list = field(default_factory=list)
     # Average population diversity per iteration (if provided by the algorithm loop)
     diversity_per_iter: list = field(default_factory=list)
+    # Objective evaluations spent by the optimizer loop (NFE)
+    nfe: int = 0
 
     @property
     def exploration_ratio(self) -> float:
@@ -0,0 +1,199 @@
+"""
+Per-class sufficient statistics for subset covariance fits.
+
+The CV objective fits class means and a (shrunk) covariance for every candidate
+subset in every fold. All of those are slices of moments over the full feature
+set, so the moments are computed once per fold/class and any subset is derived
+by indexing, without touching the samples again.
+
+Moments may be accumulated and stored in float32 (precision="float32" in
+training); subset covariances are always assembled in float64 because they are
+about to be factorized.
+
+Moments of disjoint row blocks (e.g. data shards) can be merged exactly with
+ClassMoments.merge when each block also carries its third-order cross moments.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+
+@dataclass
+class ClassMoments:
+    """Centered moments of one class over all features.
+
+    n    : number of samples
+    mean : (d,) feature means
+    m2   : (d, d) cross-products  sum_k u_ki * u_kj       (u = x - mean)
+    m4   : (d, d) squared cross-products  sum_k u_ki^2 * u_kj^2
+           (needed for the closed-form Ledoit-Wolf shrinkage)
+    m3   : optional (d, d) third-order cross moments  sum_k u_ki^2 * u_kj
+           (only needed to merge moments of several row blocks)
+    """
+
+    n: int
+    mean: np.ndarray
+    m2: np.ndarray
+    m4: np.ndarray
+    m3: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_samples(cls, X: np.ndarray, dtype=np.float64, third: bool = False) -> "ClassMoments":
+        X = np.asarray(X, dtype=dtype)
+        n = int(X.shape[0])
+        mean = X.mean(axis=0) if n > 0 else np.zeros(X.shape[1], dtype=X.dtype)
+        U = X - mean
+        U2 = U * U
+        return cls(n=n, mean=mean, m2=U.T @ U, m4=U2.T @ U2, m3=(U2.T @ U) if third else None)
+
+    @classmethod
+    def merge(cls, parts: Sequence["ClassMoments"]) -> "ClassMoments":
+        """Moments of the union of disjoint row blocks.
+
+        Each block's centered sums are shifted from its own mean to the pooled
+        mean (the Chan et al. pairwise update, carried to fourth order) and added
+        up in float64; the result keeps the blocks' dtype and its own m3, so merges
+        can be chained. Blocks need m3 (from_samples(..., third=True)).
+        """
+        parts = [p for p in parts if p.n > 0] or list(parts[:1])
+        if not parts:
+            raise ValueError("Nothing to merge")
+        if len(parts) == 1:
+            return parts[0]
+        if any(p.m3 is None for p in parts):
+            raise ValueError("Merging moments needs m3 (ClassMoments.from_samples(..., third=True))")
+        dtype = parts[0].mean.dtype
+        n = sum(p.n for p in parts)
+        mean = sum(p.n * p.mean.astype(np.float64) for p in parts) / n
+        d = mean.shape[0]
+        m2, m3, m4 = np.zeros((d, d)), np.zeros((d, d)), np.zeros((d, d))
+        for p in parts:
+            c2, c3, c4 = (a.astype(np.float64) for a in (p.m2, p.m3, p.m4))
+            delta = p.mean.astype(np.float64) - mean
+            d2 = delta * delta
+            s = np.diag(c2)
+            dd = np.outer(delta, delta)
+            # v = u + delta; expand sum v_i v_j, sum v_i^2 v_j, sum v_i^2 v_j^2 (sum u = 0)
+            m2 += c2 + p.n * dd
+            m3 += c3 + np.outer(s, delta) + 2.0 * delta[:, None] * c2 + p.n * np.outer(d2, delta)
+            m4 += (c4 + 2.0 * (c3 * delta[None, :] + c3.T * delta[:, None])
+                   + np.outer(s, d2) + np.outer(d2, s) + 4.0 * dd * c2 + p.n * np.outer(d2, d2))
+        return cls(n=n, mean=mean.astype(dtype), m2=m2.astype(dtype), m4=m4.astype(dtype),
+                   m3=m3.astype(dtype))
+
+    @property
+    def dim(self) -> int:
+        return int(self.mean.shape[0])
+
+    def to_dict(self) -> dict:
+        out = {"n": int(self.n), "mean": self.mean.tolist(), "m2": self.m2.tolist(), "m4": self.m4.tolist()}
+        if self.m3 is not None:
+            out["m3"] = self.m3.tolist()
+        return out
+
+    @classmethod
+    def from_dict(cls, d: dict, dtype=np.float64) -> "ClassMoments":
+        arr = lambda key: np.asarray(d[key], dtype=dtype)
+        return cls(n=int(d["n"]), mean=arr("mean"), m2=arr("m2"), m4=arr("m4"),
+                   m3=arr("m3") if d.get("m3") is not None else None)
+
+    def mean_of(self, idx: Sequence[int]) -> np.ndarray:
+        return self.mean[np.asarray(idx, dtype=int)]
+
+    def _block(self, M: np.ndarray, idx: np.ndarray) -> np.ndarray:
+        return M[np.ix_(idx, idx)].astype(np.float64, copy=False)
+
+    def covariance(self, idx: Sequence[int], ddof: int = 0) -> np.ndarray:
+        """Sample covariance of the subset (ddof=1 matches np.cov)."""
+        idx = np.asarray(idx, dtype=int)
+        return self._block(self.m2, idx) / float(self.n - ddof)
+
+    def ledoit_wolf(self, idx: Sequence[int]) -> np.ndarray:
+        """Ledoit-Wolf shrunk covariance of the subset.
+
+        Same estimate as ``sklearn.covariance.LedoitWolf().fit(X[:, idx]).covariance_``.
+        """
+        idx = np.asarray(idx, dtype=int)
+        n = float(self.n)
+        p = int(idx.size)
+        m2 = self._block(self.m2, idx)
+        emp_cov = m2 / n
+        if p == 1:
+            return emp_cov
+
+        emp_trace = np.diag(emp_cov)
+        mu = float(np.sum(emp_trace)) / p
+        beta_ = float(np.sum(self._block(self.m4, idx)))
+        delta_ = float(np.sum(m2 ** 2)) / n ** 2
+        beta = 1.0 / (p * n) * (beta_ / n - delta_)
+        delta = (delta_ - 2.0 * mu * float(np.sum(emp_trace)) + p * mu ** 2) / p
+        beta = min(beta, delta)
+        shrinkage = 0.0 if beta == 0 else beta / delta
+
+        shrunk = (1.0 - shrinkage) * emp_cov
+        shrunk.flat[:: p + 1] += shrinkage * mu
+        return shrunk
+
+    # -- stacked variants: idx is (m, k), one row per candidate subset --
+    def _blocks(self, M: np.ndarray, idx: np.ndarray) -> np.ndarray:
+        return M[idx[:, :, None], idx[:, None, :]].astype(np.float64, copy=False)
+
+    def covariance_batch(self, idx: np.ndarray, ddof: int = 0) -> np.ndarray:
+        """(m, k, k) covariances of m equally sized subsets."""
+        return self._blocks(self.m2, np.asarray(idx, dtype=int)) / float(self.n - ddof)
+
+    def ledoit_wolf_batch(self, idx: np.ndarray) -> np.ndarray:
+        """(m, k, k) Ledoit-Wolf covariances of m equally sized subsets (same estimate as ledoit_wolf)."""
+        idx = np.asarray(idx, dtype=int)
+        n = float(self.n)
+        p = int(idx.shape[1])
+        m2 = self._blocks(self.m2, idx)
+        emp_cov = m2 / n
+        if p == 1:
+            return emp_cov
+
+        trace = np.sum(np.diagonal(emp_cov, axis1=1, axis2=2), axis=1)
+        mu = trace / p
+        beta_ = np.sum(self._blocks(self.m4, idx), axis=(1, 2))
+        delta_ = np.sum(m2 ** 2, axis=(1, 2)) / n ** 2
+        beta = 1.0 / (p * n) * (beta_ / n - delta_)
+        delta = (delta_ - 2.0 * mu * trace + p * mu ** 2) / p
+        beta = np.minimum(beta, delta)
+        shrinkage = np.divide(beta, delta, out=np.zeros_like(beta), where=beta != 0)
+
+        shrunk = (1.0 - shrinkage)[:, None, None] * emp_cov
+        diag = np.arange(p)
+        shrunk[:, diag, diag] += (shrinkage * mu)[:, None]
+        return shrunk
+
+
+@dataclass
+class FoldMoments:
+    """Per-fold class moments of the fold's training rows (0 = Benign, 1 = Malignant)."""
+
+    benign: ClassMoments
+    malignant: ClassMoments
+
+    @classmethod
+    def from_samples(cls, X: np.ndarray, y: np.ndarray, dtype=np.float64, third: bool = False) -> "FoldMoments":
+        return cls(
+            benign=ClassMoments.from_samples(X[y == 0], dtype, third),
+            malignant=ClassMoments.from_samples(X[y == 1], dtype, third),
+        )
+
+    def to_dict(self) -> dict:
+        return {"0": self.benign.to_dict(), "1": self.malignant.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d: dict, dtype=np.float64) -> "FoldMoments":
+        return cls(benign=ClassMoments.from_dict(d["0"], dtype), malignant=ClassMoments.from_dict(d["1"], dtype))
+
+    @classmethod
+    def merge(cls, parts: Sequence["FoldMoments"]) -> "FoldMoments":
+        return cls(
+            benign=ClassMoments.merge([p.benign for p in parts]),
+            malignant=ClassMoments.merge([p.malignant for p in parts]),
+        )
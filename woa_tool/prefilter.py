@@ -0,0 +1,107 @@
+"""
+Pre-filter stage that shrinks the feature search space before EWOA.
+
+Stages run in the given order on the standardized training features:
+  fisher : keep the `keep` columns with the highest Fisher score
+  mi     : keep the `keep` columns with the highest mutual information with y
+  corr   : cluster columns whose |correlation| >= `corr_threshold` and keep
+           one representative (highest Fisher score) per cluster
+The optimizer then searches over the surviving columns only; PrefilterResult
+maps positions in that reduced space back to original column indices.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import squareform
+from sklearn.feature_selection import mutual_info_classif
+
+STAGES = ("fisher", "mi", "corr")
+
+
+def fisher_scores(X: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Per-feature Fisher score (mu_b - mu_m)^2 / (var_b + var_m)."""
+    Xb = X[y == 0]
+    Xm = X[y == 1]
+    mu_b = Xb.mean(0); mu_m = Xm.mean(0)
+    var_b = Xb.var(0) + 1e-9; var_m = Xm.var(0) + 1e-9
+    return (mu_b - mu_m) ** 2 / (var_b + var_m)
+
+
+def mutual_information(X: np.ndarray, y: np.ndarray, seed: int = 0) -> np.ndarray:
+    return mutual_info_classif(X, y, random_state=seed)
+
+
+def correlation_clusters(X: np.ndarray, threshold: float) -> np.ndarray:
+    """Cluster label per column; columns in one cluster are linked by |corr| >= threshold."""
+    d = X.shape[1]
+    if d < 2:
+        return np.zeros(d, dtype=int)
+    # constant columns have no defined correlation; they stay singletons
+    with np.errstate(invalid="ignore", divide="ignore"):
+        C = np.nan_to_num(np.corrcoef(X, rowvar=False), nan=0.0)
+    D = np.clip(1.0 - np.abs(C), 0.0, None)
+    np.fill_diagonal(D, 0.0)
+    # complete linkage: every pair inside a cluster is at least `threshold` correlated
+    Z = linkage(squareform(D, checks=False), method="complete")
+    return fcluster(Z, t=1.0 - threshold, criterion="distance")
+
+
+@dataclass
+class PrefilterResult:
+    index_map: np.ndarray                         # reduced position -> original column
+    stages: List[Dict] = field(default_factory=list)
+
+    @property
+    def dim(self) -> int:
+        return int(self.index_map.size)
+
+    def to_original(self, reduced_idx: Sequence[int]) -> List[int]:
+        return [int(self.index_map[i]) for i in reduced_idx]
+
+    def to_reduced_mask(self, original_idx: Sequence[int]) -> np.ndarray:
+        return np.isin(self.index_map, np.asarray(list(original_idx), dtype=int)).astype(float)
+
+    def to_dict(self, feature_names: Optional[Sequence[str]] = None) -> Dict:
+        out = {"index_map": self.index_map.tolist(), "stages": self.stages}
+        if feature_names is not None:
+            out["kept_names"] = [feature_names[i] for i in self.index_map]
+        return out
+
+
+def prefilter(X: np.ndarray,
+              y: np.ndarray,
+              stages: Sequence[str] = STAGES,
+              keep: int = 40,
+              corr_threshold: float = 0.95,
+              min_features: int = 10,
+              seed: int = 0) -> PrefilterResult:
+    """Run the stages in order; never reduces below `min_features` columns."""
+    cols = np.arange(X.shape[1])
+    fisher = fisher_scores(X, y)
+    log = []
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError(f"Unknown prefilter stage: {stage} (expected one of {STAGES})")
+        before = cols.size
+        if stage in ("fisher", "mi"):
+            n_keep = max(min_features, int(keep))
+            if cols.size > n_keep:
+                score = fisher[cols] if stage == "fisher" else mutual_information(X[:, cols], y, seed)
+                top = np.sort(np.argsort(-score, kind="stable")[:n_keep])
+                cols = cols[top]
+        else:
+            labels = correlation_clusters(X[:, cols], corr_threshold)
+            reps = [int(np.flatnonzero(labels == lab)[np.argmax(fisher[cols[labels == lab]])])
+                    for lab in np.unique(labels)]
+            if len(reps) < min_features:
+                # top up with the best-scoring non-representatives
+                rest = [i for i in np.argsort(-fisher[cols], kind="stable") if i not in reps]
+                reps += rest[:min_features - len(reps)]
+            cols = cols[np.sort(reps)]
+        log.append({"stage": stage, "before": int(before), "after": int(cols.size)})
+    return PrefilterResult(index_map=cols, stages=log)
@@ -1,10 +1,15 @@
 # woa_tool/preprocess.py
 import os
-import json
+import sqlite3
+import time
+from functools import partial
 import numpy as np
 import pandas as pd
 
-from .feature_extraction import extract_image_features
+from .dataset import Dataset
+from .extract_pool import PER_IMAGE_TIMEOUT, extract_many
+from .feature_cache import FEATURE_CACHE, cached_extract, content_hash, extractor_version, open_cache
+from .feature_extraction import ExtractionOptions
 
 OUT_DIR = "data/processed"
 os.makedirs(OUT_DIR, exist_ok=True)
@@ -22,38 +27,64 @@ def _normalize_label(x):
         return int(_LABEL_MAP[s])
     raise ValueError(f"Unrecognized label value: {x!r} (expected B/M, 0/1, benign/malignant)")
 
-def load_processed_data(processed_dir="data/processed"):
+def load_processed_data(processed_dir="data/processed", mmap=True):
     """
-    Load preprocessed feature arrays and feature names from disk.
+    Load the preprocessed training split and feature names (see dataset.py).
     Returns:
-        X (np.ndarray): feature matrix
+        X (np.ndarray): feature matrix (read-only memory map unless mmap=False)
         y (np.ndarray): label vector (0=Benign, 1=Malignant)
         feature_names (list[str])
     """
-    X_path = os.path.join(processed_dir, "X_train.npy")
-    y_path = os.path.join(processed_dir, "y_train.npy")
-    features_path = os.path.join(processed_dir, "feature_names.json")
+    train = Dataset.open(processed_dir, mmap=mmap).split("train")
+    return train.X, np.asarray(train.y), train.feature_names
 
-    if not (os.path.exists(X_path) and os.path.exists(y_path) and os.path.exists(features_path)):
-        raise FileNotFoundError(
-            f"❌ Missing processed data in {processed_dir}. "
-            f"Run 'python3 -m woa_tool.cli preprocess' first."
-        )
 
-    X = np.load(X_path)
-    y = np.load(y_path)
-    with open(features_path, "r") as f:
-        feature_names = json.load(f)
+def _progress(label):
+    step = [0]
 
-    return X, y, feature_names
+    def report(done, total):
+        # about every 5%
+        if done == total or done >= step[0]:
+            print(f"  🖼️ {label}: {done}/{total} images")
+            step[0] = done + max(1, total // 20)
+    return report
 
 
-def load_dataset(csv_path):
+def _content_hashes(paths, feature_cache, options=None):
+    # through the cache's (path, size, mtime) memo when there is one: unchanged files are only stat'ed
+    if feature_cache:
+        try:
+            cache = open_cache(feature_cache, options)
+            return [cache.hash_of(p) for p in paths]
+        except (OSError, sqlite3.Error):
+            pass
+    return [content_hash(p) for p in paths]
+
+
+def load_dataset(csv_path, workers=1, timeout=PER_IMAGE_TIMEOUT, feature_cache=FEATURE_CACHE, options=None):
     """
     Build X, y, ids from a CSV with columns:
         patient_id, Class, image_path
     Maintains a canonical feature order captured from the first image.
     Later rows that are missing a feature key will be filled with 0.0 and logged.
+    Images are extracted by `workers` processes (extract_pool); a row whose
+    extraction fails or exceeds `timeout` seconds is logged and skipped.
+    Features are read from / stored in the content-addressed `feature_cache`
+    (feature_cache.py; None = always extract). `options`: ExtractionOptions
+    (default: exact decode).
+    """
+    X, y, ids, feature_names, _ = build_split(csv_path, workers, timeout, feature_cache, options=options)
+    return X, y, ids, feature_names
+
+
+def build_split(csv_path, workers=1, timeout=PER_IMAGE_TIMEOUT, feature_cache=FEATURE_CACHE,
+                previous=None, feature_names=None, options=None):
+    """
+    load_dataset, plus per-row sources [{"path", "content"}] for the manifest.
+    previous: a Split of the last run (same extractor version) whose rows are
+              reused by image content hash; only new or changed images are extracted
+    feature_names: canonical order to follow (default: the previous split's, else the first image's)
+    Returns X, y, ids, feature_names, sources
     """
     df = pd.read_csv(csv_path)
     required_cols = {"patient_id", "Class", "image_path"}
@@ -61,9 +92,7 @@ def load_dataset(csv_path):
     if missing:
         raise FileNotFoundError(f"CSV is missing columns: {sorted(missing)}")
 
-    X, y, ids = [], [], []
-    feature_names = None
-
+    rows = []
     for idx, row in df.iterrows():
         try:
             label = _normalize_label(row["Class"])
@@ -75,57 +104,127 @@ def load_dataset(csv_path):
         if not os.path.exists(img_path):
             print(f"⚠️ Row {idx}: missing image: {img_path}")
             continue
+        rows.append((idx, label, row["patient_id"], img_path))
+
+    hashes = _content_hashes([r[3] for r in rows], feature_cache, options)
+    reuse = {}
+    if previous is not None:
+        reuse = {src["content"]: i for i, src in enumerate(previous.sources)}
+        feature_names = feature_names or previous.feature_names
+        old_paths = {src["path"] for src in previous.sources}
+        paths = {r[3] for r in rows}
+        todo = [k for k, h in enumerate(hashes) if h not in reuse]
+        n_changed = sum(rows[k][3] in old_paths for k in todo)
+        n_removed = sum(src["path"] not in paths for src in previous.sources)
+        print(f"  🔁 {os.path.basename(csv_path)}: {len(rows) - len(todo)} unchanged, {len(todo) - n_changed} new, "
+              f"{n_changed} changed, {n_removed} removed")
+    else:
+        todo = list(range(len(rows)))
+
+    results = extract_many([rows[k][3] for k in todo], workers=workers, timeout=timeout,
+                           extract=partial(cached_extract, cache_path=feature_cache, options=options),
+                           progress=_progress(os.path.basename(csv_path)) if todo else None)
+    extracted = dict(zip(todo, results))
+
+    vecs, reused, y, ids, sources = [], [], [], [], []
+    for k, (idx, label, patient_id, img_path) in enumerate(rows):
+        res = extracted.get(k)
+        if res is None:
+            # same image content as a row of the previous run: copy its features
+            reused.append((len(vecs), reuse[hashes[k]]))
+            vecs.append(None)
+        else:
+            if not res.ok:
+                print(f"⚠️ Row {idx}: feature extraction failed ({res.error}): {img_path}")
+                continue
+            feats = res.feats
+
+            # Initialize canonical feature order from the first successful row
+            if feature_names is None:
+                feature_names = list(feats.keys())
+
+            # Fill vector strictly following canonical order; warn if a key is missing
+            vec = []
+            for k_name in feature_names:
+                if k_name in feats:
+                    vec.append(feats[k_name])
+                else:
+                    print(f"⚠️ Row {idx}: feature '{k_name}' missing in extraction; filling 0.0")
+                    vec.append(0.0)
+            vecs.append(vec)
 
-        feats = extract_image_features(img_path)
-
-        # Initialize canonical feature order from the first successful row
-        if feature_names is None:
-            feature_names = list(feats.keys())
-
-        # Fill vector strictly following canonical order; warn if a key is missing
-        vec = []
-        for k in feature_names:
-            if k in feats:
-                vec.append(feats[k])
-            else:
-                print(f"⚠️ Row {idx}: feature '{k}' missing in extraction; filling 0.0")
-                vec.append(0.0)
-
-        X.append(vec)
         y.append(label)
-        ids.append(row["patient_id"])
+        ids.append(patient_id)
+        sources.append({"path": img_path, "content": hashes[k]})
 
-    if feature_names is None or len(X) == 0:
+    if feature_names is None or len(vecs) == 0:
         raise RuntimeError("No usable rows found in CSV. Check paths and labels.")
 
     # Consistent dtypes
-    X = np.asarray(X, dtype=np.float32)
+    X = np.zeros((len(vecs), len(feature_names)), dtype=np.float32)
+    for i, vec in enumerate(vecs):
+        if vec is not None:
+            X[i] = vec
+    if reused:
+        dst, src = np.array(reused).T
+        X[dst] = previous.X[src]
     y = np.asarray(y, dtype=np.int32)
 
-    return X, y, ids, feature_names
+    return X, y, ids, feature_names, sources
 
 
-def run():
-    print("🔄 Loading training set from data/train.csv ...")
-    X_train, y_train, ids_train, feat_names = load_dataset("data/train.csv")
-    np.save(os.path.join(OUT_DIR, "X_train.npy"), X_train)
-    np.save(os.path.join(OUT_DIR, "y_train.npy"), y_train)
-    np.save(os.path.join(OUT_DIR, "ids_train.npy"), np.asarray(ids_train))
+def _previous_split(name, options):
+    # the last run's split, if its rows can be reused (manifest with sources, same extractor and options).
+    # Read into memory, not memory-mapped: Dataset.write replaces these files, which fails on
+    # Windows while a mapping of them is open.
+    try:
+        ds = Dataset.open(OUT_DIR, mmap=False)
+    except FileNotFoundError:
+        return None
+    if ds.manifest.get("extractor") != extractor_version(options) or name not in ds:
+        return None
+    split = ds.split(name)
+    return split if split.sources is not None else None
 
-    print("🔄 Loading test set from data/test.csv ...")
-    X_test, y_test, ids_test, _ = load_dataset("data/test.csv")
-    np.save(os.path.join(OUT_DIR, "X_test.npy"), X_test)
-    np.save(os.path.join(OUT_DIR, "y_test.npy"), y_test)
-    np.save(os.path.join(OUT_DIR, "ids_test.npy"), np.asarray(ids_test))
 
-    # Save canonical feature order for the whole pipeline
-    with open(os.path.join(OUT_DIR, "feature_names.json"), "w") as f:
-        json.dump(feat_names, f, indent=2)
+def run(workers=1, timeout=PER_IMAGE_TIMEOUT, feature_cache=FEATURE_CACHE, incremental=False, options=None):
+    """
+    incremental: diff each CSV against the previous run's manifest (paths and
+    image content hashes) and extract only new or changed images; removed rows
+    are dropped. Without a reusable previous run this is a full rebuild.
+    options: ExtractionOptions (e.g. the fast decode path); recorded in the
+    manifest, and from there in models trained on the dataset.
+    """
+    t0 = time.perf_counter()
+    options = options or ExtractionOptions()
+    prev_train = _previous_split("train", options) if incremental else None
+    prev_test = _previous_split("test", options) if incremental else None
+    if incremental and prev_train is None:
+        print("ℹ️ No reusable previous run (missing, older format, or feature extraction changed); rebuilding.")
+    if options != ExtractionOptions():
+        print(f"⚙️ Extraction options: {options.to_dict()}")
+
+    print(f"🔄 Loading training set from data/train.csv ... ({workers} worker{'s' if workers != 1 else ''})")
+    X_train, y_train, ids_train, feat_names, src_train = build_split(
+        "data/train.csv", workers, timeout, feature_cache, previous=prev_train, options=options)
+
+    print("🔄 Loading test set from data/test.csv ...")
+    X_test, y_test, ids_test, _, src_test = build_split(
+        "data/test.csv", workers, timeout, feature_cache, previous=prev_test, feature_names=feat_names,
+        options=options)
+    prev_train = prev_test = None   # nothing of the previous run may stay open while it is replaced
+
+    # One dataset directory: arrays + feature_names.json (canonical feature order) + manifest,
+    # with each row's image path and content hash for the next incremental run
+    Dataset.write(OUT_DIR, feat_names, {"train": (X_train, y_train, ids_train),
+                                        "test": (X_test, y_test, ids_test)},
+                  sources={"train": src_train, "test": src_test},
+                  meta={"extractor": extractor_version(options), "extraction": options.to_dict()})
 
     # Quick sanity prints
     b_tr = float((y_train == 0).mean())
     b_te = float((y_test == 0).mean())
-    print("✅ Preprocessing complete.")
+    print(f"✅ Preprocessing complete ({time.perf_counter() - t0:.1f}s).")
     print(f"Train: X={X_train.shape}, Benign share={b_tr:.3f}")
     print(f"Test : X={X_test.shape}, Benign share={b_te:.3f}")
     print(f"Features ({len(feat_names)}): {feat_names[:12]}{' ...' if len(feat_names)>12 else ''}")
@@ -0,0 +1,200 @@
+"""
+Data-parallel CV objective: one evaluation spread over row shards.
+
+The training rows are split into contiguous shards, each owned by a worker
+process for the lifetime of the objective. Shards only return reductions of
+their rows:
+
+  moments : per fold and class, ClassMoments of the shard's training rows
+            (with third-order moments). The coordinator merges them once
+            (ClassMoments.merge), so fold means and pooled covariances equal
+            the single-process ones up to rounding, and every subset is still
+            sliced from them.
+  score   : for a group of equally sized candidate subsets the coordinator
+            sends one whitening matrix per candidate and fold; each shard
+            scores its own τ-split rows and returns τ-sweep counts (tp / fp
+            per τ), which add up across shards.
+  holdout : with the τ chosen per candidate and fold, each shard returns its
+            holdout error counts at that τ (distances kept from `score`).
+
+Fitness, fold τ and class errors therefore match CVObjective. With local=True
+the shards run in the calling process (same reductions, no workers).
+"""
+
+from __future__ import annotations
+
+import multiprocessing as mp
+import threading
+import numpy as np
+from typing import List
+
+from .mahalanobis import whitened_ratio_distances, whitening_batch
+from .moments import FoldMoments
+from .train_and_eval import (
+    MAX_FEATURES, MIN_FEATURES, CVObjective, TrainConfig, TrainingData,
+    _compute_dtype, _constrained_maximin_index, _pooled_cov_batch, _spec_sens_rates, _tau_counts,
+)
+
+
+class Shard:
+    """A block of training rows and their role in every fold.
+
+    folds: per fold (train rows, τ-split rows, holdout rows) as positions into X.
+    """
+
+    def __init__(self, X: np.ndarray, y: np.ndarray, folds):
+        self.X = X
+        self.y = y
+        self.folds = folds
+        # scoring rows per fold: τ split first, then holdout
+        self._eval = [(X[np.concatenate([tau, va])], int(tau.size), y[tau], y[va]) for _, tau, va in folds]
+        self._holdout = None
+
+    def moments(self, dtype) -> List[FoldMoments]:
+        return [FoldMoments.from_samples(self.X[tr], self.y[tr], dtype, third=True) for tr, _, _ in self.folds]
+
+    def score(self, idx, fold_params, taus, dtype):
+        """τ-split counts (tp, fp, n_pos, n_neg) per fold for the candidates idx (m, k)."""
+        counts, self._holdout = [], []
+        for (Xe, n_sub, y_sub, _), (A, mu_b, mu_m) in zip(self._eval, fold_params):
+            dB, dM = whitened_ratio_distances(A, Xe, mu_b, mu_m, idx, dtype)
+            counts.append(_tau_counts(dB[:, :n_sub], dM[:, :n_sub], y_sub, taus))
+            self._holdout.append((dB[:, n_sub:], dM[:, n_sub:]))
+        return counts
+
+    def holdout(self, fold_taus):
+        """Per fold (wrong benign (m,), wrong malignant (m,), n benign, n malignant) at each candidate's τ."""
+        out = []
+        for (_, _, _, yva), (dB, dM), tau in zip(self._eval, self._holdout, fold_taus):
+            wrong = (dM <= tau[:, None] * dB) != (yva == 1)
+            out.append((np.sum(wrong & (yva == 0), axis=1), np.sum(wrong & (yva == 1), axis=1),
+                        int(np.sum(yva == 0)), int(np.sum(yva == 1))))
+        self._holdout = None
+        return out
+
+
+def _serve(conn, shard: Shard):
+    # worker loop: (method, args) -> (ok, result); None stops the worker
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        method, args = msg
+        try:
+            conn.send((True, getattr(shard, method)(*args)))
+        except Exception as e:
+            conn.send((False, e))
+    conn.close()
+
+
+def _local_rows(rows: np.ndarray, start: int, stop: int) -> np.ndarray:
+    return rows[(rows >= start) & (rows < stop)] - start
+
+
+class ShardedObjective(CVObjective):
+    """
+    CVObjective whose folds are scored by `config.shards` row shards, one worker
+    process each. Mini-batch mode is not supported. Call close() (or use it as a
+    context manager) to stop the workers.
+    """
+
+    def __init__(self, data: TrainingData, config: TrainConfig, index_map=None, local: bool = False):
+        if config.minibatch:
+            raise ValueError("The sharded objective does not support mini-batch mode (MINIBATCH)")
+        self.n_shards = max(1, int(config.shards))
+        self.local = bool(local)
+        self.shard_sizes: List[int] = []
+        self._shards: List[Shard] = []
+        self._conns = []
+        self._procs = []
+        self._lock = threading.Lock()
+        super().__init__(data, config, index_map)
+
+    def _fold_plan(self, data, config):
+        X, y = data.features(config.precision), data.y_train
+        splits = data.fold_splits(config.folds, config.random_seed)
+        ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+        for rows in np.array_split(np.arange(X.shape[0]), self.n_shards):
+            start, stop = int(rows[0]), int(rows[-1]) + 1
+            folds = [tuple(_local_rows(r, start, stop) for r in split) for split in splits]
+            shard = Shard(X[start:stop], y[start:stop], folds)
+            self.shard_sizes.append(stop - start)
+            if self.local:
+                self._shards.append(shard)
+                continue
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_serve, args=(child, shard), daemon=True)
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+
+        parts = self._call("moments", _compute_dtype(config.precision))
+        return [{"moments": FoldMoments.merge(fold_parts)} for fold_parts in zip(*parts)]
+
+    def _call(self, method, *args):
+        """Run `method` on every shard (concurrently across workers); results in shard order."""
+        if self.local:
+            return [getattr(shard, method)(*args) for shard in self._shards]
+        for conn in self._conns:
+            conn.send((method, args))
+        replies = [conn.recv() for conn in self._conns]
+        for ok, value in replies:
+            if not ok:
+                raise value
+        return [value for _, value in replies]
+
+    def close(self):
+        for conn in self._conns:
+            try:
+                conn.send(None)
+                conn.close()
+            except OSError:
+                pass
+        for proc in self._procs:
+            proc.join(timeout=5)
+        self._conns, self._procs = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def set_batch(self, size, rng=None):
+        if size is not None:
+            raise ValueError("The sharded objective does not support mini-batch mode")
+
+    def _cv(self, selected):
+        k = len(selected)
+        if k < MIN_FEATURES or k > MAX_FEATURES:
+            return super()._cv(selected)  # size penalty, no fold work
+        return self._cv_group([tuple(selected)])[0]
+
+    def _cv_group(self, subsets):
+        idx = np.asarray(subsets, dtype=int)
+        fold_params = []
+        for fold in self.plan:
+            mb = fold["moments"].benign
+            mm = fold["moments"].malignant
+            if mb.n < 2 or mm.n < 2:
+                return [(1e6, ([], None, None))] * idx.shape[0]
+            A = whitening_batch(_pooled_cov_batch(mb, mm, idx, self.shrinkage)).astype(self.dtype)
+            fold_params.append((A, mb.mean, mm.mean))
+
+        # score and holdout read the same per-shard distances: one group at a time
+        with self._lock:
+            best = []
+            for fold_counts in zip(*self._call("score", idx, fold_params, self.tau_grid, self.dtype)):
+                tp, fp, n_pos, n_neg = (sum(c[i] for c in fold_counts) for i in range(4))
+                specs, senss = _spec_sens_rates(tp, fp, n_pos, n_neg)
+                best.append(self.tau_grid[_constrained_maximin_index(specs, senss, self.threshold)])
+            fold_taus = np.stack(best)                                   # (folds, m)
+            holdout = self._call("holdout", fold_taus)
+
+        fold_errB, fold_errM = [], []
+        for fold_counts in zip(*holdout):
+            eB, eM, n_b, n_m = (sum(c[i] for c in fold_counts) for i in range(4))
+            fold_errB.append(eB / (n_b + 1e-9))
+            fold_errM.append(eM / (n_m + 1e-9))
+        return self._group_results(fold_taus.T, np.stack(fold_errB, axis=1), np.stack(fold_errM, axis=1))
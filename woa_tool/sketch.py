@@ -0,0 +1,164 @@
+"""
+Bounded-memory statistics for the τ values chosen inside the CV objective.
+
+QuantileSketch is a streaming histogram (Ben-Haim & Tom-Tov): at most
+`max_bins` (centroid, count) pairs, merging the two closest centroids when a
+new value overflows the budget. TauLedger keeps per-subset τ reservoirs for
+only the best-scoring `top_n` subsets, so τ statistics can be taken from the
+winner (or the top-N) instead of from every subset ever evaluated.
+"""
+
+from __future__ import annotations
+
+import bisect
+import random
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class QuantileSketch:
+    """Streaming quantiles in O(max_bins) memory.
+
+    While fewer than `max_bins` distinct values were seen the sketch is exact
+    and quantile() matches np.quantile (linear interpolation). τ values come
+    from a fixed grid, so that is the common case.
+    """
+
+    def __init__(self, max_bins: int = 64):
+        self.max_bins = int(max_bins)
+        self._centers: List[float] = []
+        self._counts: List[int] = []
+        # True while a bin only ever held one distinct value (a point mass)
+        self._exact: List[bool] = []
+        self.count = 0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, value: float) -> None:
+        v = float(value)
+        if not np.isfinite(v):
+            return
+        self.count += 1
+        self.min = min(self.min, v)
+        self.max = max(self.max, v)
+        i = bisect.bisect_left(self._centers, v)
+        if i < len(self._centers) and self._centers[i] == v:
+            self._counts[i] += 1
+            return
+        self._centers.insert(i, v)
+        self._counts.insert(i, 1)
+        self._exact.insert(i, True)
+        if len(self._centers) > self.max_bins:
+            self._merge_closest()
+
+    def update(self, values: Iterable[float]) -> None:
+        for v in values:
+            self.add(v)
+
+    def _merge_closest(self) -> None:
+        c = self._centers
+        gaps = np.diff(c)
+        i = int(np.argmin(gaps))
+        n1, n2 = self._counts[i], self._counts[i + 1]
+        c[i] = (c[i] * n1 + c[i + 1] * n2) / (n1 + n2)
+        self._counts[i] = n1 + n2
+        self._exact[i] = False
+        del c[i + 1]
+        del self._counts[i + 1]
+        del self._exact[i + 1]
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate q-quantile (None when empty)."""
+        if self.count == 0:
+            return None
+        # a bin covers sorted ranks [start, start + n - 1]: point-mass bins hold
+        # their value over the whole range, merged bins sit at the middle rank
+        xs: List[float] = []
+        ys: List[float] = []
+        start = 0
+        for c, n, exact in zip(self._centers, self._counts, self._exact):
+            if exact:
+                xs += [start, start + n - 1]
+                ys += [c, c]
+            else:
+                xs.append(start + (n - 1) / 2.0)
+                ys.append(c)
+            start += n
+        if not self._exact[0]:
+            xs.insert(0, 0.0)
+            ys.insert(0, self.min)
+        if not self._exact[-1]:
+            xs.append(self.count - 1.0)
+            ys.append(self.max)
+        return float(np.interp(float(q) * (self.count - 1), xs, ys))
+
+    def median(self) -> Optional[float]:
+        return self.quantile(0.5)
+
+
+@dataclass
+class _LedgerEntry:
+    score: float
+    taus: List[float] = field(default_factory=list)
+    seen: int = 0
+
+
+class TauLedger:
+    """τ reservoirs for the `top_n` best (lowest-score) subsets.
+
+    Each kept subset holds at most `reservoir` τ values (reservoir sampling
+    once full), so memory is bounded by top_n * reservoir.
+    """
+
+    def __init__(self, top_n: int = 8, reservoir: int = 32, seed: int = 0):
+        self.top_n = int(top_n)
+        self.reservoir = int(reservoir)
+        self._rng = random.Random(seed)
+        self._entries: Dict[Hashable, _LedgerEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def add(self, key: Hashable, score: float, taus: Sequence[float]) -> bool:
+        """Record the τ values of one evaluation; returns False if the subset is not kept."""
+        if len(taus) == 0 or self.top_n <= 0:
+            return False
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.top_n:
+                worst = max(self._entries, key=lambda k: self._entries[k].score)
+                if score >= self._entries[worst].score:
+                    return False
+                del self._entries[worst]
+            entry = self._entries[key] = _LedgerEntry(float(score))
+        entry.score = min(entry.score, float(score))
+        for t in taus:
+            entry.seen += 1
+            if len(entry.taus) < self.reservoir:
+                entry.taus.append(float(t))
+            else:
+                j = self._rng.randrange(entry.seen)
+                if j < self.reservoir:
+                    entry.taus[j] = float(t)
+        return True
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[Hashable, float]]:
+        """(key, score) of the best `n` kept subsets, best first."""
+        items = sorted(self._entries.items(), key=lambda kv: kv[1].score)
+        return [(k, e.score) for k, e in items[: (n or len(items))]]
+
+    def taus(self, key: Optional[Hashable] = None, top_n: Optional[int] = None) -> np.ndarray:
+        """τ values of one subset, or pooled over the best `top_n` subsets."""
+        if key is not None:
+            entry = self._entries.get(key)
+            return np.asarray(entry.taus if entry is not None else [], dtype=float)
+        keys = [k for k, _ in self.top(top_n)]
+        return np.asarray([t for k in keys for t in self._entries[k].taus], dtype=float)
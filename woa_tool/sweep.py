@@ -0,0 +1,287 @@
+"""
+Hyperparameter sweeps over train_and_eval configurations.
+
+A search space maps TrainConfig fields to candidates:
+    {"obl_rate": [0.1, 0.15, 0.3], "a_strategy": ["cos", "sin"]}           (grid or random)
+    {"obl_rate": {"uniform": [0.05, 0.4]}, "pop": {"int": [30, 80]}}        (random only)
+    {"sens_weight": {"loguniform": [0.2, 0.8]}}                             (random only)
+
+Trials run in a process pool. Loaded arrays, fold plans and the test set are
+prepared once in the parent and inherited by forked workers. With early
+stopping on, a trial whose best fitness at a checkpoint is worse than the
+median of what other trials reported at that checkpoint is pruned (median
+stopping rule) before fine-tuning / test evaluation.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import fields, replace
+from typing import Any, Dict, List, Optional
+
+from .train_and_eval import TrainConfig, TrainingData, train_and_evaluate
+
+RANGE_KINDS = ("uniform", "loguniform", "int")
+
+RESULT_COLUMNS = [
+    "cv_error", "cv_error_B", "cv_error_M", "best_score", "n_selected", "tau",
+    "test_accuracy", "test_balanced_accuracy", "test_specificity", "test_sensitivity",
+    "constrained_tau", "constrained_specificity", "constrained_sensitivity",
+    "nfe", "runtime_s", "pruned_at_iter", "error",
+]
+
+
+class TrialPruned(Exception):
+    """Raised from the optimizer callback to abandon a losing trial."""
+
+    def __init__(self, t: int, best_fit: float, nfe: int):
+        super().__init__(f"pruned at iteration {t} (best={best_fit:.6f})")
+        self.t = t
+        self.best_fit = best_fit
+        self.nfe = nfe
+
+
+# ---------------------------
+# Search space
+# ---------------------------
+def _coerce(value: str) -> Any:
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def parse_param(spec: str):
+    """'obl_rate=0.1,0.2' -> choices; 'obl_rate=uniform:0.05:0.4' -> range."""
+    if "=" not in spec:
+        raise ValueError(f"Expected NAME=VALUES, got: {spec}")
+    name, values = spec.split("=", 1)
+    kind, _, rest = values.partition(":")
+    if kind in RANGE_KINDS and rest:
+        lo, hi = rest.split(":")
+        return name.strip(), {kind: [float(lo), float(hi)]}
+    return name.strip(), [_coerce(v.strip()) for v in values.split(",")]
+
+
+def load_space(path: Optional[str] = None, params: Optional[List[str]] = None) -> Dict[str, Any]:
+    space: Dict[str, Any] = {}
+    if path:
+        with open(path, "r") as f:
+            space.update(json.load(f))
+    for spec in params or []:
+        name, values = parse_param(spec)
+        space[name] = values
+    if not space:
+        raise ValueError("Empty search space (use --space and/or --param).")
+    valid = {f.name for f in fields(TrainConfig)}
+    unknown = sorted(set(space) - valid)
+    if unknown:
+        raise ValueError(f"Unknown TrainConfig fields in search space: {unknown}")
+    return space
+
+
+def grid_trials(space: Dict[str, Any]) -> List[Dict[str, Any]]:
+    for name, values in space.items():
+        if not isinstance(values, list):
+            raise ValueError(f"Grid search needs explicit values for {name!r}, got {values!r}")
+    names = list(space)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(space[n] for n in names))]
+
+
+def _sample(values: Any, rng: np.random.Generator) -> Any:
+    if isinstance(values, list):
+        return values[int(rng.integers(len(values)))]
+    (kind, (lo, hi)), = values.items()
+    if kind == "uniform":
+        return float(rng.uniform(lo, hi))
+    if kind == "loguniform":
+        return float(np.exp(rng.uniform(np.log(lo), np.log(hi))))
+    if kind == "int":
+        return int(rng.integers(int(lo), int(hi) + 1))
+    raise ValueError(f"Unknown range kind: {kind}")
+
+
+def random_trials(space: Dict[str, Any], n_trials: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(seed)
+    return [{name: _sample(values, rng) for name, values in space.items()} for _ in range(n_trials)]
+
+
+# ---------------------------
+# Early stopping
+# ---------------------------
+class MedianStopper:
+    """
+    Median stopping rule on best-so-far fitness. Trials report at `checkpoints`
+    evenly spaced fractions of their iteration budget to a shared board; from
+    checkpoint `warmup` on, a trial is pruned if its value is worse than the
+    median of at least `min_trials` other trials at the same checkpoint.
+    """
+
+    def __init__(self, board, checkpoints: int = 10, warmup: int = 2, min_trials: int = 3):
+        self.board = board
+        self.checkpoints = int(checkpoints)
+        self.warmup = int(warmup)
+        self.min_trials = int(min_trials)
+
+    def callback(self, trial_id: int, iters: int):
+        last = [0]
+
+        def cb(t, best_fit, history):
+            c = (t * self.checkpoints) // max(1, iters)
+            if c == last[0]:
+                return False
+            last[0] = c
+            self.board.append((trial_id, c, float(best_fit)))
+            if c < self.warmup or c >= self.checkpoints:
+                return False
+            others = [v for (tid, cc, v) in list(self.board) if cc == c and tid != trial_id]
+            if len(others) >= self.min_trials and best_fit > float(np.median(others)):
+                raise TrialPruned(t, float(best_fit), history.nfe)
+            return False
+
+        return cb
+
+
+# ---------------------------
+# Workers
+# ---------------------------
+_DATA: Optional[TrainingData] = None
+_STOPPER: Optional[MedianStopper] = None
+
+
+def _init_worker(processed_dir: str, stopper: Optional[MedianStopper]):
+    global _DATA, _STOPPER
+    # forked workers inherit the parent's data; spawned ones load it once here
+    if _DATA is None:
+        _DATA = TrainingData.load(processed_dir, verbose=False)
+    _STOPPER = stopper
+
+
+def _run_trial(trial_id: int, base: TrainConfig, params: Dict[str, Any],
+               models_dir: Optional[str]) -> Dict[str, Any]:
+    out_path = os.path.join(models_dir, f"trial_{trial_id:03d}.json") if models_dir else None
+    cfg = replace(base, out_path=out_path, **params)
+    cb = _STOPPER.callback(trial_id, cfg.iters) if _STOPPER is not None else None
+    row: Dict[str, Any] = {"trial": trial_id, "status": "ok", **params}
+    t0 = time.perf_counter()
+    try:
+        res = train_and_evaluate(cfg, _DATA, callback=cb)
+    except TrialPruned as e:
+        row.update(status="pruned", best_score=e.best_fit, nfe=e.nfe, pruned_at_iter=e.t,
+                   runtime_s=time.perf_counter() - t0)
+        return row
+    except Exception as e:
+        row.update(status="failed", error=f"{type(e).__name__}: {e}", runtime_s=time.perf_counter() - t0)
+        return row
+
+    model, test, cons = res["model"], res["test"], res["constrained"]
+    row.update(
+        cv_error=model["cv_error"], cv_error_B=model["cv_error_B"], cv_error_M=model["cv_error_M"],
+        best_score=res["best_score"], n_selected=len(model["selected_idx"]), tau=model["tau"],
+        test_accuracy=test["accuracy"], test_balanced_accuracy=test["balanced_accuracy"],
+        test_specificity=test["specificity"], test_sensitivity=test["sensitivity"],
+        constrained_tau=cons["tau"], constrained_specificity=cons["specificity"],
+        constrained_sensitivity=cons["sensitivity"],
+        nfe=res["nfe"], runtime_s=res["runtime_s"],
+    )
+    return row
+
+
+def run_sweep(space: Dict[str, Any],
+              base: Optional[TrainConfig] = None,
+              mode: str = "grid",
+              n_trials: Optional[int] = None,
+              seed: int = 0,
+              workers: int = 1,
+              data: Optional[TrainingData] = None,
+              early_stop: bool = True,
+              checkpoints: int = 10,
+              warmup: int = 2,
+              min_trials: int = 3,
+              out_csv: Optional[str] = None,
+              models_dir: Optional[str] = None,
+              verbose: bool = True) -> pd.DataFrame:
+    """Run every trial of the space; returns (and optionally writes) one row per trial."""
+    global _DATA, _STOPPER
+    base = base or TrainConfig.for_fast_level(2)
+    # trials are the unit of parallelism; keep each one quiet and single-threaded
+    base = replace(base, verbose=False, finetune_workers=1, shards=0, archive_path=None, results_dir=None,
+                   bootstrap_replicates=0, time_budget=None)
+
+    if mode == "grid":
+        trials = grid_trials(space)
+    elif mode == "random":
+        trials = random_trials(space, int(n_trials or 10), seed)
+    else:
+        raise ValueError(f"Unknown sweep mode: {mode}")
+
+    # shared state, prepared once before workers fork
+    data = data or TrainingData.load(base.processed_dir, verbose=verbose)
+    data.test_set(base.test_csv, base.feature_cache, base.extract_workers)
+    for params in trials:
+        cfg = replace(base, **params)
+        data.fold_plan(cfg.folds, cfg.random_seed, cfg.cov_shrinkage, cfg.precision)
+    if models_dir:
+        os.makedirs(models_dir, exist_ok=True)
+
+    if verbose:
+        print(f"🧪 Sweep: {len(trials)} trials ({mode}) on {workers} worker(s), early_stop={early_stop}")
+
+    rows: List[Dict[str, Any]] = []
+
+    def _report(row):
+        rows.append(row)
+        if verbose:
+            params = {k: row[k] for k in trials[row["trial"]]}
+            score = row.get("cv_error", row.get("best_score"))
+            score_s = "-" if score is None else f"{score:.4f}"
+            print(f"  [{len(rows)}/{len(trials)}] trial {row['trial']:03d} {row['status']:<7} "
+                  f"score={score_s} t={row.get('runtime_s', 0.0):.1f}s {params}")
+
+    prev = (_DATA, _STOPPER)
+    try:
+        if workers <= 1:
+            _DATA = data
+            _STOPPER = MedianStopper([], checkpoints, warmup, min_trials) if early_stop else None
+            for i, params in enumerate(trials):
+                _report(_run_trial(i, base, params, models_dir))
+        else:
+            ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+            if ctx.get_start_method() == "fork":
+                _DATA = data
+            with ctx.Manager() as manager:
+                stopper = MedianStopper(manager.list(), checkpoints, warmup, min_trials) if early_stop else None
+                with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                         initargs=(base.processed_dir, stopper)) as pool:
+                    futures = [pool.submit(_run_trial, i, base, params, models_dir)
+                               for i, params in enumerate(trials)]
+                    for fut in as_completed(futures):
+                        _report(fut.result())
+    finally:
+        _DATA, _STOPPER = prev
+
+    df = pd.DataFrame(rows).sort_values("trial").reset_index(drop=True)
+    for col in RESULT_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df = df[["trial", "status"] + list(space) + RESULT_COLUMNS]
+
+    if out_csv:
+        os.makedirs(os.path.dirname(out_csv) or ".", exist_ok=True)
+        df.to_csv(out_csv, index=False)
+        if verbose:
+            print(f"✅ Sweep results saved to {out_csv}")
+    if verbose:
+        done = [r for r in rows if r["status"] == "ok" and r["cv_error"] is not None]
+        if done:
+            best = min(done, key=lambda r: r["cv_error"])
+            print(f"🏆 Best trial {best['trial']:03d}: cv_error={best['cv_error']:.4f} "
+                  f"{trials[best['trial']]}")
+    return df
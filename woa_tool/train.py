@@ -2,6 +2,10 @@ import os, json, numpy as np
 from sklearn.model_selection import StratifiedKFold
 from .preprocess import load_processed_data
 from .algorithms import run_ewoa, run_woa
+from .moments import FoldMoments
+from .mahalanobis import FactorCache
+from .finetune import flip_search
+from .archive import SubsetArchive, fingerprint
 
 # ===============================================================
 #  TRAIN MODULE — Mahalanobis-based EWOA Feature Selection
@@ -15,7 +19,10 @@ def train(processed_dir="data/processed",
           obl_freq=5,
           obl_rate=0.15,
           out="models/model_ewoa_final3.json",
-          folds=5):
+          folds=5,
+          finetune_workers=1,
+          archive=None,
+          warm_start=0.25):
 
     # === Load preprocessed features and labels ===
     X, y, feature_names = load_processed_data(processed_dir)
@@ -32,61 +39,64 @@ def train(processed_dir="data/processed",
 
     skf = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
 
+    # Splits, class means and the pooled covariance np.cov + 1e-6*I do not depend
+    # on the subset (every subset covariance is a principal submatrix), so they
+    # are computed once and fine-tuning flips update cached Cholesky factors.
+    fold_plan = []
+    for tr, va in skf.split(X, y):
+        fm = FoldMoments.from_samples(X[tr], y[tr])
+        pooled = 0.5 * (fm.benign.covariance(np.arange(dim), ddof=1)
+                        + fm.malignant.covariance(np.arange(dim), ddof=1)) + 1e-6 * np.eye(dim)
+        fold_plan.append({
+            "moments": fm,
+            "factors": FactorCache(lambda idx, P=pooled: P[np.ix_(idx, idx)], pooled=pooled),
+            "X_va": X[va],
+            "y_va": y[va],
+        })
+    taus = np.array([0.90, 0.95, 0.98, 1.00, 1.02, 1.05, 1.08, 1.10, 1.12])
+    W_B, W_M = 1.0, 1.5
+
+    # === Optional warm-start archive (evaluated subsets shared across runs) ===
+    known, store = {}, None
+    if archive:
+        spec = {"objective": "train.evaluate", "folds": folds, "seed": 42, "taus": taus.tolist(),
+                "w_b": W_B, "w_m": W_M, "size_target": 17, "size_alpha": 0.008}
+        store = SubsetArchive(archive, fingerprint(spec, X, y, feature_names), fingerprint(spec), feature_names)
+        known = store.known()
+
     # ===========================================================
     #  Objective function (feature-subset fitness)
     # ===========================================================
-    def objective(mask):
+    def evaluate(mask):
+        # side-effect free; returns (fitness, (subset, fitness, fold τ, errB, errM) or None)
         selected = [i for i, v in enumerate(mask) if v > 0.5]
         if not selected:
-            return 1e6  # discourage empty subset
-
-        fold_errors, fold_B, fold_M = [], [], []
-
-        for tr, va in skf.split(X, y):
-            Xtr, Xva = X[tr][:, selected], X[va][:, selected]
-            ytr, yva = y[tr], y[va]
-
-            mu_b = Xtr[ytr == 0].mean(axis=0)
-            mu_m = Xtr[ytr == 1].mean(axis=0)
-
-            Sb = np.cov(Xtr[ytr == 0].T) + 1e-6 * np.eye(len(selected))
-            Sm = np.cov(Xtr[ytr == 1].T) + 1e-6 * np.eye(len(selected))
-            Sp_inv = np.linalg.pinv(0.5 * (Sb + Sm))
-
-            def maha(x, mu):
-                d = x - mu
-                return float(np.sqrt(d @ Sp_inv @ d))
-
-            # === τ sweep ===
-            best_err, best_tau = np.inf, 1.0
-            taus = [0.90, 0.95, 0.98, 1.00, 1.02, 1.05, 1.08, 1.10, 1.12]
-
-            for T in taus:
-                eB = eM = 0
-                for xi, yi in zip(Xva, yva):
-                    d_b, d_m = maha(xi, mu_b), maha(xi, mu_m)
-                    pred = 1 if (d_m / (d_b + 1e-9)) < T else 0
-                    if pred != yi:
-                        if yi == 0: eB += 1
-                        else: eM += 1
-                errB = eB / (np.sum(yva == 0) + 1e-6)
-                errM = eM / (np.sum(yva == 1) + 1e-6)
-                W_B, W_M = 1.0, 1.5
-                weighted = (W_B * errB + W_M * errM) / (W_B + W_M)
-                if weighted < best_err:
-                    best_err, best_tau = weighted, T
+            return 1e6, None  # discourage empty subset
+        if tuple(selected) in known:
+            fitness, fold_taus, errB, errM = known[tuple(selected)]
+            return fitness, (tuple(selected), fitness, fold_taus, errB, errM)
+
+        fold_errors, fold_B, fold_M, fold_taus = [], [], [], []
+
+        for fold in fold_plan:
+            fm, yva = fold["moments"], fold["y_va"]
+            factor = fold["factors"].get(selected)
+            Xva = fold["X_va"][:, factor.order]
+
+            d_b = np.sqrt(factor.sq_mahalanobis(Xva - fm.benign.mean_of(factor.order)))
+            d_m = np.sqrt(factor.sq_mahalanobis(Xva - fm.malignant.mean_of(factor.order)))
+            ratio = d_m / (d_b + 1e-9)
+
+            # === τ sweep (all τ at once; first minimum wins) ===
+            pred = ratio[None, :] < taus[:, None]
+            errB_t = np.sum(pred & (yva == 0), axis=1) / (np.sum(yva == 0) + 1e-6)
+            errM_t = np.sum(~pred & (yva == 1), axis=1) / (np.sum(yva == 1) + 1e-6)
+            weighted_t = (W_B * errB_t + W_M * errM_t) / (W_B + W_M)
+            best = int(np.argmin(weighted_t))
 
             # === Final errors with best τ ===
-            eB = eM = 0
-            for xi, yi in zip(Xva, yva):
-                d_b, d_m = maha(xi, mu_b), maha(xi, mu_m)
-                pred = 1 if (d_m / (d_b + 1e-9)) < best_tau else 0
-                if pred != yi:
-                    if yi == 0: eB += 1
-                    else: eM += 1
-
-            errB = eB / (np.sum(yva == 0) + 1e-6)
-            errM = eM / (np.sum(yva == 1) + 1e-6)
+            errB = float(errB_t[best])
+            errM = float(errM_t[best])
             weighted_err = (1.0 * errB + 1.5 * errM) / 2.5
 
             # === Size penalty & diversity reward ===
@@ -96,47 +106,64 @@ def train(processed_dir="data/processed",
             fold_errors.append(weighted_err)
             fold_B.append(errB)
             fold_M.append(errM)
+            fold_taus.append(float(taus[best]))
+
+        fitness = float(np.mean(fold_errors))
+        return fitness, (tuple(selected), fitness, fold_taus, float(np.mean(fold_B)), float(np.mean(fold_M)))
 
-        objective.last_B = float(np.mean(fold_B))
-        objective.last_M = float(np.mean(fold_M))
-        return float(np.mean(fold_errors))
+    def record(payload):
+        if payload is not None:
+            subset, fitness, fold_taus, objective.last_B, objective.last_M = payload
+            if store is not None and subset not in known:
+                known[subset] = (fitness, fold_taus, objective.last_B, objective.last_M)
+                store.add(subset, fitness, fold_taus, objective.last_B, objective.last_M)
+
+    def objective(mask):
+        score, payload = evaluate(mask)
+        record(payload)
+        return score
 
     # ===========================================================
     #  Run EWOA optimizer
     # ===========================================================
+    init_population = None
+    if store is not None:
+        init_population = np.where(store.elites(int(round(warm_start * pop))) > 0.5, 1.0, -1.0)
+        print(f"🗄️ Archive {archive}: {len(known)} known subsets, {len(init_population)} seeded whales")
+
     if algo.lower() == "ewoa":
         best_mask, best_err, hist = run_ewoa(
             objective, dim, (-1, 1),
             pop_size=pop, iters=iters,
             a_strategy=a_strategy,
             obl_freq=obl_freq,
-            obl_rate=obl_rate
+            obl_rate=obl_rate,
+            init_population=init_population
         )
     else:
-        best_mask, best_err, hist = run_woa(objective, dim, (-1, 1), pop, iters)
+        best_mask, best_err, hist = run_woa(objective, dim, (-1, 1), pop, iters, init_population=init_population)
 
     # ===========================================================
     #  Greedy fine-tuning (single + pairwise)
     # ===========================================================
     print("🔧 Greedy post-optimization fine-tuning...")
-    best_subset, best_score = best_mask.copy(), best_err
-    for i in range(dim):
-        candidate = best_subset.copy(); candidate[i] = 1 - candidate[i]
-        err = objective(candidate)
-        if err < best_score:
-            best_subset, best_score = candidate, err
-            print(f"  ✅ Flip {i}: {feature_names[i]} → {err:.4f}")
-    best_mask = best_subset
+    best_mask, best_score = flip_search(
+        evaluate, best_mask, best_err, [(i,) for i in range(dim)],
+        tol=0.0, workers=finetune_workers, commit=record,
+        on_accept=lambda mv, err: print(f"  ✅ Flip {mv[0]}: {feature_names[mv[0]]} → {err:.4f}"),
+    )
 
     print("🔁 Second-pass pairwise fine-tuning...")
-    for i in range(dim):
-        for j in range(i + 1, dim):
-            cand = best_mask.copy()
-            cand[i], cand[j] = 1 - cand[i], 1 - cand[j]
-            err = objective(cand)
-            if err < best_score - 1e-4:
-                best_mask, best_score = cand, err
-                print(f"  ✅ Pair flip ({feature_names[i]}, {feature_names[j]}) → {err:.4f}")
+    best_mask, best_score = flip_search(
+        evaluate, best_mask, best_score,
+        [(i, j) for i in range(dim) for j in range(i + 1, dim)],
+        tol=1e-4, workers=finetune_workers, commit=record,
+        on_accept=lambda mv, err: print(f"  ✅ Pair flip ({feature_names[mv[0]]}, {feature_names[mv[1]]}) → {err:.4f}"),
+    )
+
+    if store is not None:
+        print(f"🗄️ Archive: {store.flush()} new subsets stored")
+        store.close()
 
     # ===========================================================
     #  Save final model
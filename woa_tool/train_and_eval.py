@@ -2,10 +2,20 @@
 """
 Trains feature-selected Mahalanobis ratio classifier with robust τ selection.
 
-Saves model to: models/model_ewoa_13.json
+Saves model to: models/model_ewoa2new.json (TrainConfig.out_path)
+
+Library use:
+    data = TrainingData.load("data/processed")          # load once
+    res = train_and_evaluate(TrainConfig.for_fast_level(2), data)
+    res2 = train_and_evaluate(TrainConfig.for_fast_level(2, obl_rate=0.3), data)
+  Loaded arrays, fold plans and factor caches live on `data` and are reused.
+
+Script use (thin wrapper around the above):
+    FAST=2 python3 -m woa_tool.train_and_eval
 
 Expectations:
-- preprocess.load_processed_data(PROCESSED_DIR) -> X_train (n x d), y_train (n,), feature_names (list)
+- dataset.Dataset.open(PROCESSED_DIR): "train" split X (n x d), y (n,), feature_names (list);
+  optional "test" split (else built from data/test.csv)
   y_train: 0 = Benign, 1 = Malignant (script will flip if needed)
 - data/test.csv: columns {patient_id, Class, image_path} where Class in {B/M, 0/1, benign/malignant}
 - woa_tool.algorithms: run_ewoa / run_woa
@@ -17,11 +27,14 @@ Expectations:
 
 import os
 import json
-import hashlib
+import argparse
+import time
 import random
 import numpy as np
 import pandas as pd
-from pathlib import Path
+from dataclasses import dataclass, field, replace
+from functools import partial
+from typing import Callable, Dict, List, Optional
 from sklearn.model_selection import StratifiedKFold, train_test_split
 from sklearn.metrics import (
     confusion_matrix,
@@ -29,56 +42,57 @@ from sklearn.metrics import (
     accuracy_score,
     balanced_accuracy_score,
 )
-from sklearn.covariance import LedoitWolf
 
-from woa_tool.preprocess import load_processed_data
-from woa_tool.feature_extraction import extract_image_features
+from woa_tool.dataset import Dataset
+from woa_tool.feature_cache import FEATURE_CACHE, cached_extract
+from woa_tool.feature_extraction import ExtractionOptions
+from woa_tool.extract_pool import extract_many
 from woa_tool.algorithms import run_ewoa, run_woa
+from woa_tool.moments import ClassMoments, FoldMoments
+from woa_tool.mahalanobis import CholeskyFactor, FactorCache, batch_ratio_distances
+from woa_tool.finetune import flip_search
+from woa_tool.sketch import QuantileSketch, TauLedger
+from woa_tool.prefilter import PrefilterResult, fisher_scores as _fisher_scores, prefilter as _run_prefilter
+from woa_tool.archive import SubsetArchive, fingerprint
+from woa_tool.bootstrap import operating_point_cis
+from woa_tool.budget import BudgetPlan, calibrate, parse_duration, plan_budget
 
 # ---------------------------
 # Runtime FAST / Tiers
 # ---------------------------
-FAST_ENV = os.getenv("FAST", None)
-if FAST_ENV is None or FAST_ENV in ("0", "false", "False"):
-    FAST_LEVEL = 0
-else:
-    try:
-        FAST_LEVEL = int(FAST_ENV)
-    except Exception:
-        FAST_LEVEL = 1
-
-if FAST_LEVEL == 1:
+FAST_TIERS = {
     # quick debug
-    FOLDS = 3
-    ITERS = 80
-    POP = 30
-    FINE_TOP_K = 16  # a bit more room than 12 for stability
-    PAIR_LIMIT = 30
-elif FAST_LEVEL == 2:
+    1: dict(folds=3, iters=80, pop=30,
+            fine_top_k=16,  # a bit more room than 12 for stability
+            pair_limit=30),
     # balanced-speed (1-2 hrs typical)
-    FOLDS = 4
-    ITERS = 180
-    POP = 50
-    FINE_TOP_K = 20
-    PAIR_LIMIT = 60
-else:
+    2: dict(folds=4, iters=180, pop=50, fine_top_k=20, pair_limit=60),
     # full (may be many hours) - increased for better feature search
-    FOLDS = 5
-    ITERS = 800  # Increased from 500 for better exploration
-    POP = 80     # Increased from 60 for more diversity
-    FINE_TOP_K = 30  # Increased from 25 for more fine-tuning candidates
-    PAIR_LIMIT = 150  # Increased from 100 for more pairwise exploration
+    0: dict(folds=5,
+            iters=800,        # Increased from 500 for better exploration
+            pop=80,           # Increased from 60 for more diversity
+            fine_top_k=30,    # Increased from 25 for more fine-tuning candidates
+            pair_limit=150),  # Increased from 100 for more pairwise exploration
+}
 
-print(f"FAST_MODE={FAST_LEVEL} | FOLDS={FOLDS} ITERS={ITERS} POP={POP} FINE_TOP_K={FINE_TOP_K} PAIR_LIMIT={PAIR_LIMIT}")
+
+def fast_level_from_env(value=None):
+    """Parse the FAST env value (unset/"0"/"false" -> 0, ints as-is, anything else -> 1)."""
+    if value is None:
+        value = os.getenv("FAST", None)
+    if value is None or value in ("0", "false", "False"):
+        return 0
+    try:
+        return int(value)
+    except Exception:
+        return 1
 
 # ---------------------------
-# Paths / Config
+# Paths / Config (defaults for TrainConfig)
 # ---------------------------
 PROCESSED_DIR = "data/processed"
 TEST_CSV = "data/test.csv"
 OUT_PATH = "models/model_ewoa2new.json"
-CACHE_DIR = Path("data/cache/features")
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 A_STRATEGY = "cos"
 OBL_FREQ = 5
@@ -94,7 +108,8 @@ FALLBACK_SPEC_FLOOR = 0.35
 SENS_WEIGHT         = 0.50     # strong recall bias
 LAMBDA_SPEC         = 1.00     # balanced fallback (don’t over-favor spec)
 
-
+# Both spec and sens must reach this for a τ to count as "constrained" (objective + final pick)
+TARGET_THRESHOLD    = 0.70
 
 # In choose_tau_arrays(...) defaults:
 target_spec  = 0.40           # aim fallback near 0.40 spec
@@ -102,8 +117,62 @@ target_alpha = 0.25           # stronger pull toward target_spec
 
 # ---------- Local τ refinement (search wider & finer) ----------
 LOCAL_TAU_RADIUS    = 0.10     # was 0.05
-LOCAL_TAU_STEPS     = 201  
-       # ↑ from 0.90
+LOCAL_TAU_STEPS     = 201
+
+# ---------- CV τ seeds for the local refinement ----------
+# "winner": fold τ of the selected subset, "top": pooled over the TAU_TOP_N best
+# subsets, "all": streaming sketch over every evaluation (bounded memory)
+TAU_SEED_SOURCE     = "winner"
+TAU_TOP_N           = 8
+
+# ---------- Test-time constraint-picked τ ----------
+SPEC_FLOOR = 0.40
+TAU_GRID_TEST = np.linspace(0.90, 1.15, 181)
+
+# ---------- Test-time bootstrap CIs (bootstrap.py) ----------
+# BOOTSTRAP_REPLICATES class-stratified resamples of the TEST set (0 = off); percentile
+# intervals at BOOTSTRAP_LEVEL for the official / constrained operating points
+BOOTSTRAP_REPLICATES = 2000
+BOOTSTRAP_LEVEL = 0.95
+# Training features are standardized in blocks of about this many bytes, so a memory-mapped
+# train split is never copied whole (TrainingData)
+STANDARDIZE_BLOCK_BYTES = 64 << 20
+RESULTS_DIR = "."             # where the script (from_env / main) writes results_eval_pipeline.csv / _summary.csv
+
+# Mini-batch objective for large cohorts: during the optimizer run every fold scores on a
+# class-balanced subsample of at most MINIBATCH rows per class (τ split and holdout each),
+# growing geometrically to MINIBATCH_FINAL by the last iteration. None = full data.
+# Elites are re-scored on full data before fine-tuning.
+MINIBATCH = None
+MINIBATCH_FINAL = None
+
+# Pre-filter stages run before EWOA, comma-separated in order from {fisher, mi, corr}
+# ("" = search every column). fisher/mi keep the PREFILTER_KEEP best columns, corr keeps
+# one representative per group with |correlation| >= PREFILTER_CORR.
+PREFILTER = ""
+PREFILTER_KEEP = 40
+PREFILTER_CORR = 0.95
+MIN_FEATURES = 10            # the objective's subset-size bounds (outside -> penalty)
+MAX_FEATURES = 35
+
+# Score each optimizer population with the batched CV kernel (all candidates of one subset
+# size per fold in a single pass) instead of one objective call per whale
+BATCH_KERNEL = True
+
+# Data-parallel objective (sharded.py): split the training rows over SHARDS worker
+# processes that return per-class moments and τ-sweep counts (0 / 1 = single process)
+SHARDS = 0
+
+# Warm-start archive (archive.py): SQLite file of evaluated subsets shared across runs
+# (None = off). Known subsets are not re-evaluated, and WARM_START of the initial
+# population is seeded from the archive's elites.
+ARCHIVE_PATH = None
+WARM_START = 0.25
+
+# Wall-clock budget in seconds (budget.py; None = use the FAST tier as is). A short
+# calibration times the objective, then POP / ITERS / FINE_TOP_K / PAIR_LIMIT are scaled
+# from the tier to finish within the budget (TIME_BUDGET env, e.g. 5400, 90m, 2h).
+TIME_BUDGET = None
 
 # Class error weights during feature search (discourage FP a bit more)
 W_B = 1.0                # ↑ from 1.2
@@ -112,48 +181,256 @@ W_M = 1.0                     # keep
 # Covariance
 COV_SHRINKAGE = True
 
+# Compute precision of the standardized feature store, class moments and distance
+# kernels ("float64" or "float32"). Covariance factorization always runs in float64.
+PRECISION = "float64"
+_DTYPES = {"float64": np.float64, "float32": np.float32}
+
 # RNG
 RANDOM_SEED = 42
-np.random.seed(RANDOM_SEED)
-random.seed(RANDOM_SEED)
+
+
+@dataclass
+class TrainConfig:
+    """Everything one training run depends on (FAST tier, optimizer, τ policy, paths)."""
+
+    fast_level: int = 0
+    folds: int = FAST_TIERS[0]["folds"]
+    iters: int = FAST_TIERS[0]["iters"]
+    pop: int = FAST_TIERS[0]["pop"]
+    fine_top_k: int = FAST_TIERS[0]["fine_top_k"]
+    pair_limit: int = FAST_TIERS[0]["pair_limit"]
+
+    algo: str = "ewoa"
+    a_strategy: str = A_STRATEGY
+    obl_freq: int = OBL_FREQ
+    obl_rate: float = OBL_RATE
+
+    # τ policy
+    tau_grid: np.ndarray = field(default_factory=lambda: TAU_GRID.copy())
+    min_sensitivity: float = MIN_SENSITIVITY
+    min_specificity: float = MIN_SPECIFICITY
+    fallback_spec_floor: float = FALLBACK_SPEC_FLOOR
+    sens_weight: float = SENS_WEIGHT
+    lambda_spec: float = LAMBDA_SPEC
+    target_threshold: float = TARGET_THRESHOLD
+    local_tau_radius: float = LOCAL_TAU_RADIUS
+    local_tau_steps: int = LOCAL_TAU_STEPS
+    tau_seed_source: str = TAU_SEED_SOURCE
+    tau_top_n: int = TAU_TOP_N
+    spec_floor: float = SPEC_FLOOR
+    tau_grid_test: np.ndarray = field(default_factory=lambda: TAU_GRID_TEST.copy())
+    bootstrap_replicates: int = BOOTSTRAP_REPLICATES
+    bootstrap_level: float = BOOTSTRAP_LEVEL
+
+    # objective
+    w_b: float = W_B
+    w_m: float = W_M
+    cov_shrinkage: bool = COV_SHRINKAGE
+    precision: str = PRECISION
+    minibatch: Optional[int] = MINIBATCH
+    minibatch_final: Optional[int] = MINIBATCH_FINAL
+    prefilter: str = PREFILTER
+    prefilter_keep: int = PREFILTER_KEEP
+    prefilter_corr: float = PREFILTER_CORR
+    batch_kernel: bool = BATCH_KERNEL
+    shards: int = SHARDS
+    archive_path: Optional[str] = ARCHIVE_PATH
+    warm_start: float = WARM_START
+    time_budget: Optional[float] = TIME_BUDGET
+    random_seed: int = RANDOM_SEED
+    # Fine-tuning evaluates waves of candidate flips in parallel (same accept/reject
+    # outcome as one-at-a-time); 1 = strictly serial.
+    finetune_workers: int = 1
+    # Processes extracting TEST features when they are built from test_csv (extract_pool.py)
+    extract_workers: int = 1
+
+    # paths
+    processed_dir: str = PROCESSED_DIR
+    test_csv: str = TEST_CSV
+    out_path: Optional[str] = OUT_PATH   # None -> don't write the model
+    results_dir: Optional[str] = None   # None -> don't write the results CSVs (from_env: RESULTS_DIR)
+    feature_cache: Optional[str] = FEATURE_CACHE   # None -> extract test images without the cache
+
+    verbose: bool = True
+
+    @classmethod
+    def for_fast_level(cls, level, **overrides):
+        tier = FAST_TIERS.get(int(level), FAST_TIERS[0])
+        return cls(**{"fast_level": int(level), **tier, **overrides})
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """Config from the FAST / FINETUNE_WORKERS / PRECISION / MINIBATCH[_FINAL] / PREFILTER / SHARDS / ARCHIVE / TIME_BUDGET / EXTRACT_WORKERS env (the script's behaviour)."""
+        workers = int(os.getenv("FINETUNE_WORKERS", min(4, os.cpu_count() or 1)))
+        env = {"finetune_workers": workers, "precision": os.getenv("PRECISION", PRECISION),
+               "prefilter": os.getenv("PREFILTER", PREFILTER),
+               "archive_path": os.getenv("ARCHIVE") or ARCHIVE_PATH,
+               "time_budget": parse_duration(os.getenv("TIME_BUDGET")) or TIME_BUDGET,
+               "results_dir": RESULTS_DIR}
+        for key in ("MINIBATCH", "MINIBATCH_FINAL", "SHARDS", "EXTRACT_WORKERS"):
+            if os.getenv(key):
+                env[key.lower()] = int(os.getenv(key))
+        return cls.for_fast_level(fast_level_from_env(), **{**env, **overrides})
+
+    def minibatch_size(self, progress):
+        """Rows per class for the given optimizer progress in [0, 1] (None = full data)."""
+        if not self.minibatch:
+            return None
+        start = float(self.minibatch)
+        final = float(self.minibatch_final or self.minibatch)
+        return int(round(start * (final / start) ** min(max(progress, 0.0), 1.0)))
+
+    def with_overrides(self, **overrides):
+        return replace(self, **overrides)
 
 # ---------------------------
 # Utilities
 # ---------------------------
-def _ledoit_cov(X):
-    return LedoitWolf().fit(X).covariance_
-
-def _pooled_inv_cov(Xb, Xm):
-    # Xb, Xm: (n_samples, n_features)
-    if Xb.shape[0] < 2 or Xm.shape[0] < 2:
-        dim = Xb.shape[1] if Xb.shape[1] > 0 else (Xm.shape[1] if Xm.shape[1] > 0 else 1)
-        return np.eye(dim)
+def _compute_dtype(precision):
+    if precision not in _DTYPES:
+        raise ValueError(f"Unknown precision: {precision} (expected one of {sorted(_DTYPES)})")
+    return _DTYPES[precision]
+
+def _pooled_cov_moments(mb, mm, idx, shrinkage=COV_SHRINKAGE):
+    # mb, mm: ClassMoments over all features; idx: feature subset
+    idx = np.asarray(idx, dtype=int)
+    if mb.n < 2 or mm.n < 2:
+        return np.eye(idx.size if idx.size > 0 else 1)
     eps = 1e-3  # strengthened regularization
-    if COV_SHRINKAGE:
-        Sb = _ledoit_cov(Xb)
-        Sm = _ledoit_cov(Xm)
+    if shrinkage:
+        Sb = mb.ledoit_wolf(idx)
+        Sm = mm.ledoit_wolf(idx)
     else:
-        Sb = np.cov(Xb.T) + eps * np.eye(Xb.shape[1])
-        Sm = np.cov(Xm.T) + eps * np.eye(Xm.shape[1])
+        Sb = mb.covariance(idx, ddof=1) + eps * np.eye(idx.size)
+        Sm = mm.covariance(idx, ddof=1) + eps * np.eye(idx.size)
     Sp = 0.5 * (Sb + Sm)
     # Additional regularization: convex combination with identity
     Sp = (1 - eps) * Sp + eps * np.eye(Sp.shape[0])
-    return np.linalg.pinv(Sp)
-
-def _hash_path(p):
-    return hashlib.sha1(str(p).encode("utf-8")).hexdigest()
-
-def _extract_features_cached(image_path):
-    h = _hash_path(image_path)
-    cache_file = CACHE_DIR / f"{h}.json"
-    if cache_file.exists():
-        with open(cache_file, "r") as f:
-            feats = json.load(f)
+    return Sp
+
+def _pooled_factor(mb, mm, shrinkage=COV_SHRINKAGE, dtype=np.float64):
+    # class moments over the selected features -> Cholesky factor of the pooled covariance
+    idx = np.arange(mb.dim)
+    return CholeskyFactor(_pooled_cov_moments(mb, mm, idx, shrinkage), idx, dtype)
+
+def _pooled_cov_batch(mb, mm, idx, shrinkage=COV_SHRINKAGE):
+    # stacked _pooled_cov_moments for idx (m, k): (m, k, k)
+    idx = np.asarray(idx, dtype=int)
+    eye = np.eye(idx.shape[1])
+    eps = 1e-3
+    if shrinkage:
+        Sb = mb.ledoit_wolf_batch(idx)
+        Sm = mm.ledoit_wolf_batch(idx)
     else:
-        feats = extract_image_features(image_path)
-        with open(cache_file, "w") as f:
-            json.dump(feats, f)
-    return feats
+        Sb = mb.covariance_batch(idx, ddof=1) + eps * eye
+        Sm = mm.covariance_batch(idx, ddof=1) + eps * eye
+    Sp = 0.5 * (Sb + Sm)
+    return (1 - eps) * Sp + eps * eye
+
+def _fold_factor_cache(moments, shrinkage=COV_SHRINKAGE, dtype=np.float64):
+    mb, mm = moments.benign, moments.malignant
+    build = lambda idx: _pooled_cov_moments(mb, mm, idx, shrinkage)
+    # Without shrinkage every subset covariance is a principal submatrix of the
+    # full pooled matrix, so flips can update a neighbouring factor in place.
+    # Ledoit-Wolf re-estimates the shrinkage per subset, so only exact hits apply.
+    pooled = None if shrinkage else build(np.arange(moments.benign.dim))
+    return FactorCache(build, pooled=pooled, dtype=dtype)
+
+class RatioScorer:
+    """
+    Class means + pooled factor over the selected features of the full training set.
+    `moments` (with m3) are kept so new labelled cases can be merged in later (update.py).
+    """
+
+    def __init__(self, Xb, Xm, shrinkage=COV_SHRINKAGE, precision=PRECISION):
+        dtype = _compute_dtype(precision)
+        self.moments = FoldMoments(ClassMoments.from_samples(Xb, dtype, third=True),
+                                   ClassMoments.from_samples(Xm, dtype, third=True))
+        self.mu_B = Xb.mean(axis=0)
+        self.mu_M = Xm.mean(axis=0)
+        self.factor = _pooled_factor(self.moments.benign, self.moments.malignant, shrinkage, dtype)
+
+    @classmethod
+    def from_moments(cls, moments, shrinkage=COV_SHRINKAGE, precision=PRECISION):
+        scorer = cls.__new__(cls)
+        dtype = _compute_dtype(precision)
+        scorer.moments = moments
+        scorer.mu_B = moments.benign.mean.astype(dtype)
+        scorer.mu_M = moments.malignant.mean.astype(dtype)
+        scorer.factor = _pooled_factor(moments.benign, moments.malignant, shrinkage, dtype)
+        return scorer
+
+    def distances(self, Xmat):
+        dB = np.sqrt(self.factor.sq_mahalanobis(Xmat - self.mu_B))
+        dM = np.sqrt(self.factor.sq_mahalanobis(Xmat - self.mu_M))
+        return dB, dM
+
+def _standardize(X_raw, mu, sigma, precision=PRECISION):
+    if precision == "float32":
+        X_raw, mu, sigma = (np.asarray(a, dtype=np.float32) for a in (X_raw, mu, sigma))
+        return (X_raw - mu) / (sigma + np.float32(1e-6))
+    return (X_raw - mu) / (sigma + 1e-6)
+
+def _column_stats(X, block_bytes=STANDARDIZE_BLOCK_BYTES):
+    """Column mean and std (+1e-6) of X, read a few columns at a time."""
+    n, d = X.shape
+    # at least two columns per block: a single-column view reduces in a different
+    # summation order, and the stats must equal X.mean(axis=0) / X.std(axis=0) bit for bit
+    width = max(2, block_bytes // max(1, n * X.dtype.itemsize))
+    bounds = list(range(0, d, width)) + [d]
+    if len(bounds) > 2 and bounds[-1] - bounds[-2] < 2:
+        del bounds[-2]
+    blocks = [X[:, a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+    return (np.concatenate([blk.mean(axis=0) for blk in blocks]),
+            np.concatenate([blk.std(axis=0) + 1e-6 for blk in blocks]))
+
+def _fill_rows(out, X, fn, block_bytes=STANDARDIZE_BLOCK_BYTES):
+    """out[rows] = fn(X[rows]) over row blocks (out may be a file-backed array)."""
+    step = max(1, block_bytes // max(1, X.shape[1] * X.dtype.itemsize))
+    for start in range(0, X.shape[0], step):
+        out[start:start + step] = fn(X[start:start + step])
+
+def _decision_parity(dist, dist_ref, taus):
+    """
+    Compare the decisions of two (dB, dM) scorings of the same rows at each named τ.
+    Returns {name: {"tau", "changed", "changed_rows"}, "max_abs_ratio_diff": ...}.
+    """
+    dB, dM = (np.asarray(d, dtype=np.float64) for d in dist)
+    dB_ref, dM_ref = (np.asarray(d, dtype=np.float64) for d in dist_ref)
+    out = {"max_abs_ratio_diff": float(np.max(np.abs(dM / (dB + 1e-12) - dM_ref / (dB_ref + 1e-12)), initial=0.0))}
+    for name, tau in taus.items():
+        changed = np.flatnonzero((dM <= tau * dB) != (dM_ref <= tau * dB_ref))
+        out[name] = {"tau": float(tau), "changed": int(changed.size), "changed_rows": changed.tolist()}
+    return out
+
+def _tau_counts(dB, dM, y, taus):
+    # vectorized over τ: predictions (..., T, n) with the rule dM <= τ * dB
+    # (dB, dM may carry leading candidate axes: (n,) -> (T,), (m, n) -> (m, T))
+    # Only predicted-positive counts per class are needed; fn / tn follow from the
+    # class sizes. Counts of disjoint row blocks add up (sharded objective).
+    taus = np.asarray(taus, dtype=float)[:, None]
+    pos = (y == 1)
+    n_pos = int(np.sum(pos))
+    n_neg = int(pos.size - n_pos)
+    tp = np.count_nonzero(dM[..., pos][..., None, :] <= taus * dB[..., pos][..., None, :], axis=-1)
+    fp = np.count_nonzero(dM[..., ~pos][..., None, :] <= taus * dB[..., ~pos][..., None, :], axis=-1)
+    return tp, fp, n_pos, n_neg
+
+def _spec_sens_rates(tp, fp, n_pos, n_neg):
+    fn = n_pos - tp
+    tn = n_neg - fp
+    return tn / (tn + fp + 1e-9), tp / (tp + fn + 1e-9)
+
+def _spec_sens_counts(dB, dM, y, taus):
+    return _spec_sens_rates(*_tau_counts(dB, dM, y, taus))
+
+def _constrained_maximin_index(specs, senss, threshold=TARGET_THRESHOLD):
+    # row-wise choose_tau_constrained over (m, T) grids -> (m,) τ indices
+    arr_min = np.minimum(specs, senss)
+    feasible = (specs >= threshold) & (senss >= threshold)
+    i_feas = np.argmax(np.where(feasible, arr_min, -np.inf), axis=1)
+    return np.where(feasible.any(axis=1), i_feas, np.argmax(arr_min, axis=1))
 
 def _vec_from_feats(feats, feature_names):
     vec = np.array([feats.get(n, 0.0) for n in feature_names], dtype=np.float32)
@@ -169,6 +446,32 @@ def _parse_label_any(lbl):
         return 0
     raise RuntimeError(f"Unrecognized label value: {lbl}")
 
+def _build_test_from_csv(TEST_CSV, feature_names, feature_cache=FEATURE_CACHE, workers=1, options=None):
+    meta = pd.read_csv(TEST_CSV)
+    if "image_path" not in meta.columns:
+        raise RuntimeError("TEST_CSV must contain 'image_path' column.")
+    results = extract_many(meta["image_path"].astype(str).tolist(), workers=workers,
+                           extract=partial(cached_extract, cache_path=feature_cache, options=options))
+    failed = [r for r in results if not r.ok]
+    if failed:
+        raise RuntimeError(f"Feature extraction failed for {len(failed)} test image(s): " +
+                           "; ".join(f"{r.path}: {r.error}" for r in failed[:5]))
+    X_rows, y_rows = [], []
+    for (_, row), res in zip(meta.iterrows(), results):
+        vec = _vec_from_feats(res.feats, feature_names)
+        X_rows.append(vec)
+        lbl = row.get("Class", "")
+        s = str(lbl).strip().lower()
+        if s in {"b", "benign", "0"}:
+            y_rows.append(0)
+        elif s in {"m", "malignant", "1"}:
+            y_rows.append(1)
+        else:
+            y_rows.append(_parse_label_any(lbl))
+    if len(X_rows) == 0:
+        raise RuntimeError("No test rows found or feature extraction failed.")
+    return np.vstack(X_rows), np.array(y_rows, dtype=np.int32)
+
 # ---------------------------
 # Maximin τ chooser (maximizes minimum of spec and sens)
 # ---------------------------
@@ -181,6 +484,50 @@ def choose_tau_maximin(taus, specs, senss):
     i = int(np.nanargmax(arr_min))
     return float(taus[i]), float(specs[i]), float(senss[i]), i, "maximin"
 
+def choose_tau_constrained(taus, specs, senss, threshold=TARGET_THRESHOLD):
+    """Maximin among τ where both spec and sens >= threshold, else plain maximin."""
+    taus  = np.asarray(taus, dtype=float)
+    specs_arr = np.asarray(specs, dtype=float)
+    senss_arr = np.asarray(senss, dtype=float)
+    feasible_mask = (specs_arr >= threshold) & (senss_arr >= threshold)
+    if np.any(feasible_mask):
+        # Among feasible, choose maximin
+        feasible_indices = np.where(feasible_mask)[0]
+        arr_min_feasible = np.minimum(specs_arr[feasible_indices], senss_arr[feasible_indices])
+        i = int(feasible_indices[np.argmax(arr_min_feasible)])
+        return float(taus[i]), float(specs_arr[i]), float(senss_arr[i]), i, "constrained_maximin"
+    # Fall back to maximin on all
+    return choose_tau_maximin(taus, specs_arr, senss_arr)
+
+# ---------------------------
+# Saved-model τ policy (constrained maximin on the grid, then local refinement)
+# ---------------------------
+def pick_tau(dB, dM, y, tau_grid, seeds=(), local_radius=LOCAL_TAU_RADIUS, local_steps=LOCAL_TAU_STEPS,
+             threshold=TARGET_THRESHOLD, sens_weight=SENS_WEIGHT):
+    """
+    The saved model's τ policy on scored validation rows: constrained maximin over `tau_grid`,
+    then the same rule on local grids around the grid winner and each of `seeds` (None skipped).
+    The local τ is adopted only if its sens-weighted score is higher.
+    Returns (τ, {"grid": (τ, spec, sens, mode), "local": (τ, spec, sens, mode)}).
+    """
+    specs, senss = _spec_sens_counts(dB, dM, y, tau_grid)
+    best_tau, spec0, sens0, _, mode = choose_tau_constrained(tau_grid, specs, senss, threshold)
+
+    seed_list = [best_tau] + [s for s in seeds if s is not None]
+    local = np.unique(np.hstack([
+        np.linspace(max(0.30, s - local_radius), s + local_radius, local_steps)
+        for s in seed_list
+    ]))
+    specs_loc, senss_loc = _spec_sens_counts(dB, dM, y, local)
+    best_tau_loc, spec1, sens1, _, mode_loc = choose_tau_constrained(local, specs_loc, senss_loc, threshold)
+
+    # adopt whichever has higher sens-weighted score
+    score0 = sens_weight * sens0 + (1.0 - sens_weight) * spec0
+    score1 = sens_weight * sens1 + (1.0 - sens_weight) * spec1
+    tau = float(best_tau_loc if score1 > score0 else best_tau)
+    return tau, {"grid": (float(best_tau), float(spec0), float(sens0), mode),
+                 "local": (float(best_tau_loc), float(spec1), float(sens1), mode_loc)}
+
 # ---------------------------
 # Robust τ chooser (feasible → Jλ-guard → best bal) - kept for backward compatibility
 # ---------------------------
@@ -219,502 +566,988 @@ def choose_tau_arrays(taus, specs, senss,
     return float(taus[i]), float(specs[i]), float(senss[i]), i, "bal_only"
 
 # ---------------------------
-# 1) Load training data (preprocessed)
+# 1) Training data (loaded once, reusable across configurations)
 # ---------------------------
-X_train, y_train, feature_names = load_processed_data(PROCESSED_DIR)
-dim = X_train.shape[1]
-
-if np.unique(y_train).shape[0] != 2:
-    raise RuntimeError(f"Train labels not binary: {np.unique(y_train)}")
-
-# Ensure 0 = Benign, 1 = Malignant
-if np.mean(y_train) > 0.5:
-    print("⚠️ Flipping labels: ensuring 0=Benign, 1=Malignant")
-    y_train = 1 - y_train
-
-ratio = float(np.mean(y_train))
-print(f"Class proportion (Malignant=1): {ratio:.3f}")
-if ratio < 0.02 or ratio > 0.98:
-    raise RuntimeError("Severely imbalanced labels detected. Check preprocess outputs.")
-
-# Keep raw train stats to normalize test later
-train_mu = X_train.mean(axis=0)
-train_sigma = X_train.std(axis=0) + 1e-6
-X = (X_train - train_mu) / train_sigma  # standardized features
-
-skf = StratifiedKFold(n_splits=FOLDS, shuffle=True, random_state=RANDOM_SEED)
-
-# Fisher ranking for bounded fine-tuning
-def _fisher_scores(Xmat, yvec):
-    Xb = Xmat[yvec == 0]
-    Xm = Xmat[yvec == 1]
-    mu_b = Xb.mean(0); mu_m = Xm.mean(0)
-    var_b = Xb.var(0) + 1e-9; var_m = Xm.var(0) + 1e-9
-    return (mu_b - mu_m) ** 2 / (var_b + var_m)
-
-fisher = _fisher_scores(X, y_train)
-rank_idx = np.argsort(-fisher)
-fine_candidates = rank_idx[:min(FINE_TOP_K, dim)].tolist()
-if len(fine_candidates) == 0:
-    raise RuntimeError("No fine-tuning candidates found (dim==0?)")
+class TrainingData:
+    """
+    Loaded train/test arrays plus caches keyed by the configuration that shapes
+    them (fold plans with class moments and factor caches, test features).
+    Pass the same instance to several train_and_evaluate calls to skip reloading.
+    With `split` (the dataset Split X_train was read from, as load() passes) the
+    standardized features are stored next to it (Split.derived) and memory-mapped:
+    they are built block by block, and every process training on the same dataset
+    generation maps the same file. Without it they are computed in memory.
+    """
+
+    def __init__(self, X_train, y_train, feature_names, X_test=None, y_test=None, verbose=True, extraction=None,
+                 split=None):
+        y_train = np.asarray(y_train)
+        if np.unique(y_train).shape[0] != 2:
+            raise RuntimeError(f"Train labels not binary: {np.unique(y_train)}")
+
+        # Ensure 0 = Benign, 1 = Malignant
+        if np.mean(y_train) > 0.5:
+            if verbose:
+                print("⚠️ Flipping labels: ensuring 0=Benign, 1=Malignant")
+            y_train = 1 - y_train
+
+        ratio = float(np.mean(y_train))
+        if verbose:
+            print(f"Class proportion (Malignant=1): {ratio:.3f}")
+        if ratio < 0.02 or ratio > 0.98:
+            raise RuntimeError("Severely imbalanced labels detected. Check preprocess outputs.")
+
+        self.X_train = X_train
+        self.y_train = y_train
+        self.feature_names = list(feature_names)
+        self.dim = X_train.shape[1]
+        # how the features were extracted (dataset manifest); test images and the model follow it
+        self.extraction = extraction or ExtractionOptions()
+
+        # Keep raw train stats to normalize test later
+        self.train_mu, self.train_sigma = _column_stats(X_train)
+        self._split = split
+        self.X = self._derived("standardized", np.result_type(X_train, self.train_mu, self.train_sigma),
+                               lambda b: (b - self.train_mu) / self.train_sigma)  # standardized features
+
+        self.X_test_raw = X_test
+        self.y_test = None if y_test is None else np.asarray(y_test).astype(np.int32)
+
+        self._fold_plans: Dict[tuple, list] = {}
+        self._fold_splits: Dict[tuple, list] = {}
+        self._features: Dict[str, np.ndarray] = {}
+        self._prefilters: Dict[tuple, PrefilterResult] = {}
+        self._fisher = None
+        self._fingerprint = None
+
+    @classmethod
+    def load(cls, processed_dir=PROCESSED_DIR, verbose=True):
+        # raw and standardized arrays memory-mapped (shared page cache across worker processes)
+        dataset = Dataset.open(processed_dir)
+        train = dataset.split("train")
+        # prefer the preprocessed test split if present
+        X_test = y_test = None
+        if "test" in dataset:
+            X_test, y_test = dataset.split("test").X, dataset.split("test").y
+        return cls(train.X, np.asarray(train.y), dataset.feature_names, X_test, y_test, verbose=verbose,
+                   extraction=ExtractionOptions.from_dict(dataset.manifest.get("extraction")), split=train)
+
+    def _derived(self, key, dtype, fn):
+        # fn applied to row blocks of the raw training features: stored with the split, or in memory
+        def fill(out):
+            _fill_rows(out, self.X_train, fn)
+        if self._split is not None:
+            return self._split.derived(key, self.X_train.shape, dtype, fill)
+        out = np.empty(self.X_train.shape, dtype=dtype)
+        fill(out)
+        return out
+
+    @property
+    def fingerprint(self):
+        """Hash of the training arrays and feature names (warm-start archive context)."""
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(np.asarray(self.X_train), self.y_train, self.feature_names)
+        return self._fingerprint
+
+    def archive(self, config):
+        """SubsetArchive at config.archive_path for this data + fold plan + objective configuration."""
+        # everything a subset's CV fitness depends on; the family leaves out the data
+        objective = {
+            "objective": "train_and_eval.CVObjective", "folds": int(config.folds), "seed": int(config.random_seed),
+            "w_b": config.w_b, "w_m": config.w_m, "cov_shrinkage": bool(config.cov_shrinkage),
+            "precision": config.precision, "target_threshold": config.target_threshold,
+            "tau_grid": np.asarray(config.tau_grid, dtype=float).tolist(),
+            "min_features": MIN_FEATURES, "max_features": MAX_FEATURES,
+        }
+        return SubsetArchive(config.archive_path, fingerprint(objective, self.fingerprint),
+                             fingerprint(objective), self.feature_names)
+
+    @property
+    def fisher(self):
+        if self._fisher is None:
+            self._fisher = _fisher_scores(self.X, self.y_train)
+        return self._fisher
+
+    def prefilter(self, stages, keep=PREFILTER_KEEP, corr=PREFILTER_CORR, seed=RANDOM_SEED):
+        """Reduced search space for the given stages (cached per parameters)."""
+        stages = tuple(s.strip() for s in (stages.split(",") if isinstance(stages, str) else stages) if s.strip())
+        key = (stages, int(keep), float(corr), int(seed))
+        if key not in self._prefilters:
+            self._prefilters[key] = _run_prefilter(self.X, self.y_train, stages, keep, corr,
+                                                   min_features=MIN_FEATURES, seed=seed)
+        return self._prefilters[key]
+
+    def features(self, precision=PRECISION):
+        """
+        Standardized train features for a precision. "float64" is the store as
+        standardized (kernels upcast), "float32" a float32 copy (or the same
+        array when it already is float32), derived like the store.
+        """
+        dtype = _compute_dtype(precision)
+        if precision == "float64" or self.X.dtype == dtype:
+            return self.X
+        if precision not in self._features:
+            self._features[precision] = self._derived(
+                f"standardized_{precision}", dtype,
+                lambda b: ((b - self.train_mu) / self.train_sigma).astype(dtype))
+        return self._features[precision]
+
+    def fold_splits(self, folds, seed=RANDOM_SEED):
+        """Row indices (train, τ split, holdout) per outer fold; the τ split is a subset of train."""
+        key = (int(folds), int(seed))
+        if key not in self._fold_splits:
+            y = self.y_train
+            skf = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+            splits = []
+            for tr_idx, va_idx in skf.split(self.X, y):
+                # inner split to choose τ (indices depend only on labels and the seed)
+                _, inner_val = train_test_split(
+                    np.arange(tr_idx.size), test_size=0.25, stratify=y[tr_idx], random_state=123
+                )
+                splits.append((tr_idx, tr_idx[inner_val], va_idx))
+            self._fold_splits[key] = splits
+        return self._fold_splits[key]
+
+    def fold_plan(self, folds, seed=RANDOM_SEED, shrinkage=COV_SHRINKAGE, precision=PRECISION):
+        """
+        Outer splits, inner τ-split, class moments and factor caches. All of it is
+        subset-independent, so it is built once per (folds, seed, shrinkage, precision).
+        """
+        key = (int(folds), int(seed), bool(shrinkage), str(precision))
+        if key in self._fold_plans:
+            return self._fold_plans[key]
+        dtype = _compute_dtype(precision)
+        X, y = self.features(precision), self.y_train
+        plan = []
+        for tr_idx, tau_idx, va_idx in self.fold_splits(folds, seed):
+            fold_moments = FoldMoments.from_samples(X[tr_idx], y[tr_idx], dtype)
+            plan.append({
+                "moments": fold_moments,
+                "factors": _fold_factor_cache(fold_moments, shrinkage, dtype),
+                "X_val_sub": X[tau_idx],
+                "y_val_sub": y[tau_idx],
+                "X_va": X[va_idx],
+                "y_va": y[va_idx],
+            })
+        self._fold_plans[key] = plan
+        return plan
+
+    def test_set(self, test_csv=TEST_CSV, feature_cache=FEATURE_CACHE, workers=1):
+        """Raw test features/labels (processed arrays if present, else built from test_csv by `workers` processes)."""
+        if self.X_test_raw is None:
+            self.X_test_raw, self.y_test = _build_test_from_csv(test_csv, self.feature_names, feature_cache, workers,
+                                                                self.extraction)
+        return self.X_test_raw, self.y_test
 
 # ---------------------------
 # 2) Objective: weighted CV error (Mahalanobis ratio with τ chosen on inner val)
-#    + size regularization and fold τ collection
+#    + size regularization and fold τ statistics
 # ---------------------------
-def objective(mask):
-    selected = [i for i, v in enumerate(mask) if v > 0.5]
-    k = len(selected)
-    if k == 0:
-        return 1e6
-    # prefer ~10–35 features; penalize extremes lightly
-    if k < 10:
-        return 1e6 + (10 - k) * 1e-4
-    if k > 35:
-        return 1e6 + (k - 35) * 1e-4
-
-    fold_errors, fold_errB, fold_errM = [], [], []
-    if not hasattr(objective, "fold_taus"):
-        objective.fold_taus = []
-
-    for tr_idx, va_idx in skf.split(X, y_train):
-        Xtr = X[tr_idx][:, selected]
-        Xva = X[va_idx][:, selected]
-        ytr = y_train[tr_idx]
-        yva = y_train[va_idx]
-
-        Xb = Xtr[ytr == 0]
-        Xm = Xtr[ytr == 1]
-        if Xb.shape[0] < 2 or Xm.shape[0] < 2:
-            return 1e6
-
-        mu_b = Xb.mean(axis=0)
-        mu_m = Xm.mean(axis=0)
-        Sp_inv = _pooled_inv_cov(Xb, Xm)
-
-        def dB(x):
-            z = x - mu_b
-            return np.sqrt(z @ Sp_inv @ z)
-
-        def dM(x):
-            z = x - mu_m
-            return np.sqrt(z @ Sp_inv @ z)
-
-        # inner split to choose τ
-        Xtr_sub, Xval_sub, ytr_sub, yval_sub = train_test_split(
-            Xtr, ytr, test_size=0.25, stratify=ytr, random_state=123
+class CVObjective:
+    """
+    Callable objective over feature masks. Keeps last_B / last_M (class errors
+    of the last full evaluation) and nfe (committed evaluations). Fold τ values
+    go to bounded-memory stats: tau_ledger (per-subset τ of the best subsets)
+    and tau_sketch (streaming quantiles over every evaluation). With an attached
+    SubsetArchive, known subsets are answered from it instead of re-evaluated
+    (archive_hits counts those) and new full-data evaluations are added to it.
+    """
+
+    def __init__(self, data: TrainingData, config: TrainConfig, index_map=None):
+        # index_map: mask position -> original column (pre-filtered search space)
+        self.index_map = None if index_map is None else np.asarray(index_map, dtype=int)
+        self.plan = self._fold_plan(data, config)
+        self.tau_grid = np.asarray(config.tau_grid, dtype=float)
+        self.threshold = config.target_threshold
+        self.w_b = config.w_b
+        self.w_m = config.w_m
+        self.shrinkage = config.cov_shrinkage
+        self.dtype = _compute_dtype(config.precision)
+        self.batch_kernel = config.batch_kernel
+        self.tau_top_n = config.tau_top_n
+        self.random_seed = config.random_seed
+        self.reset_tau_stats()
+        self.nfe = 0
+        # per-fold (τ-split rows, holdout rows) while mini-batching; None = full data
+        self._batch = None
+        self.archive = None
+        self.archive_hits = 0
+        self._known: Dict[tuple, tuple] = {}
+
+    def _fold_plan(self, data, config):
+        return data.fold_plan(config.folds, config.random_seed, config.cov_shrinkage, config.precision)
+
+    def close(self):
+        """Release worker resources (none for the in-process objective)."""
+
+    def attach_archive(self, archive: SubsetArchive):
+        """Answer archived subsets from `archive` and add new full-data evaluations to it; returns #known."""
+        self.archive = archive
+        self._known = archive.known()
+        return len(self._known)
+
+    def _archived(self, subset):
+        # archived results are full-data scores: not valid while mini-batching
+        if self._batch is not None:
+            return None
+        return self._known.get(subset)
+
+    def reset_tau_stats(self):
+        self.tau_ledger = TauLedger(top_n=self.tau_top_n, seed=self.random_seed)
+        self.tau_sketch = QuantileSketch()
+
+    def set_batch(self, size, rng=None):
+        """
+        Score subsequent evaluations on a stratified, class-balanced subsample of at
+        most `size` rows per class in every fold's τ split and holdout (None = full data).
+        """
+        if size is None:
+            self._batch = None
+            return
+        rng = rng if rng is not None else np.random.default_rng()
+
+        def pick(y):
+            counts = [int(np.sum(y == c)) for c in (0, 1)]
+            if all(size >= n for n in counts):
+                return None
+            rows = [rng.choice(np.flatnonzero(y == c), size=min(size, n), replace=False)
+                    for c, n in zip((0, 1), counts)]
+            return np.sort(np.concatenate(rows))
+
+        self._batch = [(pick(fold["y_val_sub"]), pick(fold["y_va"])) for fold in self.plan]
+
+    def evaluate(self, mask):
+        """
+        Side-effect free CV evaluation.
+        Returns (fitness, (subset, fitness, fold_taus, errB, errM)); errB/errM are None on early exits.
+        """
+        selected = [i for i, v in enumerate(mask) if v > 0.5]
+        if self.index_map is not None:
+            selected = [int(self.index_map[i]) for i in selected]
+        hit = self._archived(tuple(selected))
+        if hit is not None:
+            fitness, fold_taus, errB, errM = hit
+            return fitness, (tuple(selected), fitness, list(fold_taus), errB, errM)
+        fitness, (fold_taus, errB, errM) = self._cv(selected)
+        return fitness, (tuple(selected), fitness, fold_taus, errB, errM)
+
+    def _cv(self, selected):
+        k = len(selected)
+        if k == 0:
+            return 1e6, ([], None, None)
+        # prefer ~10–35 features; penalize extremes lightly
+        if k < MIN_FEATURES:
+            return 1e6 + (MIN_FEATURES - k) * 1e-4, ([], None, None)
+        if k > MAX_FEATURES:
+            return 1e6 + (k - MAX_FEATURES) * 1e-4, ([], None, None)
+
+        fold_errors, fold_errB, fold_errM = [], [], []
+        fold_taus = []
+        W_B, W_M = self.w_b, self.w_m
+        TARGET_THRESHOLD = self.threshold
+
+        for f_i, fold in enumerate(self.plan):
+            mb = fold["moments"].benign
+            mm = fold["moments"].malignant
+            if mb.n < 2 or mm.n < 2:
+                return 1e6, (fold_taus, None, None)
+
+            # factor order may differ from `selected` when derived by flips
+            factor = fold["factors"].get(selected)
+            order = factor.order
+            mu_b = mb.mean_of(order)
+            mu_m = mm.mean_of(order)
+
+            def dB(Z):
+                return np.sqrt(factor.sq_mahalanobis(Z - mu_b))
+
+            def dM(Z):
+                return np.sqrt(factor.sq_mahalanobis(Z - mu_m))
+
+            rows_sub, rows_va = self._batch[f_i] if self._batch is not None else (None, None)
+            if rows_va is None:
+                Xva, yva = fold["X_va"][:, order], fold["y_va"]
+            else:
+                Xva, yva = fold["X_va"][np.ix_(rows_va, order)], fold["y_va"][rows_va]
+
+            # inner split to choose τ (precomputed in the fold plan)
+            if rows_sub is None:
+                Xval_sub, yval_sub = fold["X_val_sub"][:, order], fold["y_val_sub"]
+            else:
+                Xval_sub, yval_sub = fold["X_val_sub"][np.ix_(rows_sub, order)], fold["y_val_sub"][rows_sub]
+
+            specs, senss = _spec_sens_counts(dB(Xval_sub), dM(Xval_sub), yval_sub, self.tau_grid)
+
+            # Use constrained maximin: prefer solutions where both >= 0.70, else use maximin
+            best_tau, _, _, _, _ = choose_tau_constrained(self.tau_grid, specs, senss, TARGET_THRESHOLD)
+            fold_taus.append(float(best_tau))
+
+            # evaluate on fold holdout at chosen τ
+            pred = (dM(Xva) <= best_tau * dB(Xva)).astype(int)
+            eB = int(np.sum((pred != yva) & (yva == 0)))
+            eM = int(np.sum((pred != yva) & (yva == 1)))
+
+            errB = eB / (np.sum(yva == 0) + 1e-9)
+            errM = eM / (np.sum(yva == 1) + 1e-9)
+
+            # Calculate actual spec and sens for penalty
+            spec_fold = 1.0 - errB
+            sens_fold = 1.0 - errM
+
+            # Weighted error with heavy penalty if either drops below 70%
+            weighted = (W_B * errB + W_M * errM) / (W_B + W_M)
+
+            # Add large penalty if either metric is below target threshold
+            if spec_fold < TARGET_THRESHOLD:
+                weighted += 10.0 * (TARGET_THRESHOLD - spec_fold)  # Heavy penalty
+            if sens_fold < TARGET_THRESHOLD:
+                weighted += 10.0 * (TARGET_THRESHOLD - sens_fold)  # Heavy penalty
+
+            fold_errors.append(weighted)
+            fold_errB.append(errB)
+            fold_errM.append(errM)
+
+        return float(np.mean(fold_errors)), (
+            fold_taus, float(np.mean(fold_errB)), float(np.mean(fold_errM))
         )
 
-        specs, senss = [], []
-        for t in TAU_GRID:
-            yp = [1 if (dM(xi) <= t * dB(xi)) else 0 for xi in Xval_sub]
-            tn, fp, fn, tp = confusion_matrix(yval_sub, yp, labels=[0, 1]).ravel()
-            specs.append(tn / (tn + fp + 1e-9))
-            senss.append(tp / (tp + fn + 1e-9))
-
-        # Use constrained maximin: prefer solutions where both >= 0.70, else use maximin
-        specs_arr = np.array(specs)
-        senss_arr = np.array(senss)
-        TARGET_THRESHOLD = 0.70
-        
-        # First, try to find τ where both spec and sens >= 0.70
-        feasible_mask = (specs_arr >= TARGET_THRESHOLD) & (senss_arr >= TARGET_THRESHOLD)
-        if np.any(feasible_mask):
-            # Among feasible, choose maximin
-            feasible_indices = np.where(feasible_mask)[0]
-            arr_min_feasible = np.minimum(specs_arr[feasible_indices], senss_arr[feasible_indices])
-            i_feasible = feasible_indices[np.argmax(arr_min_feasible)]
-            best_tau = TAU_GRID[i_feasible]
-        else:
-            # Fall back to maximin on all
-            best_tau, _, _, _, _ = choose_tau_maximin(
-                TAU_GRID, specs, senss
-            )
-        objective.fold_taus.append(float(best_tau))
-
-        # evaluate on fold holdout at chosen τ
-        eB = 0
-        eM = 0
-        for xi, yi in zip(Xva, yva):
-            pred = 1 if (dM(xi) <= best_tau * dB(xi)) else 0
-            if pred != yi:
-                if yi == 0:
-                    eB += 1
-                else:
-                    eM += 1
-
-        errB = eB / (np.sum(yva == 0) + 1e-9)
-        errM = eM / (np.sum(yva == 1) + 1e-9)
-        
-        # Calculate actual spec and sens for penalty
-        spec_fold = 1.0 - errB
-        sens_fold = 1.0 - errM
-        
-        # Weighted error with heavy penalty if either drops below 70%
-        weighted = (W_B * errB + W_M * errM) / (W_B + W_M)
-        
-        # Add large penalty if either metric is below target threshold
-        if spec_fold < TARGET_THRESHOLD:
-            weighted += 10.0 * (TARGET_THRESHOLD - spec_fold)  # Heavy penalty
-        if sens_fold < TARGET_THRESHOLD:
-            weighted += 10.0 * (TARGET_THRESHOLD - sens_fold)  # Heavy penalty   
-
-
-        fold_errors.append(weighted)
-        fold_errB.append(errB)
-        fold_errM.append(errM)
-
-    objective.last_B = float(np.mean(fold_errB))
-    objective.last_M = float(np.mean(fold_errM))
-    return float(np.mean(fold_errors))
+    def record(self, payload):
+        """Apply an evaluation's side effects (fold τ statistics, last class errors)."""
+        subset, fitness, fold_taus, errB, errM = payload
+        self.nfe += 1
+        if self.archive is not None and self._batch is None and errB is not None:
+            if subset in self._known:
+                self.archive_hits += 1
+            else:
+                self._known[subset] = (fitness, list(fold_taus), errB, errM)
+                self.archive.add(subset, fitness, fold_taus, errB, errM)
+        if fold_taus:
+            self.tau_sketch.update(fold_taus)
+            self.tau_ledger.add(subset, fitness, fold_taus)
+        if errB is not None:
+            self.last_B = errB
+            self.last_M = errM
+
+    def __call__(self, mask):
+        score, payload = self.evaluate(mask)
+        self.record(payload)
+        return score
+
+    def batch(self, masks):
+        """Fitness of a whole population; side effects as if each mask were called in order."""
+        results = self.evaluate_batch(masks)
+        for _, payload in results:
+            self.record(payload)
+        return [score for score, _ in results]
+
+    def evaluate_batch(self, masks):
+        """
+        Side-effect free population evaluation, equivalent to [self.evaluate(m) for m in masks]
+        up to floating-point rounding. Duplicate subsets are scored once, and per fold all
+        candidates of one subset size share batched covariance, Cholesky and distance calls.
+        """
+        if not self.batch_kernel:
+            return [self.evaluate(m) for m in masks]
+        subsets = []
+        for mask in masks:
+            selected = [i for i, v in enumerate(mask) if v > 0.5]
+            if self.index_map is not None:
+                selected = [int(self.index_map[i]) for i in selected]
+            subsets.append(tuple(selected))
+
+        scored = {}
+        by_k: Dict[int, List[tuple]] = {}
+        for s in dict.fromkeys(subsets):
+            hit = self._archived(s)
+            if hit is not None:
+                fitness, fold_taus, errB, errM = hit
+                scored[s] = (fitness, (fold_taus, errB, errM))
+            elif MIN_FEATURES <= len(s) <= MAX_FEATURES:
+                by_k.setdefault(len(s), []).append(s)
+            else:
+                scored[s] = self._cv(list(s))  # size penalty, no fold work
+        for group in by_k.values():
+            scored.update(zip(group, self._cv_group(group)))
+
+        out = []
+        for s in subsets:
+            fitness, (fold_taus, errB, errM) = scored[s]
+            out.append((fitness, (s, fitness, list(fold_taus), errB, errM)))
+        return out
+
+    def _cv_group(self, subsets):
+        """Batched _cv for equally sized subsets: [(fitness, (fold_taus, errB, errM)), ...]."""
+        idx = np.asarray(subsets, dtype=int)
+        m, n_folds = idx.shape[0], len(self.plan)
+        fold_errB = np.zeros((m, n_folds))
+        fold_errM = np.zeros((m, n_folds))
+        fold_taus = np.zeros((m, n_folds))
+
+        for f_i, fold in enumerate(self.plan):
+            mb = fold["moments"].benign
+            mm = fold["moments"].malignant
+            if mb.n < 2 or mm.n < 2:
+                return [self._cv(list(s)) for s in subsets]
+            try:
+                L = np.linalg.cholesky(_pooled_cov_batch(mb, mm, idx, self.shrinkage))
+            except np.linalg.LinAlgError:
+                # a candidate is not positive definite: the per-subset path falls back to pinv
+                return [self._cv(list(s)) for s in subsets]
+
+            rows_sub, rows_va = self._batch[f_i] if self._batch is not None else (None, None)
+            Xval_sub, yval_sub = fold["X_val_sub"], fold["y_val_sub"]
+            if rows_sub is not None:
+                Xval_sub, yval_sub = Xval_sub[rows_sub], yval_sub[rows_sub]
+            Xva, yva = fold["X_va"], fold["y_va"]
+            if rows_va is not None:
+                Xva, yva = Xva[rows_va], yva[rows_va]
+            n_sub = Xval_sub.shape[0]
+
+            dB, dM = batch_ratio_distances(L, np.vstack([Xval_sub, Xva]), mb.mean, mm.mean, idx, self.dtype)
+
+            # τ per candidate on the inner split (constrained maximin), then holdout errors
+            specs, senss = _spec_sens_counts(dB[:, :n_sub], dM[:, :n_sub], yval_sub, self.tau_grid)
+            best_tau = self.tau_grid[_constrained_maximin_index(specs, senss, self.threshold)]
+            fold_taus[:, f_i] = best_tau
+
+            pred = dM[:, n_sub:] <= best_tau[:, None] * dB[:, n_sub:]
+            wrong = pred != (yva == 1)
+            fold_errB[:, f_i] = np.sum(wrong & (yva == 0), axis=1) / (np.sum(yva == 0) + 1e-9)
+            fold_errM[:, f_i] = np.sum(wrong & (yva == 1), axis=1) / (np.sum(yva == 1) + 1e-9)
+
+        return self._group_results(fold_taus, fold_errB, fold_errM)
+
+    def _group_results(self, fold_taus, fold_errB, fold_errM):
+        """(m, folds) τ / class errors -> _cv-style results (weighted error + threshold penalties)."""
+        W_B, W_M = self.w_b, self.w_m
+        TARGET_THRESHOLD = self.threshold
+        spec_fold = 1.0 - fold_errB
+        sens_fold = 1.0 - fold_errM
+        weighted = (W_B * fold_errB + W_M * fold_errM) / (W_B + W_M)
+        weighted = weighted + np.where(spec_fold < TARGET_THRESHOLD, 10.0 * (TARGET_THRESHOLD - spec_fold), 0.0)
+        weighted = weighted + np.where(sens_fold < TARGET_THRESHOLD, 10.0 * (TARGET_THRESHOLD - sens_fold), 0.0)
+        return [
+            (float(np.mean(weighted[c])),
+             ([float(t) for t in fold_taus[c]], float(np.mean(fold_errB[c])), float(np.mean(fold_errM[c]))))
+            for c in range(fold_taus.shape[0])
+        ]
+
+    def tau_seeds(self, subset, source=TAU_SEED_SOURCE):
+        """
+        (median, 40th percentile, source) of the CV fold τ for `subset`.
+        Falls back winner -> top-N -> all evaluations when a source has no τ.
+        """
+        if source not in ("winner", "top", "all"):
+            raise ValueError(f"Unknown τ seed source: {source}")
+        taus = np.empty(0)
+        if source == "winner":
+            taus = self.tau_ledger.taus(tuple(subset))
+        if taus.size == 0 and source != "all":
+            source = "top"
+            taus = self.tau_ledger.taus(top_n=self.tau_ledger.top_n)
+        if taus.size > 0:
+            return float(np.median(taus)), float(np.quantile(taus, 0.40)), source
+        return self.tau_sketch.median(), self.tau_sketch.quantile(0.40), "all"
 
 # ---------------------------
-# 3) Run optimizer (EWOA or WOA)
+# 3-7) Train, pick τ, save, evaluate on TEST
 # ---------------------------
-if "ewoa" == "ewoa":
-    best_mask, best_err, history = run_ewoa(
-        objective, dim, (-1, 1),
-        pop_size=POP, iters=ITERS,
-        a_strategy=A_STRATEGY, obl_freq=OBL_FREQ, obl_rate=OBL_RATE
-    )
-else:
-    best_mask, best_err, history = run_woa(objective, dim, (-1, 1), POP, ITERS)
-
-# ---------------------------
-# 4) Bounded greedy + pairwise fine-tuning
-# ---------------------------
-print("🔧 Greedy fine-tuning (bounded)...")
-best_subset = best_mask.copy()
-best_score = best_err
-
-for idx in fine_candidates:
-    cand = best_subset.copy()
-    cand[idx] = 1 - cand[idx]
-    err = objective(cand)
-    if err < best_score - 1e-6:
-        best_subset, best_score = cand, err
-        print(f"  ✅ Flip {idx}: {feature_names[idx]} -> {err:.4f}")
-
-print("🔁 Pairwise fine-tuning (bounded)...")
-pairs = []
-for a in fine_candidates:
-    for b in fine_candidates:
-        if b <= a:
-            continue
-        pairs.append((a, b, float(fisher[a] + fisher[b])))
-pairs.sort(key=lambda x: -x[2])
-pairs = pairs[:PAIR_LIMIT]
-
-for (i, j, _) in pairs:
-    cand = best_subset.copy()
-    cand[i], cand[j] = 1 - cand[i], 1 - cand[j]
-    err = objective(cand)
-    if err < best_score - 1e-4:
-        best_subset, best_score = cand, err
-        print(f"  ✅ Pair flip ({feature_names[i]}, {feature_names[j]}) -> {err:.4f}")
-
-selected_idx = [i for i, v in enumerate(best_subset) if v > 0.5]
-if len(selected_idx) == 0:
-    raise RuntimeError("No features selected after fine-tuning. Check objective.")
-
-# ---------------------------
-# 5) Fit class stats on full train (selected features) and pick final τ
-# ---------------------------
-Xb_full = X[y_train == 0][:, selected_idx]
-Xm_full = X[y_train == 1][:, selected_idx]
-mu_B = Xb_full.mean(axis=0)
-mu_M = Xm_full.mean(axis=0)
-Sp_inv_full = _pooled_inv_cov(Xb_full, Xm_full)
-
-# CV-aggregated τ seed (median across folds from objective)
-taus_cv = np.array(getattr(objective, "fold_taus", []), dtype=float)
-tau_cv_med = float(np.median(taus_cv)) if taus_cv.size > 0 else None
-tau_cv_q40 = float(np.quantile(taus_cv, 0.40)) if taus_cv.size > 0 else None
-
-# Train/Val split for global τ choice
-Xtr_sub, Xval_sub, ytr_sub, yval_sub = train_test_split(
-    X[:, selected_idx], y_train, test_size=0.25, stratify=y_train, random_state=54321
-)
-
-def _spec_sens_for_grid(taus, Xval=Xval_sub, yval=yval_sub):
-    specs, senss = [], []
-    for t in taus:
-        zB = Xval - mu_B
-        zM = Xval - mu_M
-        dB = np.sqrt(np.einsum('bi,ij,bj->b', zB, Sp_inv_full, zB))
-        dM = np.sqrt(np.einsum('bi,ij,bj->b', zM, Sp_inv_full, zM))
-        yp = (dM <= t * dB).astype(int)
-        tn, fp, fn, tp = confusion_matrix(yval, yp, labels=[0, 1]).ravel()
-        specs.append(tn / (tn + fp + 1e-9))
-        senss.append(tp / (tp + fn + 1e-9))
-    return np.array(specs), np.array(senss)
-
-# Global sweep with threshold-aware selection
-specs, senss = _spec_sens_for_grid(TAU_GRID)
-TARGET_THRESHOLD = 0.70
-specs_arr = np.array(specs)
-senss_arr = np.array(senss)
-
-# First try to find τ where both >= 70%
-feasible_mask = (specs_arr >= TARGET_THRESHOLD) & (senss_arr >= TARGET_THRESHOLD)
-if np.any(feasible_mask):
-    # Among feasible, choose maximin
-    feasible_indices = np.where(feasible_mask)[0]
-    arr_min_feasible = np.minimum(specs_arr[feasible_indices], senss_arr[feasible_indices])
-    i_feasible = feasible_indices[np.argmax(arr_min_feasible)]
-    best_tau = float(TAU_GRID[i_feasible])
-    spec0 = float(specs[i_feasible])
-    sens0 = float(senss[i_feasible])
-    mode = "constrained_maximin"
-else:
-    # Fall back to regular maximin
-    best_tau, spec0, sens0, best_idx, mode = choose_tau_maximin(
-        TAU_GRID, specs, senss
-    )
-print(f"[τ-train] chosen={best_tau:.3f} | train-val SPEC={spec0:.3f}, SENS={sens0:.3f} | mode={mode}")
-
-# Local refine around both global best AND CV-aggregated τ (if available)
-seed_list = [best_tau]
-if tau_cv_med is not None:
-    seed_list.append(tau_cv_med)
-if tau_cv_q40 is not None:
-    seed_list.append(tau_cv_q40)
-
-local = np.unique(np.hstack([
-    np.linspace(max(0.30, s - LOCAL_TAU_RADIUS), s + LOCAL_TAU_RADIUS, LOCAL_TAU_STEPS)
-    for s in seed_list
-]))
-specs_loc, senss_loc = _spec_sens_for_grid(local)
-# Apply same threshold-aware selection for local refinement
-specs_loc_arr = np.array(specs_loc)
-senss_loc_arr = np.array(senss_loc)
-feasible_mask_loc = (specs_loc_arr >= TARGET_THRESHOLD) & (senss_loc_arr >= TARGET_THRESHOLD)
-if np.any(feasible_mask_loc):
-    feasible_indices_loc = np.where(feasible_mask_loc)[0]
-    arr_min_feasible_loc = np.minimum(specs_loc_arr[feasible_indices_loc], senss_loc_arr[feasible_indices_loc])
-    i_feasible_loc = feasible_indices_loc[np.argmax(arr_min_feasible_loc)]
-    best_tau_loc = float(local[i_feasible_loc])
-    spec1 = float(specs_loc[i_feasible_loc])
-    sens1 = float(senss_loc[i_feasible_loc])
-    mode_loc = "constrained_maximin"
-else:
-    best_tau_loc, spec1, sens1, _, mode_loc = choose_tau_maximin(
-        local, specs_loc, senss_loc
-    )
-
-# adopt whichever has higher sens-weighted score
-score0 = SENS_WEIGHT * sens0 + (1.0 - SENS_WEIGHT) * spec0
-score1 = SENS_WEIGHT * sens1 + (1.0 - SENS_WEIGHT) * spec1
-final_tau = float(best_tau_loc if score1 > score0 else best_tau)
-
-def _spec_sens_for_tau(tau_val, Xval=Xval_sub, yval=yval_sub):
-    zB = Xval - mu_B
-    zM = Xval - mu_M
-    dB = np.sqrt(np.einsum('bi,ij,bj->b', zB, Sp_inv_full, zB))
-    dM = np.sqrt(np.einsum('bi,ij,bj->b', zM, Sp_inv_full, zM))
-    yp = (dM <= tau_val * dB).astype(int)
-    tn, fp, fn, tp = confusion_matrix(yval, yp, labels=[0, 1]).ravel()
-    return (tn / (tn + fp + 1e-9), tp / (tp + fn + 1e-9))
-
-spec_final, sens_final = _spec_sens_for_tau(final_tau)
-print(f"[τ-train-adjusted] final={final_tau:.3f} | train-val SPEC={spec_final:.3f}, SENS={sens_final:.3f}")
-
-# ---------------------------
-# 6) Save model
-# ---------------------------
-cvB = float(objective.last_B) if hasattr(objective, "last_B") else None
-cvM = float(objective.last_M) if hasattr(objective, "last_M") else None
-cv_combined = None
-if cvB is not None and cvM is not None:
-    cv_combined = float((W_B * cvB + W_M * cvM) / (W_B + W_M))
-
-model = {
-    "algo": "ewoa",
-    "iters": ITERS,
-    "pop": POP,
-    "a_strategy": A_STRATEGY,
-    "obl_freq": OBL_FREQ,
-    "obl_rate": OBL_RATE,
-    "feature_names": feature_names,
-    "selected_idx": selected_idx,
-    "selected_names": [feature_names[i] for i in selected_idx],
-    "train_mu": train_mu.tolist(),
-    "train_sigma": train_sigma.tolist(),
-    "class_labels": {"0": "Benign", "1": "Malignant"},
-    "class_stats": {"0": {"mu": mu_B.tolist()}, "1": {"mu": mu_M.tolist()}},
-    "Sp_inv": Sp_inv_full.tolist(),
-    "tau": float(final_tau),
-    "cv_error": cv_combined,
-    "cv_error_B": cvB,
-    "cv_error_M": cvM,
-    "cv_error_weights": {"benign": W_B, "malignant": W_M},
-    "policy": {
-        "taus": [float(t) for t in TAU_GRID],
-        "sens_weight": float(SENS_WEIGHT),
-        "min_sensitivity": float(MIN_SENSITIVITY),
-        "min_specificity": float(MIN_SPECIFICITY),
-        "fallback_spec_floor": float(FALLBACK_SPEC_FLOOR),
-        "lambda_spec": float(LAMBDA_SPEC),
-        "local_radius": float(LOCAL_TAU_RADIUS),
-    },
-}
-os.makedirs(os.path.dirname(OUT_PATH), exist_ok=True)
-with open(OUT_PATH, "w") as f:
-    json.dump(model, f, indent=2)
-print(f"\n✅ Model saved to {OUT_PATH}")
-print(f"Features: {dim}, Selected: {len(selected_idx)}")
-if cv_combined is not None:
-    print(f"CV Error: {cv_combined:.4f} (Benign={cvB:.4f}, Malignant={cvM:.4f})")
-
-# ---------------------------
-# 7) Test evaluation (strict, uses saved tau)
-# ---------------------------
-print("\n🔍 Evaluating model on TEST set...")
-
-# prefer preprocessed X_test / y_test if present
-X_test_path = os.path.join(PROCESSED_DIR, "X_test.npy")
-y_test_path = os.path.join(PROCESSED_DIR, "y_test.npy")
+def train_and_evaluate(config: Optional[TrainConfig] = None,
+                       data: Optional[TrainingData] = None,
+                       callback: Optional[Callable] = None) -> Dict:
+    """
+    Run one full training + evaluation.
+    callback(t, best_fit, history) is forwarded to the optimizer (truthy return stops it early).
+    With config.time_budget the tier's POP / ITERS / FINE_TOP_K / PAIR_LIMIT are replaced by a
+    calibrated plan (budget.py).
+    Returns {"model", "history", "best_score", "test", "constrained", "sweep", "summary", "bootstrap",
+             "precision_parity", "archive", "time_budget", "nfe", "runtime_s"}.
+    """
+    t_start = time.perf_counter()
+    config = config or TrainConfig.from_env()
+    log = print if config.verbose else (lambda *a, **k: None)
+    log(f"FAST_MODE={config.fast_level} | FOLDS={config.folds} ITERS={config.iters} POP={config.pop} "
+        f"FINE_TOP_K={config.fine_top_k} PAIR_LIMIT={config.pair_limit}")
+    if data is None:
+        data = TrainingData.load(config.processed_dir, verbose=config.verbose)
+
+    # RNG
+    np.random.seed(config.random_seed)
+    random.seed(config.random_seed)
+
+    X, y_train, feature_names, dim = data.features(config.precision), data.y_train, data.feature_names, data.dim
+    TAU_GRID = np.asarray(config.tau_grid, dtype=float)
+    SENS_WEIGHT = config.sens_weight
+    W_B, W_M = config.w_b, config.w_m
+
+    # search space: every column, or the pre-filtered ones (cols maps mask position -> column)
+    pf = None
+    cols = np.arange(dim)
+    if config.prefilter:
+        pf = data.prefilter(config.prefilter, config.prefilter_keep, config.prefilter_corr, config.random_seed)
+        cols = pf.index_map
+        log("🧹 Pre-filter: " + " → ".join(f"{s['stage']} {s['before']}→{s['after']}" for s in pf.stages))
+    search_dim = int(cols.size)
+
+    if config.shards > 1:
+        from woa_tool.sharded import ShardedObjective
+        objective = ShardedObjective(data, config, index_map=cols if pf is not None else None)
+        log(f"🧩 Sharded objective: {config.shards} row shards ({objective.shard_sizes} rows)")
+    else:
+        objective = CVObjective(data, config, index_map=cols if pf is not None else None)
 
-def _build_test_from_csv(TEST_CSV, feature_names):
-    meta = pd.read_csv(TEST_CSV)
-    if "image_path" not in meta.columns:
-        raise RuntimeError("TEST_CSV must contain 'image_path' column.")
-    X_rows, y_rows = [], []
-    for _, row in meta.iterrows():
-        img = row["image_path"]
-        feats = _extract_features_cached(img)
-        vec = _vec_from_feats(feats, feature_names)
-        X_rows.append(vec)
-        lbl = row.get("Class", "")
-        s = str(lbl).strip().lower()
-        if s in {"b", "benign", "0"}:
-            y_rows.append(0)
-        elif s in {"m", "malignant", "1"}:
-            y_rows.append(1)
+    # the objective's shard workers and the archive's buffered rows are released however the
+    # search ends (a callback raising, e.g. a sweep's TrialPruned, or KeyboardInterrupt)
+    archive, init_population, archive_stored = None, None, 0
+    try:
+        # time budget: calibrate the objective, then scale the tier's search to fit
+        budget: Optional[BudgetPlan] = None
+        if config.time_budget:
+            cal = calibrate(objective, search_dim, config.pop, (MIN_FEATURES, MAX_FEATURES), config.algo,
+                            config.a_strategy, config.obl_freq, config.obl_rate, seed=config.random_seed)
+            tier = {key: getattr(config, key) for key in ("iters", "pop", "fine_top_k", "pair_limit")}
+            budget = plan_budget(config.time_budget, cal, tier, search_dim, config.algo, config.obl_freq,
+                                 config.obl_rate, spent_s=time.perf_counter() - t_start, start=t_start)
+            config = config.with_overrides(**budget.overrides())
+            log(f"⏱️ Time budget {config.time_budget:.0f}s: calibration {cal.elapsed_s:.1f}s "
+                f"({cal.batch_s * 1e3:.2f} ms/candidate batched, {cal.single_s * 1e3:.2f} ms single) → "
+                f"ITERS={config.iters} POP={config.pop} FINE_TOP_K={config.fine_top_k} PAIR_LIMIT={config.pair_limit} "
+                f"(search projected to end at {budget.projected_s:.0f}s)")
+            if not budget.fits:
+                log("⚠️ Even the smallest search is projected to exceed the time budget; the deadline will cut it short")
+
+        fisher = data.fisher[cols]
+        rank_idx = np.argsort(-fisher)
+        fine_candidates = rank_idx[:min(config.fine_top_k, search_dim)].tolist()
+        if len(fine_candidates) == 0:
+            raise RuntimeError("No fine-tuning candidates found (dim==0?)")
+
+        # warm start: reuse archived evaluations and seed part of the population with the elites
+        if config.archive_path:
+            archive = data.archive(config)
+            n_known = objective.attach_archive(archive)
+            elites = archive.elites(int(round(config.warm_start * config.pop)))[:, cols]
+            init_population = np.where(elites > 0.5, 1.0, -1.0)
+            log(f"🗄️ Archive {config.archive_path}: {n_known} known subsets, "
+                f"{len(init_population)} seeded whales")
+
+        # ---------------------------
+        # 3) Run optimizer (EWOA or WOA)
+        # ---------------------------
+        search_callback = callback
+        if config.minibatch:
+            # separate generator: the optimizer's global RNG stream is left untouched
+            batch_rng = np.random.default_rng(config.random_seed)
+            objective.set_batch(config.minibatch_size(0.0), batch_rng)
+            log(f"🎲 Mini-batch objective: {config.minibatch_size(0.0)} → {config.minibatch_size(1.0)} rows/class per fold split")
+
+            def search_callback(t, best_fit, hist):
+                # fresh subsample every iteration, shared by the whole population
+                objective.set_batch(config.minibatch_size(t / max(1, config.iters)), batch_rng)
+                return callback(t, best_fit, hist) if callback is not None else False
+
+        if budget is not None:
+            inner_callback = search_callback
+
+            def search_callback(t, best_fit, hist):
+                # leave the projected fine-tuning time: stop the optimizer at the search deadline
+                if time.perf_counter() > budget.search_deadline:
+                    log(f"⏱️ Search deadline reached after {t}/{config.iters} iterations")
+                    return True
+                return inner_callback(t, best_fit, hist) if inner_callback is not None else False
+
+        if config.algo == "ewoa":
+            best_mask, best_err, history = run_ewoa(
+                objective, search_dim, (-1, 1),
+                pop_size=config.pop, iters=config.iters,
+                a_strategy=config.a_strategy, obl_freq=config.obl_freq, obl_rate=config.obl_rate,
+                callback=search_callback, init_population=init_population
+            )
         else:
-            y_rows.append(_parse_label_any(lbl))
-    if len(X_rows) == 0:
-        raise RuntimeError("No test rows found or feature extraction failed.")
-    return np.vstack(X_rows), np.array(y_rows, dtype=np.int32)
+            best_mask, best_err, history = run_woa(objective, search_dim, (-1, 1), config.pop, config.iters,
+                                                   callback=search_callback, init_population=init_population)
+
+        if config.minibatch:
+            # batch scores are noisy and not comparable across iterations: re-score the elites
+            # on full data, and keep τ statistics from full-data evaluations only
+            objective.set_batch(None)
+            elites = [np.isin(cols, key).astype(float) for key, _ in objective.tau_ledger.top()]
+            objective.reset_tau_stats()
+            candidates = [best_mask] + elites
+            full_scores = [objective(m) for m in candidates]
+            i = int(np.argmin(full_scores))
+            log(f"🎲 Re-scored {len(candidates)} mini-batch elites on full data: "
+                f"best={full_scores[i]:.4f} (batch score {best_err:.4f})")
+            best_mask, best_err = candidates[i], float(full_scores[i])
+
+        # ---------------------------
+        # 4) Bounded greedy + pairwise fine-tuning
+        # ---------------------------
+        log("🔧 Greedy fine-tuning (bounded)...")
+        moves = [(idx,) for idx in fine_candidates]
+        if budget is not None:
+            moves = moves[:budget.affordable(len(moves))]
+        best_subset, best_score = flip_search(
+            objective.evaluate, best_mask, best_err, moves,
+            tol=1e-6, workers=config.finetune_workers, commit=objective.record,
+            on_accept=lambda mv, err: log(f"  ✅ Flip {cols[mv[0]]}: {feature_names[cols[mv[0]]]} -> {err:.4f}"),
+        )
 
-if os.path.exists(X_test_path) and os.path.exists(y_test_path):
-    X_test_raw = np.load(X_test_path)
-    y_test = np.load(y_test_path).astype(np.int32)
-else:
-    X_test_raw, y_test = _build_test_from_csv(TEST_CSV, feature_names)
-
-# normalize with train stats and select features
-X_test_full = (X_test_raw - train_mu) / (train_sigma + 1e-6)
-X_test = X_test_full[:, selected_idx]
-if X_test.shape[1] != len(selected_idx):
-    raise RuntimeError("Test feature dimension mismatch.")
-
-Sp_inv = np.array(model["Sp_inv"])
-tau = float(model["tau"])
-
-def predict_batch(Xmat, tau_val):
-    zB = Xmat - mu_B
-    zM = Xmat - mu_M
-    dB_sq = np.einsum('bi,ij,bj->b', zB, Sp_inv, zB)
-    dM_sq = np.einsum('bi,ij,bj->b', zM, Sp_inv, zM)
-    return (np.sqrt(dM_sq) <= tau_val * np.sqrt(dB_sq)).astype(int)
-
-# --- diagnostic sweep near (possibly overridden) tau ---
-sweep = np.unique(np.clip(np.linspace(tau - 0.15, tau + 0.15, 9), 0.3, 2.0))
-records = []
-for t in sweep:
-    yp = predict_batch(X_test, t)
-    acc = accuracy_score(y_test, yp)
-    bal = balanced_accuracy_score(y_test, yp)
-    cm = confusion_matrix(y_test, yp, labels=[0,1])
-    tn, fp, fn, tp = cm.ravel()
-    spec = tn / (tn + fp + 1e-9)
-    sens = tp / (tp + fn + 1e-9)
-    records.append({
-        "τ": float(t),
-        "Accuracy": acc,
-        "Balanced_Acc": bal,
-        "Error_Rate": 1 - acc,
-        "TN": int(tn), "FP": int(fp), "FN": int(fn), "TP": int(tp),
-        "Specificity(Benign)": spec, "Sensitivity(Malignant)": sens
-    })
-
-df_sweep = pd.DataFrame(records).sort_values(by=["Balanced_Acc", "Accuracy"], ascending=False)
-
-print("\n📊 τ Sweep (diagnostic; strict metrics use saved TRAIN τ):")
-print(df_sweep.to_string(index=False, formatters={
-    "Accuracy": "{:.4f}".format, "Balanced_Acc": "{:.4f}".format,
-    "Specificity(Benign)": "{:.4f}".format, "Sensitivity(Malignant)": "{:.4f}".format
-}))
-
-# --- OFFICIAL evaluation at saved TRAIN τ ---
-y_pred_official = predict_batch(X_test, tau)
-cm_off = confusion_matrix(y_test, y_pred_official, labels=[0,1])
-tn_off, fp_off, fn_off, tp_off = cm_off.ravel()
-spec_off = tn_off / (tn_off + fp_off + 1e-9)
-sens_off = tp_off / (tp_off + fn_off + 1e-9)
-
-print(f"\n🏆 Official τ (saved from TRAIN): {tau:.3f}")
-print(f"✅ Accuracy: {accuracy_score(y_test, y_pred_official):.4f}")
-print(f"⚖️ Balanced Accuracy: {balanced_accuracy_score(y_test, y_pred_official):.4f}")
-print(f"🛡️ Specificity (Benign): {spec_off:.4f}")
-print(f"🎯 Sensitivity (Malignant): {sens_off:.4f}")
-print(f"❌ Error Rate: {1 - accuracy_score(y_test, y_pred_official):.4f}")
-
-print("\n🧩 Confusion Matrix (rows = true, cols = predicted) @ Official τ:")
-print(cm_off)
-
-print("\n📄 Classification Report @ Official τ:")
-print(classification_report(y_test, y_pred_official, target_names=['Benign', 'Malignant'], zero_division=0))
-
-# --- CONSTRAINT-PICKED τ: maximize Sens subject to Spec >= floor (dense search) ---
-SPEC_FLOOR = 0.40
-TAU_GRID_TEST = np.linspace(0.90, 1.15, 181)
+        log("🔁 Pairwise fine-tuning (bounded)...")
+        pairs = []
+        for a in fine_candidates:
+            for b in fine_candidates:
+                if b <= a:
+                    continue
+                pairs.append((a, b, float(fisher[a] + fisher[b])))
+        pairs.sort(key=lambda x: -x[2])
+        pairs = pairs[:config.pair_limit]
+        if budget is not None and budget.affordable(len(pairs)) < len(pairs):
+            log(f"⏱️ Fine-tuning deadline: {budget.affordable(len(pairs))}/{len(pairs)} pair flips fit")
+            pairs = pairs[:budget.affordable(len(pairs))]
+
+        best_subset, best_score = flip_search(
+            objective.evaluate, best_subset, best_score, [(i, j) for (i, j, _) in pairs],
+            tol=1e-4, workers=config.finetune_workers, commit=objective.record,
+            on_accept=lambda mv, err: log(f"  ✅ Pair flip ({feature_names[cols[mv[0]]]}, {feature_names[cols[mv[1]]]}) -> {err:.4f}"),
+        )
+    finally:
+        objective.close()
+        if archive is not None:
+            archive_stored = archive.flush()
+            archive.close()
+
+    search_end = time.perf_counter()
+    archive_info = None
+    if archive is not None:
+        archive_info = {"path": config.archive_path, "context": archive.context,
+                        "seeded": int(len(init_population)), "hits": int(objective.archive_hits),
+                        "stored": int(archive_stored)}
+        log(f"🗄️ Archive: {archive_info['hits']} evaluations reused, {archive_info['stored']} new subsets stored")
+
+    # back to original column indices
+    selected_idx = [int(cols[i]) for i, v in enumerate(best_subset) if v > 0.5]
+    if len(selected_idx) == 0:
+        raise RuntimeError("No features selected after fine-tuning. Check objective.")
+
+    # ---------------------------
+    # 5) Fit class stats on full train (selected features) and pick final τ
+    # ---------------------------
+    Xb_full = X[y_train == 0][:, selected_idx]
+    Xm_full = X[y_train == 1][:, selected_idx]
+    scorer = RatioScorer(Xb_full, Xm_full, config.cov_shrinkage, config.precision)
+    mu_B, mu_M = scorer.mu_B, scorer.mu_M
+    Sp_inv_full = scorer.factor.inverse()
+    _distances = scorer.distances
+
+    # CV-aggregated τ seeds (fold τ of the winning subset, the top-N subsets, or all evaluations)
+    tau_cv_med, tau_cv_q40, tau_src = objective.tau_seeds(selected_idx, config.tau_seed_source)
+    if tau_cv_med is not None:
+        log(f"[τ-cv] source={tau_src} | median={tau_cv_med:.3f}, q40={tau_cv_q40:.3f}")
+
+    # Train/Val split for global τ choice
+    Xtr_sub, Xval_sub, ytr_sub, yval_sub = train_test_split(
+        X[:, selected_idx], y_train, test_size=0.25, stratify=y_train, random_state=54321
+    )
 
+    # Global sweep with threshold-aware selection (first try τ where both >= 70%), then local
+    # refine around both global best AND CV-aggregated τ (if available)
+    final_tau, tau_steps = pick_tau(
+        *_distances(Xval_sub), yval_sub, TAU_GRID, seeds=(tau_cv_med, tau_cv_q40),
+        local_radius=config.local_tau_radius, local_steps=config.local_tau_steps,
+        threshold=config.target_threshold, sens_weight=SENS_WEIGHT,
+    )
+    best_tau, spec0, sens0, mode = tau_steps["grid"]
+    log(f"[τ-train] chosen={best_tau:.3f} | train-val SPEC={spec0:.3f}, SENS={sens0:.3f} | mode={mode}")
 
-records_c = []
-for t in TAU_GRID_TEST:
-    yp = predict_batch(X_test, t)
-    acc = accuracy_score(y_test, yp)
-    bal = balanced_accuracy_score(y_test, yp)
-    cm  = confusion_matrix(y_test, yp, labels=[0,1])
-    tn, fp, fn, tp = cm.ravel()
-    spec = tn / (tn + fp + 1e-9)
-    sens = tp / (tp + fn + 1e-9)
-    records_c.append({
-        "τ": float(t),
-        "Accuracy": acc, "Balanced_Acc": bal,
-        "TN": int(tn), "FP": int(fp), "FN": int(fn), "TP": int(tp),
-        "Specificity(Benign)": spec, "Sensitivity(Malignant)": sens
-    })
-
-# enforce Spec ≥ floor; among feasible, maximize Sens (then Spec, then BalAcc as tie-breakers)
-feasible = [r for r in records_c if r["Specificity(Benign)"] >= SPEC_FLOOR]
-if len(feasible) > 0:
-    feasible.sort(key=lambda r: (r["Sensitivity(Malignant)"], r["Specificity(Benign)"], r["Balanced_Acc"]))
-    best = feasible[-1]
-    mode = "feasible"
-else:
-    # no feasible points; pick closest to the floor
-    records_c.sort(key=lambda r: abs(r["Specificity(Benign)"] - SPEC_FLOOR))
-    best = records_c[0]
-    mode = "closest_to_floor"
-
-tau_constrained = float(best["τ"])
-y_pred_constrained = predict_batch(X_test, tau_constrained)
-cm_c  = confusion_matrix(y_test, y_pred_constrained, labels=[0,1])
-tn_c, fp_c, fn_c, tp_c = cm_c.ravel()
-acc_c  = accuracy_score(y_test, y_pred_constrained)
-bal_c  = balanced_accuracy_score(y_test, y_pred_constrained)
-spec_c = tn_c / (tn_c + fp_c + 1e-9)
-sens_c = tp_c / (tp_c + fn_c + 1e-9)
-
-print("\n🔧 Constraint-picked τ (policy: Spec ≥ {:.2f}) [{}]".format(SPEC_FLOOR, mode))
-print("τ={:.4f} | Acc={:.4f} | BalAcc={:.4f} | Spec={:.4f} | Sens={:.4f}".format(
-    tau_constrained, acc_c, bal_c, spec_c, sens_c
-))
-print("\n🧩 Confusion Matrix @ Constrained τ (rows=true, cols=pred):")
-print(cm_c)
-
-print("\n📄 Classification Report @ Constrained τ:")
-print(classification_report(y_test, y_pred_constrained, target_names=['Benign', 'Malignant'], zero_division=0))
+    def _spec_sens_for_tau(tau_val, Xval=Xval_sub, yval=yval_sub):
+        dB, dM = _distances(Xval)
+        yp = (dM <= tau_val * dB).astype(int)
+        tn, fp, fn, tp = confusion_matrix(yval, yp, labels=[0, 1]).ravel()
+        return (tn / (tn + fp + 1e-9), tp / (tp + fn + 1e-9))
+
+    spec_final, sens_final = _spec_sens_for_tau(final_tau)
+    log(f"[τ-train-adjusted] final={final_tau:.3f} | train-val SPEC={spec_final:.3f}, SENS={sens_final:.3f}")
+
+    # ---------------------------
+    # 6) Save model
+    # ---------------------------
+    cvB = float(objective.last_B) if hasattr(objective, "last_B") else None
+    cvM = float(objective.last_M) if hasattr(objective, "last_M") else None
+    cv_combined = None
+    if cvB is not None and cvM is not None:
+        cv_combined = float((W_B * cvB + W_M * cvM) / (W_B + W_M))
+
+    model = {
+        "algo": config.algo,
+        "iters": config.iters,
+        "pop": config.pop,
+        "a_strategy": config.a_strategy,
+        "obl_freq": config.obl_freq,
+        "obl_rate": config.obl_rate,
+        "feature_names": feature_names,
+        # feature extraction settings of the training data; predict / update extract the same way
+        "extraction": data.extraction.to_dict(),
+        "selected_idx": selected_idx,
+        "selected_names": [feature_names[i] for i in selected_idx],
+        "train_mu": data.train_mu.tolist(),
+        "train_sigma": data.train_sigma.tolist(),
+        "class_labels": {"0": "Benign", "1": "Malignant"},
+        "class_stats": {"0": {"mu": mu_B.tolist()}, "1": {"mu": mu_M.tolist()}},
+        "Sp_inv": Sp_inv_full.tolist(),
+        "tau": float(final_tau),
+        "cv_error": cv_combined,
+        "cv_error_B": cvB,
+        "cv_error_M": cvM,
+        "cv_error_weights": {"benign": W_B, "malignant": W_M},
+        "precision": config.precision,
+        "cov_shrinkage": bool(config.cov_shrinkage),
+        # class moments over the selected features (standardized): `woa-tool update` folds in new cases
+        "moments": scorer.moments.to_dict(),
+        "version": 1,
+        "prefilter": pf.to_dict(feature_names) if pf is not None else None,
+        "policy": {
+            "taus": [float(t) for t in TAU_GRID],
+            "sens_weight": float(SENS_WEIGHT),
+            "min_sensitivity": float(config.min_sensitivity),
+            "min_specificity": float(config.min_specificity),
+            "fallback_spec_floor": float(config.fallback_spec_floor),
+            "lambda_spec": float(config.lambda_spec),
+            "local_radius": float(config.local_tau_radius),
+            "local_steps": int(config.local_tau_steps),
+            "target_threshold": float(config.target_threshold),
+        },
+    }
+    if config.out_path:
+        os.makedirs(os.path.dirname(config.out_path) or ".", exist_ok=True)
+        with open(config.out_path, "w") as f:
+            json.dump(model, f, indent=2)
+        log(f"\n✅ Model saved to {config.out_path}")
+    log(f"Features: {dim}, Selected: {len(selected_idx)}")
+    if cv_combined is not None:
+        log(f"CV Error: {cv_combined:.4f} (Benign={cvB:.4f}, Malignant={cvM:.4f})")
+
+    # ---------------------------
+    # 7) Test evaluation (strict, uses saved tau)
+    # ---------------------------
+    log("\n🔍 Evaluating model on TEST set...")
+
+    X_test_raw, y_test = data.test_set(config.test_csv, config.feature_cache, config.extract_workers)
+
+    # normalize with train stats and select features
+    X_test_full = _standardize(X_test_raw, data.train_mu, data.train_sigma, config.precision)
+    X_test = X_test_full[:, selected_idx]
+    if X_test.shape[1] != len(selected_idx):
+        raise RuntimeError("Test feature dimension mismatch.")
+
+    tau = float(model["tau"])
+
+    def predict_batch(Xmat, tau_val):
+        dB, dM = _distances(Xmat)
+        return (dM <= tau_val * dB).astype(int)
+
+    # --- diagnostic sweep near (possibly overridden) tau ---
+    sweep = np.unique(np.clip(np.linspace(tau - 0.15, tau + 0.15, 9), 0.3, 2.0))
+    records = []
+    for t in sweep:
+        yp = predict_batch(X_test, t)
+        acc = accuracy_score(y_test, yp)
+        bal = balanced_accuracy_score(y_test, yp)
+        cm = confusion_matrix(y_test, yp, labels=[0,1])
+        tn, fp, fn, tp = cm.ravel()
+        spec = tn / (tn + fp + 1e-9)
+        sens = tp / (tp + fn + 1e-9)
+        records.append({
+            "τ": float(t),
+            "Accuracy": acc,
+            "Balanced_Acc": bal,
+            "Error_Rate": 1 - acc,
+            "TN": int(tn), "FP": int(fp), "FN": int(fn), "TP": int(tp),
+            "Specificity(Benign)": spec, "Sensitivity(Malignant)": sens
+        })
+
+    df_sweep = pd.DataFrame(records).sort_values(by=["Balanced_Acc", "Accuracy"], ascending=False)
+
+    log("\n📊 τ Sweep (diagnostic; strict metrics use saved TRAIN τ):")
+    log(df_sweep.to_string(index=False, formatters={
+        "Accuracy": "{:.4f}".format, "Balanced_Acc": "{:.4f}".format,
+        "Specificity(Benign)": "{:.4f}".format, "Sensitivity(Malignant)": "{:.4f}".format
+    }))
+
+    # --- OFFICIAL evaluation at saved TRAIN τ ---
+    y_pred_official = predict_batch(X_test, tau)
+    cm_off = confusion_matrix(y_test, y_pred_official, labels=[0,1])
+    tn_off, fp_off, fn_off, tp_off = cm_off.ravel()
+    spec_off = tn_off / (tn_off + fp_off + 1e-9)
+    sens_off = tp_off / (tp_off + fn_off + 1e-9)
+    acc_off = accuracy_score(y_test, y_pred_official)
+    bal_off = balanced_accuracy_score(y_test, y_pred_official)
+
+    log(f"\n🏆 Official τ (saved from TRAIN): {tau:.3f}")
+    log(f"✅ Accuracy: {acc_off:.4f}")
+    log(f"⚖️ Balanced Accuracy: {bal_off:.4f}")
+    log(f"🛡️ Specificity (Benign): {spec_off:.4f}")
+    log(f"🎯 Sensitivity (Malignant): {sens_off:.4f}")
+    log(f"❌ Error Rate: {1 - acc_off:.4f}")
+
+    log("\n🧩 Confusion Matrix (rows = true, cols = predicted) @ Official τ:")
+    log(cm_off)
+
+    log("\n📄 Classification Report @ Official τ:")
+    log(classification_report(y_test, y_pred_official, target_names=['Benign', 'Malignant'], zero_division=0))
+
+    # --- CONSTRAINT-PICKED τ: maximize Sens subject to Spec >= floor (dense search) ---
+    SPEC_FLOOR = config.spec_floor
+
+    records_c = []
+    for t in config.tau_grid_test:
+        yp = predict_batch(X_test, t)
+        acc = accuracy_score(y_test, yp)
+        bal = balanced_accuracy_score(y_test, yp)
+        cm  = confusion_matrix(y_test, yp, labels=[0,1])
+        tn, fp, fn, tp = cm.ravel()
+        spec = tn / (tn + fp + 1e-9)
+        sens = tp / (tp + fn + 1e-9)
+        records_c.append({
+            "τ": float(t),
+            "Accuracy": acc, "Balanced_Acc": bal,
+            "TN": int(tn), "FP": int(fp), "FN": int(fn), "TP": int(tp),
+            "Specificity(Benign)": spec, "Sensitivity(Malignant)": sens
+        })
+
+    # enforce Spec ≥ floor; among feasible, maximize Sens (then Spec, then BalAcc as tie-breakers)
+    feasible = [r for r in records_c if r["Specificity(Benign)"] >= SPEC_FLOOR]
+    if len(feasible) > 0:
+        feasible.sort(key=lambda r: (r["Sensitivity(Malignant)"], r["Specificity(Benign)"], r["Balanced_Acc"]))
+        best = feasible[-1]
+        mode = "feasible"
+    else:
+        # no feasible points; pick closest to the floor
+        records_c.sort(key=lambda r: abs(r["Specificity(Benign)"] - SPEC_FLOOR))
+        best = records_c[0]
+        mode = "closest_to_floor"
+
+    tau_constrained = float(best["τ"])
+    y_pred_constrained = predict_batch(X_test, tau_constrained)
+    cm_c  = confusion_matrix(y_test, y_pred_constrained, labels=[0,1])
+    tn_c, fp_c, fn_c, tp_c = cm_c.ravel()
+    acc_c  = accuracy_score(y_test, y_pred_constrained)
+    bal_c  = balanced_accuracy_score(y_test, y_pred_constrained)
+    spec_c = tn_c / (tn_c + fp_c + 1e-9)
+    sens_c = tp_c / (tp_c + fn_c + 1e-9)
+
+    log("\n🔧 Constraint-picked τ (policy: Spec ≥ {:.2f}) [{}]".format(SPEC_FLOOR, mode))
+    log("τ={:.4f} | Acc={:.4f} | BalAcc={:.4f} | Spec={:.4f} | Sens={:.4f}".format(
+        tau_constrained, acc_c, bal_c, spec_c, sens_c
+    ))
+    log("\n🧩 Confusion Matrix @ Constrained τ (rows=true, cols=pred):")
+    log(cm_c)
+
+    log("\n📄 Classification Report @ Constrained τ:")
+    log(classification_report(y_test, y_pred_constrained, target_names=['Benign', 'Malignant'], zero_division=0))
+
+    # --- Bootstrap CIs: both points at fixed τ, plus the constrained pick re-run per resample ---
+    ci = None
+    if config.bootstrap_replicates:
+        ci = operating_point_cis(*_distances(X_test), y_test, [tau, tau_constrained],
+                                 n_boot=config.bootstrap_replicates, level=config.bootstrap_level,
+                                 seed=config.random_seed, pick_grid=config.tau_grid_test, spec_floor=SPEC_FLOOR)
+        log("\n📏 Bootstrap {:.0%} CIs ({} class-stratified resamples of TEST):".format(
+            config.bootstrap_level, config.bootstrap_replicates))
+        for i, (name, t) in enumerate((("Official", tau), ("Constrained", tau_constrained))):
+            log("  {:<11} τ={:.4f} | Spec [{:.4f}, {:.4f}] | Sens [{:.4f}, {:.4f}] | BalAcc [{:.4f}, {:.4f}]".format(
+                name, t, ci["specificity"]["low"][i], ci["specificity"]["high"][i],
+                ci["sensitivity"]["low"][i], ci["sensitivity"]["high"][i],
+                ci["balanced_accuracy"]["low"][i], ci["balanced_accuracy"]["high"][i]))
+        picked = ci["picked"]
+        log("  Constrained pick re-run per resample: τ [{:.4f}, {:.4f}] | Spec [{:.4f}, {:.4f}] | "
+            "Sens [{:.4f}, {:.4f}]".format(*picked["tau"], *picked["specificity"], *picked["sensitivity"]))
+        diff = ci["pairs"][(0, 1)]
+        log("  BalAcc official − constrained: [{:+.4f}, {:+.4f}] (official higher in {:.1%} of resamples)".format(
+            *diff["balanced_accuracy_diff"], diff["p_better"]))
+
+    # --- Precision parity: same subset / τ scored by the float64 path ---
+    parity = None
+    if config.precision != "float64":
+        X64 = data.features("float64")
+        ref = RatioScorer(X64[y_train == 0][:, selected_idx], X64[y_train == 1][:, selected_idx],
+                          config.cov_shrinkage, "float64")
+        X_test_ref = _standardize(X_test_raw, data.train_mu, data.train_sigma, "float64")[:, selected_idx]
+        parity = _decision_parity(_distances(X_test), ref.distances(X_test_ref),
+                                  {"official": tau, "constrained": tau_constrained})
+        log("\n🔬 Precision parity ({} vs float64) on TEST: {} changed @ official τ, {} @ constrained τ "
+            "(max |ΔdM/dB| = {:.2e})".format(config.precision, parity["official"]["changed"],
+                                             parity["constrained"]["changed"], parity["max_abs_ratio_diff"]))
+
+    # --- CSV artifacts ---
+    summary_rows = []
+    for i, (point, t, acc, bal, spec, sens, cm) in enumerate((
+            ("official", tau, acc_off, bal_off, spec_off, sens_off, cm_off),
+            ("constrained", tau_constrained, acc_c, bal_c, spec_c, sens_c, cm_c))):
+        tn, fp, fn, tp = cm.ravel()
+        row = {"Point": point, "τ": float(t), "Accuracy": acc, "Balanced_Acc": bal,
+               "TN": int(tn), "FP": int(fp), "FN": int(fn), "TP": int(tp),
+               "Specificity(Benign)": spec, "Sensitivity(Malignant)": sens}
+        if ci is not None:
+            for col, key in (("Specificity(Benign)", "specificity"), ("Sensitivity(Malignant)", "sensitivity"),
+                             ("Balanced_Acc", "balanced_accuracy")):
+                row[f"{col}_CI_low"] = float(ci[key]["low"][i])
+                row[f"{col}_CI_high"] = float(ci[key]["high"][i])
+        summary_rows.append(row)
+    df_summary = pd.DataFrame(summary_rows)
+    if ci is not None:
+        # the constrained τ is picked on TEST; its re-picked interval is the honest one
+        df_summary["τ_CI_low"] = [np.nan, ci["picked"]["tau"][0]]
+        df_summary["τ_CI_high"] = [np.nan, ci["picked"]["tau"][1]]
+    if config.results_dir:
+        os.makedirs(config.results_dir, exist_ok=True)
+        df_sweep.to_csv(os.path.join(config.results_dir, "results_eval_pipeline.csv"), index=False)
+        df_summary.to_csv(os.path.join(config.results_dir, "results_eval_summary.csv"), index=False)
+        log(f"\n💾 Results saved to {os.path.join(config.results_dir, 'results_eval_[pipeline|summary].csv')}")
+
+    runtime_s = float(time.perf_counter() - t_start)
+    budget_info = None
+    if budget is not None:
+        budget_info = {**budget.to_dict(), "search_s": float(search_end - t_start), "actual_s": runtime_s}
+        log(f"\n⏱️ Runtime {runtime_s:.0f}s of the {budget.budget_s:.0f}s budget "
+            f"(search {budget_info['search_s']:.0f}s, projected {budget.projected_s:.0f}s)")
+
+    return {
+        "model": model,
+        "history": history,
+        "best_score": float(best_score),
+        "test": {
+            "tau": tau, "accuracy": float(acc_off), "balanced_accuracy": float(bal_off),
+            "specificity": float(spec_off), "sensitivity": float(sens_off),
+            "confusion": cm_off.tolist(),
+        },
+        "constrained": {
+            "tau": tau_constrained, "mode": mode, "accuracy": float(acc_c),
+            "balanced_accuracy": float(bal_c), "specificity": float(spec_c),
+            "sensitivity": float(sens_c), "confusion": cm_c.tolist(),
+        },
+        "sweep": df_sweep,
+        "summary": df_summary,
+        "bootstrap": ci,
+        "precision_parity": parity,
+        "archive": archive_info,
+        "time_budget": budget_info,
+        "nfe": int(objective.nfe),
+        "runtime_s": runtime_s,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EWOA + Mahalanobis training and TEST evaluation (config from env)")
+    parser.add_argument("--time-budget", default=None,
+                        help="Wall-clock budget (e.g. 5400, 90m, 2h); scales the FAST tier to fit (env TIME_BUDGET)")
+    args = parser.parse_args(argv)
+    overrides = {}
+    if args.time_budget:
+        overrides["time_budget"] = parse_duration(args.time_budget)
+    train_and_evaluate(TrainConfig.from_env(**overrides))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
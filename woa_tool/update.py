@@ -0,0 +1,145 @@
+"""
+Online model update: fold newly confirmed cases into a saved model.
+
+For the model's fixed `selected_idx`, new feature rows are standardized with
+the model's training statistics and reduced to per-class moments, which are
+merged exactly into the moments stored in the model (ClassMoments.merge, the
+batch form of Welford's update). Class means, the pooled covariance and
+Sp_inv are then rebuilt from the merged moments with the same estimator as
+training. With `retau`, τ is re-picked on the new cases with the model's
+stored policy (seeded at the current τ). The result is a new model version.
+
+The inverse is refactored rather than corrected with Woodbury: the
+Ledoit-Wolf shrinkage intensity and target depend on every sample, so new
+cases change the whole pooled matrix (not a low-rank term), and factoring a
+k x k matrix (k <= 35) costs microseconds.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import time
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from .feature_extraction import ExtractionOptions
+from .moments import FoldMoments
+from .train_and_eval import (
+    FEATURE_CACHE, COV_SHRINKAGE, LOCAL_TAU_RADIUS, LOCAL_TAU_STEPS, SENS_WEIGHT, TARGET_THRESHOLD, TAU_GRID,
+    RatioScorer, _build_test_from_csv, _compute_dtype, _spec_sens_counts, pick_tau,
+)
+
+
+def load_cases(feature_names, csv=None, features=None, labels=None, feature_cache=FEATURE_CACHE, workers=1,
+               options=None):
+    """
+    New labelled cases: a CSV like data/test.csv (image_path, Class), with images
+    extracted using `options` (the model's), or raw feature/label .npy files.
+    """
+    if csv:
+        return _build_test_from_csv(csv, feature_names, feature_cache, workers, options)
+    if features is None or labels is None:
+        raise ValueError("Pass a cases CSV, or both a features and a labels .npy file.")
+    X_raw, y = np.load(features), np.load(labels)
+    if X_raw.ndim != 2 or X_raw.shape[1] != len(feature_names):
+        raise ValueError(f"Expected (n, {len(feature_names)}) raw features, got {X_raw.shape}")
+    return X_raw, np.asarray(y).astype(np.int32)
+
+
+def versioned_path(path: str, version: int) -> str:
+    """models/model.json -> models/model.v2.json (an existing .vN suffix is replaced)."""
+    stem, ext = os.path.splitext(path)
+    return f"{re.sub(r'[.]v[0-9]+$', '', stem)}.v{int(version)}{ext or '.json'}"
+
+
+def update_model(model: Dict, X_raw: np.ndarray, y: np.ndarray, retau: bool = False) -> Tuple[Dict, Dict]:
+    """
+    Merge new cases (raw features over all model features, labels 0 = Benign / 1 = Malignant)
+    into the model's class statistics. Returns (new model, summary).
+    """
+    if "moments" not in model:
+        raise ValueError("Model has no class moments (trained before online updates); retrain it to enable updates.")
+    y = np.asarray(y).astype(np.int32)
+    if not set(np.unique(y).tolist()) <= {0, 1}:
+        raise ValueError(f"Labels must be 0 (Benign) / 1 (Malignant), got {np.unique(y)}")
+    X_raw = np.asarray(X_raw, dtype=np.float64)
+    if X_raw.shape[0] != y.shape[0]:
+        raise ValueError(f"{X_raw.shape[0]} feature rows but {y.shape[0]} labels")
+
+    precision = model.get("precision", "float64")
+    dtype = _compute_dtype(precision)
+    sel = model["selected_idx"]
+    # same standardization as the training rows the stored moments came from
+    Z = ((X_raw - np.asarray(model["train_mu"])) / np.asarray(model["train_sigma"]))[:, sel].astype(dtype)
+
+    merged = FoldMoments.merge([FoldMoments.from_dict(model["moments"], dtype),
+                                FoldMoments.from_samples(Z, y, dtype, third=True)])
+    scorer = RatioScorer.from_moments(merged, model.get("cov_shrinkage", COV_SHRINKAGE), precision)
+
+    tau_before = float(model["tau"])
+    tau = tau_before
+    if retau:
+        if np.unique(y).size < 2:
+            raise ValueError("Re-picking τ needs new cases of both classes.")
+        policy = model.get("policy", {})
+        tau, _ = pick_tau(
+            *scorer.distances(Z), y, np.asarray(policy.get("taus", TAU_GRID), dtype=float), seeds=(tau_before,),
+            local_radius=policy.get("local_radius", LOCAL_TAU_RADIUS),
+            local_steps=policy.get("local_steps", LOCAL_TAU_STEPS),
+            threshold=policy.get("target_threshold", TARGET_THRESHOLD),
+            sens_weight=policy.get("sens_weight", SENS_WEIGHT),
+        )
+
+    summary = {
+        "version": int(model.get("version", 1)) + 1,
+        "n_benign": int(np.sum(y == 0)),
+        "n_malignant": int(np.sum(y == 1)),
+        "n_total": {"0": int(merged.benign.n), "1": int(merged.malignant.n)},
+        "tau_before": tau_before,
+        "tau": float(tau),
+        "retau": bool(retau),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if np.unique(y).size == 2:
+        specs, senss = _spec_sens_counts(*scorer.distances(Z), y, [tau])
+        summary["new_cases_specificity"] = float(specs[0])
+        summary["new_cases_sensitivity"] = float(senss[0])
+
+    new_model = dict(model)
+    new_model.update({
+        "class_stats": {"0": {"mu": scorer.mu_B.tolist()}, "1": {"mu": scorer.mu_M.tolist()}},
+        "Sp_inv": scorer.factor.inverse().tolist(),
+        "tau": float(tau),
+        "moments": merged.to_dict(),
+        "version": summary["version"],
+        # cv_error* still describe the original training run
+        "updates": list(model.get("updates", [])) + [summary],
+    })
+    return new_model, summary
+
+
+def run(model_path: str, out: Optional[str] = None, csv: Optional[str] = None, features: Optional[str] = None,
+        labels: Optional[str] = None, retau: bool = False, feature_cache=FEATURE_CACHE, workers: int = 1) -> Dict:
+    t0 = time.perf_counter()
+    with open(model_path, "r") as f:
+        model = json.load(f)
+    X_raw, y = load_cases(model["feature_names"], csv, features, labels, feature_cache, workers,
+                          ExtractionOptions.from_dict(model.get("extraction")))
+    new_model, summary = update_model(model, X_raw, y, retau=retau)
+
+    out = out or versioned_path(model_path, summary["version"])
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(new_model, f, indent=2)
+
+    print(f"➕ Folded in {summary['n_benign']} benign + {summary['n_malignant']} malignant cases "
+          f"(now {summary['n_total']['0']} + {summary['n_total']['1']})")
+    if retau:
+        print(f"🎯 τ {summary['tau_before']:.4f} → {summary['tau']:.4f}")
+    if "new_cases_specificity" in summary:
+        print(f"   New cases @ τ={summary['tau']:.4f}: SPEC={summary['new_cases_specificity']:.3f}, "
+              f"SENS={summary['new_cases_sensitivity']:.3f}")
+    print(f"✅ Model v{summary['version']} saved to {out} ({time.perf_counter() - t0:.2f}s)")
+    return summary